@@ -0,0 +1,47 @@
+"""Add messages keyset indexes
+
+Revision ID: a4c7e2b9f5d8
+Revises: f3b8d6a1c9e4
+Create Date: 2026-10-17 23:00:00.000000
+
+Indexes are built CONCURRENTLY outside a transaction, so writes to messages
+are not blocked. If a concurrent build fails it leaves an INVALID index:
+drop it and run the migration again.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c7e2b9f5d8'
+down_revision = 'f3b8d6a1c9e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create indexes for keyset pagination by (created_at, message_id)
+    # CONCURRENTLY: messages is written continuously by the bot, a plain CREATE INDEX blocks writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_messages_created_id', 'messages', ['created_at', 'message_id'], unique=False,
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'idx_messages_chat_created_id', 'messages', ['chat_id', 'created_at', 'message_id'], unique=False,
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'idx_messages_sender_created_id', 'messages',
+            ['sender_id', 'sender_type', 'created_at', 'message_id'], unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    # Drop indexes
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_messages_sender_created_id', table_name='messages', postgresql_concurrently=True)
+        op.drop_index('idx_messages_chat_created_id', table_name='messages', postgresql_concurrently=True)
+        op.drop_index('idx_messages_created_id', table_name='messages', postgresql_concurrently=True)
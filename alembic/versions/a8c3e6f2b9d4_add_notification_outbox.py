@@ -0,0 +1,52 @@
+"""Add notification outbox
+
+Revision ID: a8c3e6f2b9d4
+Revises: f4b1d8e3a5c7
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c3e6f2b9d4'
+down_revision = 'f4b1d8e3a5c7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create notification_outbox table
+    op.create_table(
+        'notification_outbox',
+        sa.Column('outbox_id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('student_id', sa.BigInteger(), nullable=False),
+        sa.Column('stream_id', sa.BigInteger(), nullable=True),
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('notification_type', sa.String(length=50), nullable=False),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['student_id'], ['students.student_id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['stream_id'], ['streams.stream_id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('outbox_id')
+    )
+    
+    # Create indexes
+    op.create_index(op.f('ix_notification_outbox_outbox_id'), 'notification_outbox', ['outbox_id'], unique=False)
+    op.create_index('idx_notification_outbox_due', 'notification_outbox', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade() -> None:
+    # Drop indexes
+    op.drop_index('idx_notification_outbox_due', table_name='notification_outbox')
+    op.drop_index(op.f('ix_notification_outbox_outbox_id'), table_name='notification_outbox')
+    
+    # Drop table
+    op.drop_table('notification_outbox')
@@ -0,0 +1,52 @@
+"""Add student weekly facts
+
+Revision ID: b7e4f2a91c3d
+Revises: 9c997ec8d589, a1b2c3d4e5f6
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4f2a91c3d'
+down_revision = ('9c997ec8d589', 'a1b2c3d4e5f6')
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create student_weekly_facts table
+    op.create_table(
+        'student_weekly_facts',
+        sa.Column('student_id', sa.BigInteger(), nullable=False),
+        sa.Column('iso_year', sa.Integer(), nullable=False),
+        sa.Column('iso_week', sa.Integer(), nullable=False),
+        sa.Column('week_start', sa.Date(), nullable=False),
+        sa.Column('week_end', sa.Date(), nullable=False),
+        sa.Column('assignments_total', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('assignments_completed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('assignments_on_time', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('assignments_late', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('average_grade', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('messages_sent', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('questions_asked', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_activity', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('scheduled_classes', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('attended', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('refreshed_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['student_id'], ['students.student_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('student_id', 'iso_year', 'iso_week')
+    )
+    
+    # Create index for week lookups
+    op.create_index('idx_student_weekly_facts_week', 'student_weekly_facts', ['iso_year', 'iso_week'], unique=False)
+
+
+def downgrade() -> None:
+    # Drop index
+    op.drop_index('idx_student_weekly_facts_week', table_name='student_weekly_facts')
+    
+    # Drop table
+    op.drop_table('student_weekly_facts')
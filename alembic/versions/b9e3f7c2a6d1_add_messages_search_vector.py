@@ -0,0 +1,55 @@
+"""Add messages search vector
+
+Revision ID: b9e3f7c2a6d1
+Revises: a4c7e2b9f5d8
+Create Date: 2026-10-18 00:00:00.000000
+
+Rewrite cost: adding a STORED generated column rewrites the whole messages
+table (every row gets its tsvector computed) under an ACCESS EXCLUSIVE lock.
+Reads and writes to messages wait for the rewrite, which is proportional to
+table size - run this migration in a maintenance window on large databases.
+
+The GIN index is built CONCURRENTLY outside a transaction, so writes are not
+blocked while it builds. If the build fails it leaves an INVALID index: drop
+it and run the migration again.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e3f7c2a6d1'
+down_revision = 'a4c7e2b9f5d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Add generated tsvector column (russian configuration)
+    op.add_column(
+        'messages',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('russian'::regconfig, coalesce(text_content, ''))", persisted=True),
+            nullable=True
+        )
+    )
+    
+    # Create GIN index (CONCURRENTLY: does not block writes to messages)
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_messages_search_vector', 'messages', ['search_vector'], unique=False,
+            postgresql_using='gin', postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    # Drop index
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_messages_search_vector', table_name='messages', postgresql_concurrently=True)
+    
+    # Drop column
+    op.drop_column('messages', 'search_vector')
@@ -0,0 +1,52 @@
+"""Add trigram search indexes
+
+Revision ID: c2f8a5d7e1b3
+Revises: b9e3f7c2a6d1
+Create Date: 2026-10-18 00:00:00.000000
+
+Indexes are built CONCURRENTLY outside a transaction, so writes are not
+blocked. If a concurrent build fails it leaves an INVALID index: drop it
+and run the migration again.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f8a5d7e1b3'
+down_revision = 'b9e3f7c2a6d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create pg_trgm extension
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    
+    # Create trigram indexes (CONCURRENTLY: does not block writes, messages is written by the bot)
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_course_materials_title_trgm', 'course_materials', ['title'], unique=False,
+            postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}, postgresql_concurrently=True
+        )
+        op.create_index(
+            'idx_course_materials_content_trgm', 'course_materials', ['content'], unique=False,
+            postgresql_using='gin', postgresql_ops={'content': 'gin_trgm_ops'}, postgresql_concurrently=True
+        )
+        op.create_index(
+            'idx_messages_text_content_trgm', 'messages', ['text_content'], unique=False,
+            postgresql_using='gin', postgresql_ops={'text_content': 'gin_trgm_ops'}, postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    # Drop trigram indexes (extension is left in place: it may be used elsewhere)
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_messages_text_content_trgm', table_name='messages', postgresql_concurrently=True)
+        op.drop_index(
+            'idx_course_materials_content_trgm', table_name='course_materials', postgresql_concurrently=True
+        )
+        op.drop_index(
+            'idx_course_materials_title_trgm', table_name='course_materials', postgresql_concurrently=True
+        )
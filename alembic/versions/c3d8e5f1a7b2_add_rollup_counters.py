@@ -0,0 +1,59 @@
+"""Add rollup counters
+
+Revision ID: c3d8e5f1a7b2
+Revises: b7e4f2a91c3d
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d8e5f1a7b2'
+down_revision = 'b7e4f2a91c3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create student_daily_counters table
+    op.create_table(
+        'student_daily_counters',
+        sa.Column('student_id', sa.BigInteger(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('messages_sent', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('questions_asked', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_activity', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('assignments_total', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('assignments_completed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('assignments_on_time', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('assignments_late', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('grade_sum', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('grade_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('student_id', 'day')
+    )
+    
+    # Create chat_counters table
+    op.create_table(
+        'chat_counters',
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('total_messages', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('user_messages', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('bot_messages', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('active_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_activity', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('chat_id')
+    )
+    
+    # Index for "is this sender new in the chat" lookups
+    op.create_index('idx_messages_chat_sender', 'messages', ['chat_id', 'sender_id'], unique=False)
+
+
+def downgrade() -> None:
+    # Drop index
+    op.drop_index('idx_messages_chat_sender', table_name='messages')
+    
+    # Drop tables
+    op.drop_table('chat_counters')
+    op.drop_table('student_daily_counters')
@@ -0,0 +1,39 @@
+"""Add scheduled runs
+
+Revision ID: c6e9a4d2f8b1
+Revises: b5d2f9a7c1e8
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6e9a4d2f8b1'
+down_revision = 'b5d2f9a7c1e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create scheduled_runs table
+    op.create_table(
+        'scheduled_runs',
+        sa.Column('stream_id', sa.BigInteger(), nullable=False),
+        sa.Column('fire_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='running'),
+        sa.Column('worker_id', sa.String(length=100), nullable=False),
+        sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('queued_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['stream_id'], ['streams.stream_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('stream_id', 'fire_at')
+    )
+
+
+def downgrade() -> None:
+    # Drop table
+    op.drop_table('scheduled_runs')
@@ -0,0 +1,47 @@
+"""Add dry run audits
+
+Revision ID: d1f5b8c3e7a2
+Revises: c6e9a4d2f8b1
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1f5b8c3e7a2'
+down_revision = 'c6e9a4d2f8b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create dry_run_audits table
+    op.create_table(
+        'dry_run_audits',
+        sa.Column('audit_id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('stream_id', sa.BigInteger(), nullable=False),
+        sa.Column('week_start', sa.Date(), nullable=False),
+        sa.Column('week_end', sa.Date(), nullable=False),
+        sa.Column('stages', sa.JSON(), nullable=False),
+        sa.Column('total_ms', sa.Float(), nullable=False),
+        sa.Column('total_queries', sa.Integer(), nullable=False),
+        sa.Column('recipients_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['stream_id'], ['streams.stream_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('audit_id')
+    )
+    
+    # Create indexes
+    op.create_index(op.f('ix_dry_run_audits_audit_id'), 'dry_run_audits', ['audit_id'], unique=False)
+    op.create_index('idx_dry_run_audits_stream_created', 'dry_run_audits', ['stream_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    # Drop indexes
+    op.drop_index('idx_dry_run_audits_stream_created', table_name='dry_run_audits')
+    op.drop_index(op.f('ix_dry_run_audits_audit_id'), table_name='dry_run_audits')
+    
+    # Drop table
+    op.drop_table('dry_run_audits')
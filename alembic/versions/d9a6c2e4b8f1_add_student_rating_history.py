@@ -0,0 +1,46 @@
+"""Add student rating history
+
+Revision ID: d9a6c2e4b8f1
+Revises: c3d8e5f1a7b2
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a6c2e4b8f1'
+down_revision = 'c3d8e5f1a7b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create student_rating_history table
+    op.create_table(
+        'student_rating_history',
+        sa.Column('student_id', sa.BigInteger(), nullable=False),
+        sa.Column('week_start', sa.Date(), nullable=False),
+        sa.Column('week_end', sa.Date(), nullable=False),
+        sa.Column('weekly_score', sa.Float(), nullable=False),
+        sa.Column('assignment_score', sa.Float(), nullable=False),
+        sa.Column('activity_score', sa.Float(), nullable=False),
+        sa.Column('attendance_score', sa.Float(), nullable=False),
+        sa.Column('engagement_score', sa.Float(), nullable=False),
+        sa.Column('category', sa.String(length=20), nullable=False),
+        sa.Column('calculated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['student_id'], ['students.student_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('student_id', 'week_start')
+    )
+    
+    # Create index for week lookups
+    op.create_index('idx_student_rating_history_week', 'student_rating_history', ['week_start'], unique=False)
+
+
+def downgrade() -> None:
+    # Drop index
+    op.drop_index('idx_student_rating_history_week', table_name='student_rating_history')
+    
+    # Drop table
+    op.drop_table('student_rating_history')
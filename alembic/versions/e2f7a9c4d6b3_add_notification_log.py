@@ -0,0 +1,48 @@
+"""Add notification log
+
+Revision ID: e2f7a9c4d6b3
+Revises: d9a6c2e4b8f1
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2f7a9c4d6b3'
+down_revision = 'd9a6c2e4b8f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create notification_log table
+    op.create_table(
+        'notification_log',
+        sa.Column('log_id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('student_id', sa.BigInteger(), nullable=False),
+        sa.Column('stream_id', sa.BigInteger(), nullable=True),
+        sa.Column('notification_type', sa.String(length=50), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('sent_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['student_id'], ['students.student_id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['stream_id'], ['streams.stream_id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('log_id')
+    )
+    
+    # Create indexes
+    op.create_index(op.f('ix_notification_log_log_id'), 'notification_log', ['log_id'], unique=False)
+    op.create_index(
+        'idx_notification_log_student_sent', 'notification_log', ['student_id', 'sent_at'],
+        unique=False, postgresql_include=['content_hash']
+    )
+
+
+def downgrade() -> None:
+    # Drop indexes
+    op.drop_index('idx_notification_log_student_sent', table_name='notification_log')
+    op.drop_index(op.f('ix_notification_log_log_id'), table_name='notification_log')
+    
+    # Drop table
+    op.drop_table('notification_log')
@@ -0,0 +1,71 @@
+"""Add rating decision audits
+
+Revision ID: e7a2c5f9d3b6
+Revises: d1f5b8c3e7a2
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a2c5f9d3b6'
+down_revision = 'd1f5b8c3e7a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create rating_decision_audits table
+    op.create_table(
+        'rating_decision_audits',
+        sa.Column('audit_id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('stream_id', sa.BigInteger(), nullable=False),
+        sa.Column('student_id', sa.BigInteger(), nullable=False),
+        sa.Column('week_start', sa.Date(), nullable=False),
+        sa.Column('facts', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('weekly_score', sa.Float(), nullable=True),
+        sa.Column('prompt_version', sa.String(length=50), nullable=True),
+        sa.Column('message_text', sa.Text(), nullable=True),
+        sa.Column('decision', sa.String(length=20), nullable=False),
+        sa.Column('reason', sa.String(length=100), nullable=True),
+        sa.Column('source', sa.String(length=20), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.PrimaryKeyConstraint('audit_id')
+    )
+    
+    # Create indexes
+    op.create_index(op.f('ix_rating_decision_audits_audit_id'), 'rating_decision_audits', ['audit_id'], unique=False)
+    op.create_index(
+        'idx_rating_decision_audits_stream_week', 'rating_decision_audits',
+        ['stream_id', 'week_start', 'student_id'], unique=False
+    )
+    
+    # Журнал только для добавления: UPDATE и DELETE запрещены
+    op.execute("""
+        CREATE FUNCTION rating_decision_audits_append_only() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION 'rating_decision_audits is append-only';
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_rating_decision_audits_append_only
+        BEFORE UPDATE OR DELETE ON rating_decision_audits
+        FOR EACH ROW EXECUTE FUNCTION rating_decision_audits_append_only()
+    """)
+
+
+def downgrade() -> None:
+    # Drop trigger
+    op.execute("DROP TRIGGER IF EXISTS trg_rating_decision_audits_append_only ON rating_decision_audits")
+    op.execute("DROP FUNCTION IF EXISTS rating_decision_audits_append_only()")
+    
+    # Drop indexes
+    op.drop_index('idx_rating_decision_audits_stream_week', table_name='rating_decision_audits')
+    op.drop_index(op.f('ix_rating_decision_audits_audit_id'), table_name='rating_decision_audits')
+    
+    # Drop table
+    op.drop_table('rating_decision_audits')
@@ -0,0 +1,28 @@
+"""Add bot responses message index
+
+Revision ID: f3b8d6a1c9e4
+Revises: e7a2c5f9d3b6
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d6a1c9e4'
+down_revision = 'e7a2c5f9d3b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create index for loading responses of a page of messages
+    op.create_index(
+        'idx_bot_responses_message_created', 'bot_responses', ['message_id', 'created_at'], unique=False
+    )
+
+
+def downgrade() -> None:
+    # Drop index
+    op.drop_index('idx_bot_responses_message_created', table_name='bot_responses')
@@ -0,0 +1,45 @@
+"""Add message fingerprints
+
+Revision ID: f4b1d8e3a5c7
+Revises: e2f7a9c4d6b3
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b1d8e3a5c7'
+down_revision = 'e2f7a9c4d6b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create message_fingerprints table
+    op.create_table(
+        'message_fingerprints',
+        sa.Column('fingerprint_id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('stream_id', sa.BigInteger(), nullable=False),
+        sa.Column('student_id', sa.BigInteger(), nullable=True),
+        sa.Column('source', sa.String(length=20), nullable=False),
+        sa.Column('simhash', sa.BigInteger(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['stream_id'], ['streams.stream_id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['student_id'], ['students.student_id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('fingerprint_id')
+    )
+    
+    # Create indexes
+    op.create_index(op.f('ix_message_fingerprints_fingerprint_id'), 'message_fingerprints', ['fingerprint_id'], unique=False)
+    op.create_index('idx_message_fingerprints_stream', 'message_fingerprints', ['stream_id', 'fingerprint_id'], unique=False)
+
+
+def downgrade() -> None:
+    # Drop indexes
+    op.drop_index('idx_message_fingerprints_stream', table_name='message_fingerprints')
+    op.drop_index(op.f('ix_message_fingerprints_fingerprint_id'), table_name='message_fingerprints')
+    
+    # Drop table
+    op.drop_table('message_fingerprints')
@@ -4,7 +4,7 @@ from sqlalchemy import select, func
 from typing import Optional
 
 from app.core.database import get_db
-from app.services.material_service import MaterialService
+from app.services.material_service import SEARCH_MODE_SUBSTRING, MaterialService
 from app.models.education import CourseMaterial, MaterialCategory
 from app.schemas.material import (
     CourseMaterialCreate, CourseMaterialUpdate, CourseMaterialResponse,
@@ -146,22 +146,17 @@ async def search_materials(
     q: str = Query(..., description="Поисковый запрос"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    mode: str = Query(
+        SEARCH_MODE_SUBSTRING,
+        pattern="^(substring|similar)$",
+        description="substring - подстрока, similar - похожие (опечатки, части слов), по убыванию сходства"
+    ),
     db: AsyncSession = Depends(get_db)
 ):
     """Поиск материалов по названию и содержимому"""
     service = MaterialService(db)
-    materials = await service.search_materials(q, skip, limit)
-    
-    # Получаем общее количество результатов поиска
-    from sqlalchemy import and_
-    total_query = select(func.count(CourseMaterial.material_id)).where(
-        and_(
-            CourseMaterial.title.ilike(f"%{q}%"),
-            CourseMaterial.content.ilike(f"%{q}%")
-        )
-    )
-    total_result = await db.execute(total_query)
-    total = total_result.scalar() or 0
+    materials = await service.search_materials(q, skip, limit, mode)
+    total = await service.count_search_results(q, mode)
     
     return CourseMaterialListResponse(
         materials=[CourseMaterialResponse.model_validate(material) for material in materials],
@@ -4,16 +4,28 @@ from sqlalchemy import select, func, and_
 from typing import Optional
 
 from app.core.database import get_db
-from app.services.message_service import MessageService
+from app.services.message_service import (
+    SEARCH_MODE_FULLTEXT, InvalidCursorError, MessageService, decode_cursor
+)
 from app.models.education import Message, SenderType
 from app.schemas.message import (
     MessageCreate, MessageResponse, BotResponseCreate, BotResponseResponse,
-    MessageWithResponse, MessageListResponse, ChatStats
+    MessageWithResponse, MessageListResponse, MessageSearchResponse, ChatStats
 )
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
 
+def _parse_cursor(cursor: Optional[str]):
+    """Разобрать курсор пагинации из запроса (400 при некорректном)"""
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except InvalidCursorError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+
 @router.get("/", response_model=MessageListResponse)
 async def get_messages(
     skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
@@ -21,11 +33,14 @@ async def get_messages(
     chat_id: Optional[int] = Query(None, description="Фильтр по чату"),
     sender_type: Optional[SenderType] = Query(None, description="Фильтр по типу отправителя"),
     sender_id: Optional[int] = Query(None, description="Фильтр по ID отправителя"),
+    cursor: Optional[str] = Query(None, description="Курсор next_cursor предыдущей страницы (вместо skip)"),
     db: AsyncSession = Depends(get_db)
 ):
     """Получить список сообщений с ответами бота"""
     service = MessageService(db)
-    messages = await service.get_messages(skip, limit, chat_id, sender_type, sender_id)
+    messages, next_cursor = await service.get_messages(
+        skip, limit, chat_id, sender_type, sender_id, cursor=_parse_cursor(cursor)
+    )
     
     # Получаем общее количество для пагинации
     total_query = select(func.count(Message.message_id))
@@ -43,7 +58,8 @@ async def get_messages(
         messages=messages,
         total=total,
         page=skip // limit + 1,
-        size=limit
+        size=limit,
+        next_cursor=next_cursor
     )
 
 
@@ -99,11 +115,12 @@ async def get_chat_messages(
     chat_id: int,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Курсор next_cursor предыдущей страницы (вместо skip)"),
     db: AsyncSession = Depends(get_db)
 ):
     """Получить сообщения чата"""
     service = MessageService(db)
-    messages = await service.get_chat_messages(chat_id, skip, limit)
+    messages, next_cursor = await service.get_chat_messages(chat_id, skip, limit, _parse_cursor(cursor))
     
     # Получаем общее количество сообщений в чате
     total_query = select(func.count(Message.message_id)).where(Message.chat_id == chat_id)
@@ -114,7 +131,8 @@ async def get_chat_messages(
         messages=messages,
         total=total,
         page=skip // limit + 1,
-        size=limit
+        size=limit,
+        next_cursor=next_cursor
     )
 
 
@@ -123,11 +141,12 @@ async def get_user_messages(
     sender_id: int,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Курсор next_cursor предыдущей страницы (вместо skip)"),
     db: AsyncSession = Depends(get_db)
 ):
     """Получить сообщения пользователя"""
     service = MessageService(db)
-    messages = await service.get_user_messages(sender_id, skip, limit)
+    messages, next_cursor = await service.get_user_messages(sender_id, skip, limit, _parse_cursor(cursor))
     
     # Получаем общее количество сообщений пользователя
     total_query = select(func.count(Message.message_id)).where(
@@ -140,7 +159,8 @@ async def get_user_messages(
         messages=messages,
         total=total,
         page=skip // limit + 1,
-        size=limit
+        size=limit,
+        next_cursor=next_cursor
     )
 
 
@@ -148,11 +168,12 @@ async def get_user_messages(
 async def get_bot_messages(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Курсор next_cursor предыдущей страницы (вместо skip)"),
     db: AsyncSession = Depends(get_db)
 ):
     """Получить сообщения бота"""
     service = MessageService(db)
-    messages = await service.get_bot_messages(skip, limit)
+    messages, next_cursor = await service.get_bot_messages(skip, limit, _parse_cursor(cursor))
     
     # Получаем общее количество сообщений бота
     total_query = select(func.count(Message.message_id)).where(
@@ -165,7 +186,8 @@ async def get_bot_messages(
         messages=messages,
         total=total,
         page=skip // limit + 1,
-        size=limit
+        size=limit,
+        next_cursor=next_cursor
     )
 
 
@@ -190,27 +212,26 @@ async def get_message_stats(
     return stats
 
 
-@router.get("/search/", response_model=MessageListResponse)
+@router.get("/search/", response_model=MessageSearchResponse)
 async def search_messages(
-    q: str = Query(..., description="Поисковый запрос"),
+    q: str = Query(..., min_length=1, description="Поисковый запрос (слова, \"фраза\", OR, -исключение)"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    mode: str = Query(
+        SEARCH_MODE_FULLTEXT,
+        pattern="^(fulltext|substring|similar)$",
+        description="fulltext - по словам с учетом морфологии, substring - подстрока, similar - похожие (опечатки, части слов)"
+    ),
     db: AsyncSession = Depends(get_db)
 ):
-    """Поиск сообщений по тексту"""
+    """Поиск сообщений по тексту (fulltext и similar - по убыванию релевантности)"""
     service = MessageService(db)
-    messages = await service.search_messages(q, skip, limit)
+    messages, total, total_capped = await service.search_messages(q, skip, limit, mode)
     
-    # Получаем общее количество результатов поиска
-    total_query = select(func.count(Message.message_id)).where(
-        Message.text_content.ilike(f"%{q}%")
-    )
-    total_result = await db.execute(total_query)
-    total = total_result.scalar() or 0
-    
-    return MessageListResponse(
+    return MessageSearchResponse(
         messages=messages,
         total=total,
+        total_capped=total_capped,
         page=skip // limit + 1,
         size=limit
     )
@@ -1,22 +1,46 @@
 """
 Rating API for student rating calculation and n8n integration
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 from datetime import date, datetime, timedelta
+import os
+import time
 
-from app.core.database import get_db
-from app.services.student_service import StudentService
+from app.core.config import settings
+from app.core.database import get_db, async_session
+from app.core.fanout import fan_out
+from app.services.student_service import REFRESH_CHUNK_SIZE, StudentService
+from app.services.anti_repeat_service import AntiRepeatService, parse_rules
+from app.services.audit_service import AuditService, audit_buffer
+from app.services.audit_export import AuditExporter, ExportIdConflictError, get_export, start_export
+from app.services.dry_run_service import DryRunService
+from app.services.fingerprint_service import FingerprintService
+from app.services.idempotency_service import IdempotencyService, request_hash
+from app.services.notification_scheduler import notification_scheduler
+from app.services.outbox_service import OutboxService
+from app.services.rating_cache import rating_cache
+from app.services.streams_config_cache import streams_config_cache
+from app.services.rating_history_service import RatingHistoryService
+from app.services.weekly_run_service import DEFAULT_DAY_OF_WEEK, DEFAULT_TIME, WeeklyRunService
 from app.models.education import Student, Stream, StreamNotificationConfig
-from app.schemas.student import StudentFacts
+from app.schemas.student import StudentFacts, StudentRating
 from app.schemas.rating import (
     RatingCalculationRequest, RatingCalculationResponse, WeeklyRating,
     StreamConfig, StreamStudentsResponse, WeeklyReport, N8nNotificationRequest,
     N8nNotificationResponse, StreamStudentsFactsResponse,
     StreamNotificationConfigCreate, StreamNotificationConfigUpdate,
-    StreamNotificationConfigResponse
+    StreamNotificationConfigResponse, RatingHistoryPoint, RatingHistoryResponse,
+    WeeklyRunRequest, WeeklyRunResponse, WeeklyRunStream, WeeklyRunStudent,
+    StreamRecipientsResponse, AntiRepeatCheckRequest, AntiRepeatCheckResponse,
+    FingerprintCheckRequest, FingerprintCheckResponse, NearDuplicateMatch,
+    DryRunRequest, DryRunResponse, AuditRecordsRequest, AuditRecordsResponse,
+    AuditRecordResponse
 )
 
 # TODO: Раскомментировать для продакшена
@@ -31,49 +55,200 @@ router = APIRouter(prefix="/rating", tags=["rating"])
 # )
 
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+_STREAM_CONFIGS_ADAPTER = TypeAdapter(List[StreamConfig])
+
+# Сколько студентов считать за один запрос (потоковая выдача, отчеты)
+COHORT_CHUNK_SIZE = 200
+
+# Область ключей идемпотентности /notifications/send
+NOTIFICATIONS_SEND_SCOPE = "notifications.send"
+
+
+def _wants_ndjson(accept: Optional[str]) -> bool:
+    """Клиент запросил построчную выдачу (Accept: application/x-ndjson)"""
+    return bool(accept) and NDJSON_MEDIA_TYPE in accept
+
+
+def _chunks(items: List[int], size: int):
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+
+async def _stream_students_facts(
+    student_ids: List[int], week_start: date, week_end: date
+) -> AsyncIterator[str]:
+    """
+    Факты студентов по одному на строку, пачками по COHORT_CHUNK_SIZE.
+    
+    Сессия открывается здесь: сессия из get_db закрывается до отправки тела ответа.
+    """
+    async with async_session() as session:
+        service = StudentService(session)
+        for chunk in _chunks(student_ids, COHORT_CHUNK_SIZE):
+            cohort_facts = await service.get_cohort_facts(chunk, week_start, week_end)
+            for student_id in chunk:
+                yield cohort_facts[student_id].model_dump_json() + "\n"
+
+
+async def _stream_weekly_ratings(
+    student_ids: List[int], week_start: date, week_end: date, config=None
+) -> AsyncIterator[str]:
+    """Недельные рейтинги студентов по одному на строку"""
+    async with async_session() as session:
+        service = StudentService(session)
+        for chunk in _chunks(student_ids, COHORT_CHUNK_SIZE):
+            cohort_ratings = await service.calculate_cohort_ratings(
+                chunk, week_start, week_end, config
+            )
+            for student_id in chunk:
+                rating = _to_weekly_rating(cohort_ratings[student_id], week_start, week_end)
+                yield rating.model_dump_json() + "\n"
+
+
+async def _rate_students_chunk(
+    session: AsyncSession, student_ids: List[int], week_start: date, week_end: date
+) -> List[StudentRating]:
+    """
+    Рейтинги пачки студентов одним когортным расчетом. Если он упал,
+    студенты считаются по одному, а студенты с ошибками пропускаются.
+    """
+    service = StudentService(session)
+    try:
+        cohort_ratings = await service.calculate_cohort_ratings(student_ids, week_start, week_end)
+        return [cohort_ratings[student_id] for student_id in student_ids]
+    except Exception:
+        await session.rollback()
+    
+    ratings = []
+    for student_id in student_ids:
+        try:
+            ratings.append(
+                await service.calculate_student_rating(student_id, week_start, week_end)
+            )
+        except Exception:
+            await session.rollback()
+            continue  # Пропускаем студентов с ошибками
+    return ratings
+
+
+def _notification_settings(notification_config: Optional[StreamNotificationConfig]) -> dict:
+    """Настройки рассылки потока в формате notification_settings (для n8n)"""
+    # Если конфигурации нет, используем значения по умолчанию
+    if notification_config is None:
+        return {
+            "enabled": True,
+            "schedule": "weekly",
+            "day_of_week": DEFAULT_DAY_OF_WEEK,
+            "time": DEFAULT_TIME.strftime("%H:%M")
+        }
+    return {
+        "enabled": notification_config.notification_enabled,
+        "schedule": notification_config.frequency,
+        "day_of_week": notification_config.day_of_week,
+        "time": notification_config.time.strftime("%H:%M") if notification_config.time else None,
+        "student_limit": notification_config.student_limit,
+        "language": notification_config.language,
+        "tone": notification_config.tone,
+        "dry_run_enabled": notification_config.dry_run_enabled
+    }
+
+
+def _config_response(config: StreamNotificationConfig) -> StreamNotificationConfigResponse:
+    """Конфигурация уведомлений потока для ответа (time - строкой HH:MM)"""
+    return StreamNotificationConfigResponse(
+        config_id=config.config_id,
+        stream_id=config.stream_id,
+        notification_enabled=config.notification_enabled,
+        frequency=config.frequency,
+        day_of_week=config.day_of_week,
+        time=config.time.strftime("%H:%M") if config.time else None,
+        student_limit=config.student_limit,
+        language=config.language,
+        tone=config.tone,
+        anti_repeat_rules=config.anti_repeat_rules,
+        dry_run_enabled=config.dry_run_enabled,
+        created_at=config.created_at,
+        updated_at=config.updated_at
+    )
+
+
+def _elapsed_ms(started: float) -> float:
+    """Время в миллисекундах с момента started (perf_counter)"""
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+def _to_weekly_rating(rating: StudentRating, week_start: date, week_end: date) -> WeeklyRating:
+    """Конвертировать StudentRating в WeeklyRating"""
+    return WeeklyRating(
+        student_id=rating.student_id,
+        week_start=week_start,
+        week_end=week_end,
+        weekly_score=rating.weekly_score,
+        assignment_score=rating.assignment_score,
+        activity_score=rating.activity_score,
+        attendance_score=rating.attendance_score,
+        engagement_score=rating.engagement_score,
+        category=rating.category,
+        recommendations=rating.recommendations,
+        personal_message=rating.message
+    )
+
+
 @router.post("/calculate", response_model=RatingCalculationResponse)
 async def calculate_ratings(
     request: RatingCalculationRequest,
+    accept: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db)
 ):
-    """Рассчитать рейтинги для списка студентов"""
+    """
+    Рассчитать рейтинги для списка студентов.
+    
+    С Accept: application/x-ndjson рейтинги отдаются по одному на строку,
+    ненайденные студенты перечисляются в заголовке X-Missing-Student-Ids.
+    """
     service = StudentService(db)
-    ratings = []
+    timings_ms = {}
     
-    for student_id in request.student_ids:
-        # Проверяем, что студент существует
-        student = await service.get_student_by_id(student_id)
-        if not student:
-            continue
-        
-        # Рассчитываем рейтинг
-        rating = await service.calculate_student_rating(
-            student_id, 
-            request.week_start, 
-            request.week_end,
-            request.config
-        )
-        
-        # Конвертируем в WeeklyRating
-        weekly_rating = WeeklyRating(
-            student_id=rating.student_id,
-            week_start=request.week_start,
-            week_end=request.week_end,
-            weekly_score=rating.weekly_score,
-            assignment_score=rating.assignment_score,
-            activity_score=rating.activity_score,
-            attendance_score=rating.attendance_score,
-            engagement_score=rating.engagement_score,
-            category=rating.category,
-            recommendations=rating.recommendations,
-            personal_message=rating.message
+    # Проверяем существование всех студентов одним запросом
+    started = time.perf_counter()
+    student_ids = await service.get_existing_student_ids(request.student_ids)
+    timings_ms["lookup"] = _elapsed_ms(started)
+    
+    existing = set(student_ids)
+    missing_student_ids = [
+        student_id for student_id in dict.fromkeys(request.student_ids)
+        if student_id not in existing
+    ]
+    
+    if _wants_ndjson(accept):
+        return StreamingResponse(
+            _stream_weekly_ratings(
+                student_ids, request.week_start, request.week_end, request.config
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={
+                "X-Missing-Student-Ids": ",".join(str(student_id) for student_id in missing_student_ids)
+            }
         )
-        
-        ratings.append(weekly_rating)
+    
+    # Рассчитываем рейтинги группы (кэш, факты, скоринг)
+    cohort_ratings = await service.calculate_cohort_ratings(
+        student_ids, request.week_start, request.week_end, request.config,
+        timings_ms=timings_ms
+    )
+    ratings = [
+        _to_weekly_rating(cohort_ratings[student_id], request.week_start, request.week_end)
+        for student_id in student_ids
+    ]
+    timings_ms["total"] = round(sum(timings_ms.values()), 3)
     
     return RatingCalculationResponse(
         ratings=ratings,
-        total_students=len(ratings)
+        total_students=len(ratings),
+        missing_student_ids=missing_student_ids,
+        timings_ms=timings_ms
     )
 
 
@@ -94,92 +269,91 @@ async def get_student_weekly_rating(
     
     # Рассчитываем рейтинг
     rating = await service.calculate_student_rating(student_id, week_start, week_end)
+    return _to_weekly_rating(rating, week_start, week_end)
+
+
+@router.get("/student/{student_id}/history", response_model=RatingHistoryResponse)
+async def get_student_rating_history(
+    student_id: int,
+    date_from: Optional[date] = Query(None, description="Начало периода"),
+    date_to: Optional[date] = Query(None, description="Конец периода"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Получить историю недельных рейтингов студента.
     
-    return WeeklyRating(
-        student_id=rating.student_id,
-        week_start=week_start,
-        week_end=week_end,
-        weekly_score=rating.weekly_score,
-        assignment_score=rating.assignment_score,
-        activity_score=rating.activity_score,
-        attendance_score=rating.attendance_score,
-        engagement_score=rating.engagement_score,
-        category=rating.category,
-        recommendations=rating.recommendations,
-        personal_message=rating.message
+    История заполняется скриптом scripts/backfill_rating_history.py.
+    score_change - разница с предыдущей неделей (None, если ее нет в истории).
+    """
+    service = StudentService(db)
+    
+    # Проверяем, что студент существует
+    student = await service.get_student_by_id(student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Студент не найден")
+    
+    history = await RatingHistoryService(db).get_student_history(student_id, date_from, date_to)
+    
+    points = []
+    previous = None
+    for entry in history:
+        point = RatingHistoryPoint.model_validate(entry)
+        if previous is not None and previous.week_start == entry.week_start - timedelta(days=7):
+            point.score_change = round(entry.weekly_score - previous.weekly_score, 2)
+        points.append(point)
+        previous = entry
+    
+    return RatingHistoryResponse(
+        student_id=student_id,
+        points=points,
+        total_weeks=len(points)
     )
 
 
 @router.get("/streams", response_model=List[StreamConfig])
 async def get_streams_config(
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db)
 ):
-    """Получить конфигурацию потоков для n8n"""
-    # Получаем все активные потоки с конфигурацией
-    query = select(Stream).where(Stream.end_date >= date.today())
-    result = await db.execute(query)
-    streams = result.scalars().all()
-    
-    configs = []
-    for stream in streams:
-        # Получаем конфигурацию уведомлений из БД
-        notification_config_query = select(StreamNotificationConfig).where(
-            StreamNotificationConfig.stream_id == stream.stream_id
-        )
-        notification_config_result = await db.execute(notification_config_query)
-        notification_config = notification_config_result.scalar_one_or_none()
+    """
+    Получить конфигурацию потоков для n8n.
+    
+    Ответ кэшируется в памяти процесса и отдается с ETag; при совпадении
+    If-None-Match возвращается 304 без обращения к БД.
+    """
+    today = date.today()
+    cached = streams_config_cache.get(today)
+    if cached is None:
+        generation = streams_config_cache.generation
         
-        # Если конфигурации нет, используем значения по умолчанию
-        if notification_config:
-            # Конвертируем time в строку для ответа
-            notification_config_dict = {
-                "config_id": notification_config.config_id,
-                "stream_id": notification_config.stream_id,
-                "notification_enabled": notification_config.notification_enabled,
-                "frequency": notification_config.frequency,
-                "day_of_week": notification_config.day_of_week,
-                "time": notification_config.time.strftime("%H:%M") if notification_config.time else None,
-                "student_limit": notification_config.student_limit,
-                "language": notification_config.language,
-                "tone": notification_config.tone,
-                "anti_repeat_rules": notification_config.anti_repeat_rules,
-                "dry_run_enabled": notification_config.dry_run_enabled,
-                "created_at": notification_config.created_at,
-                "updated_at": notification_config.updated_at,
-            }
-            notification_config_response = StreamNotificationConfigResponse(**notification_config_dict)
-            notification_settings = {
-                "enabled": notification_config.notification_enabled,
-                "schedule": notification_config.frequency,
-                "day_of_week": notification_config.day_of_week,
-                "time": notification_config.time.strftime("%H:%M") if notification_config.time else None,
-                "student_limit": notification_config.student_limit,
-                "language": notification_config.language,
-                "tone": notification_config.tone,
-                "dry_run_enabled": notification_config.dry_run_enabled
-            }
-        else:
-            notification_config_response = None
-            notification_settings = {
-                "enabled": True,
-                "schedule": "weekly",
-                "day_of_week": 1,  # Понедельник
-                "time": "10:00"
-            }
+        # Все активные потоки вместе с конфигурацией уведомлений одним запросом
+        query = select(Stream, StreamNotificationConfig).outerjoin(
+            StreamNotificationConfig,
+            StreamNotificationConfig.stream_id == Stream.stream_id
+        ).where(Stream.end_date >= today).order_by(Stream.stream_id)
+        result = await db.execute(query)
         
-        config = StreamConfig(
-            stream_id=stream.stream_id,
-            name=stream.name,
-            program_id=stream.program_id,
-            start_date=stream.start_date,
-            end_date=stream.end_date,
-            is_active=stream.end_date >= date.today(),
-            notification_config=notification_config_response,
-            notification_settings=notification_settings  # Для обратной совместимости
+        configs = [
+            StreamConfig(
+                stream_id=stream.stream_id,
+                name=stream.name,
+                program_id=stream.program_id,
+                start_date=stream.start_date,
+                end_date=stream.end_date,
+                is_active=stream.end_date >= today,
+                notification_config=_config_response(notification_config) if notification_config else None,
+                notification_settings=_notification_settings(notification_config)  # Для обратной совместимости
+            )
+            for stream, notification_config in result
+        ]
+        cached = streams_config_cache.put(
+            today, _STREAM_CONFIGS_ADAPTER.dump_json(configs), generation
         )
-        configs.append(config)
     
-    return configs
+    etag, body = cached
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 
 @router.get("/streams/{stream_id}/students", response_model=StreamStudentsResponse)
@@ -237,9 +411,15 @@ async def get_stream_students_facts(
     stream_id: int,
     week_start: date = Query(..., description="Начало недели"),
     week_end: date = Query(..., description="Конец недели"),
+    accept: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db)
 ):
-    """Получить факты недели для всех студентов потока (для n8n)"""
+    """
+    Получить факты недели для всех студентов потока (для n8n).
+    
+    С Accept: application/x-ndjson факты отдаются по одному студенту на
+    строку по мере расчета, счетчики студентов - в заголовках ответа.
+    """
     # Получаем поток
     stream_query = select(Stream).where(Stream.stream_id == stream_id)
     stream_result = await db.execute(stream_query)
@@ -248,35 +428,30 @@ async def get_stream_students_facts(
     if not stream:
         raise HTTPException(status_code=404, detail="Поток не найден")
     
-    # Получаем студентов потока
-    students_query = select(Student).join(Student.streams).where(
+    # Получаем студентов потока (только id и признак активности)
+    students_query = select(Student.student_id, Student.is_active).join(Student.streams).where(
         Stream.stream_id == stream_id
     )
     students_result = await db.execute(students_query)
-    students = students_result.scalars().all()
+    students = students_result.all()
     
-    # Получаем факты для каждого студента
-    service = StudentService(db)
-    students_facts = []
-    active_count = 0
+    active_ids = [student.student_id for student in students if student.is_active]
+    active_count = len(active_ids)
     
-    for student in students:
-        if not student.is_active:
-            continue
-        
-        active_count += 1
-        
-        try:
-            facts = await service.get_student_facts(
-                student.student_id,
-                week_start,
-                week_end
-            )
-            students_facts.append(facts)
-        except Exception as e:
-            # Логируем ошибку, но продолжаем обработку других студентов
-            # В продакшене можно добавить логирование
-            continue
+    if _wants_ndjson(accept):
+        return StreamingResponse(
+            _stream_students_facts(active_ids, week_start, week_end),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={
+                "X-Total-Students": str(len(students)),
+                "X-Active-Students": str(active_count)
+            }
+        )
+    
+    # Получаем факты сразу для всех активных студентов потока
+    service = StudentService(db)
+    cohort_facts = await service.get_cohort_facts(active_ids, week_start, week_end)
+    students_facts = [cohort_facts[student_id] for student_id in active_ids]
     
     return StreamStudentsFactsResponse(
         stream_id=stream_id,
@@ -288,6 +463,59 @@ async def get_stream_students_facts(
     )
 
 
+@router.get("/streams/{stream_id}/recipients", response_model=StreamRecipientsResponse)
+async def get_stream_recipients(
+    stream_id: int,
+    week_start: date = Query(..., description="Начало недели"),
+    week_end: date = Query(..., description="Конец недели"),
+    order: str = Query("top", pattern="^(top|bottom)$", description="top - лучшие, bottom - худшие"),
+    limit: Optional[int] = Query(None, ge=1, description="Размер выборки (по умолчанию - student_limit потока)"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Получить top-N / bottom-N студентов потока по weekly_score.
+    
+    Отбор делается на сервере, наружу уходят только N рейтингов.
+    При равных баллах порядок: assignment_score, затем student_id.
+    """
+    # Получаем поток вместе с конфигурацией уведомлений
+    stream_query = select(Stream, StreamNotificationConfig).outerjoin(
+        StreamNotificationConfig,
+        StreamNotificationConfig.stream_id == Stream.stream_id
+    ).where(Stream.stream_id == stream_id)
+    stream_result = await db.execute(stream_query)
+    stream_row = stream_result.first()
+    
+    if not stream_row:
+        raise HTTPException(status_code=404, detail="Поток не найден")
+    
+    notification_config = stream_row[1]
+    if limit is None and notification_config is not None:
+        limit = notification_config.student_limit
+    
+    # Активные студенты потока
+    students_query = select(Student.student_id).join(Student.streams).where(
+        and_(Stream.stream_id == stream_id, Student.is_active.is_(True))
+    )
+    students_result = await db.execute(students_query)
+    active_ids = list(students_result.scalars().all())
+    
+    service = StudentService(db)
+    ratings = await service.select_ranked_ratings(
+        active_ids, week_start, week_end, limit=limit, lowest=(order == "bottom")
+    )
+    
+    return StreamRecipientsResponse(
+        stream_id=stream_id,
+        week_start=week_start,
+        week_end=week_end,
+        order=order,
+        limit=limit,
+        total_candidates=len(active_ids),
+        recipients=[_to_weekly_rating(rating, week_start, week_end) for rating in ratings]
+    )
+
+
 @router.get("/streams/{stream_id}/weekly-report", response_model=WeeklyReport)
 async def get_weekly_report(
     stream_id: int,
@@ -310,28 +538,28 @@ async def get_weekly_report(
     if not stream:
         raise HTTPException(status_code=404, detail="Поток не найден")
     
-    # Получаем студентов потока
-    students_query = select(Student).join(Student.streams).where(
+    # Получаем студентов потока (только id и признак активности)
+    students_query = select(Student.student_id, Student.is_active).join(Student.streams).where(
         Stream.stream_id == stream_id
     )
     students_result = await db.execute(students_query)
-    students = students_result.scalars().all()
+    students = students_result.all()
+    active_ids = [student.student_id for student in students if student.is_active]
     
-    service = StudentService(db)
-    ratings = []
-    
-    # Рассчитываем рейтинги для всех студентов
-    for student in students:
-        if not student.is_active:
-            continue
-        
-        try:
-            rating = await service.calculate_student_rating(
-                student.student_id, week_start, week_end
-            )
-            ratings.append(rating)
-        except Exception:
-            continue  # Пропускаем студентов с ошибками
+    # Рассчитываем рейтинги параллельно на FANOUT_CONCURRENCY сессиях
+    chunk_size = min(
+        COHORT_CHUNK_SIZE,
+        max(1, -(-len(active_ids) // settings.FANOUT_CONCURRENCY))
+    )
+    chunk_results = await fan_out(
+        _chunks(active_ids, chunk_size),
+        lambda session, chunk: _rate_students_chunk(session, chunk, week_start, week_end)
+    )
+    ratings = [
+        rating
+        for chunk_result in chunk_results if chunk_result.ok
+        for rating in chunk_result.result
+    ]
     
     if not ratings:
         return WeeklyReport(
@@ -384,57 +612,327 @@ async def get_weekly_report(
     )
 
 
+@router.post("/weekly-run", response_model=WeeklyRunResponse)
+async def run_weekly(
+    request: WeeklyRunRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Общий еженедельный прогон для n8n Cron.
+    
+    Берет все потоки, у которых по StreamNotificationConfig наступило время
+    рассылки (за последние window_minutes), и считает факты и рейтинги их
+    студентов одним набором когортных запросов на все потоки сразу.
+    """
+    run_at = datetime.now()
+    timings_ms = {}
+    
+    # Если даты не указаны, используем прошлую неделю
+    week_start, week_end = request.week_start, request.week_end
+    if not week_start or not week_end:
+        today = date.today()
+        week_start = today - timedelta(days=today.weekday() + 7)
+        week_end = week_start + timedelta(days=6)
+    
+    # Потоки к рассылке и их студенты
+    started = time.perf_counter()
+    run_service = WeeklyRunService(db)
+    due_streams = await run_service.get_due_streams(
+        run_at, request.window_minutes, request.stream_ids
+    )
+    members = await run_service.get_stream_members(
+        [stream.stream_id for stream, _ in due_streams]
+    )
+    active_ids = list(dict.fromkeys(
+        student_id
+        for stream_members in members.values()
+        for student_id, is_active in stream_members
+        if is_active
+    ))
+    timings_ms["lookup"] = _elapsed_ms(started)
+    
+    # Факты и рейтинги сразу для всех студентов всех потоков
+    service = StudentService(db)
+    started = time.perf_counter()
+    cohort_facts = {}
+    for chunk in _chunks(active_ids, REFRESH_CHUNK_SIZE):
+        cohort_facts.update(await service.get_cohort_facts(chunk, week_start, week_end))
+    timings_ms["facts"] = _elapsed_ms(started)
+    
+    started = time.perf_counter()
+    cohort_ratings = service.rate_cohort(cohort_facts, request.config)
+    timings_ms["scoring"] = _elapsed_ms(started)
+    
+    streams = []
+    for stream, notification_config in due_streams:
+        stream_members = members.get(stream.stream_id, [])
+        stream_active_ids = [student_id for student_id, is_active in stream_members if is_active]
+        streams.append(WeeklyRunStream(
+            stream_id=stream.stream_id,
+            name=stream.name,
+            notification_settings=_notification_settings(notification_config),
+            total_students=len(stream_members),
+            active_students=len(stream_active_ids),
+            students=[
+                WeeklyRunStudent(
+                    facts=cohort_facts[student_id],
+                    rating=_to_weekly_rating(cohort_ratings[student_id], week_start, week_end)
+                )
+                for student_id in stream_active_ids
+            ]
+        ))
+    timings_ms["total"] = round(sum(timings_ms.values()), 3)
+    
+    return WeeklyRunResponse(
+        run_at=run_at,
+        week_start=week_start,
+        week_end=week_end,
+        streams=streams,
+        total_streams=len(streams),
+        total_students=len(active_ids),
+        timings_ms=timings_ms
+    )
+
+
 @router.post("/notifications/send", response_model=N8nNotificationResponse)
 async def send_notifications(
     request: N8nNotificationRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     db: AsyncSession = Depends(get_db)
 ):
-    """Отправить уведомления студентам (заглушка для n8n)"""
-    # В реальной реализации здесь будет интеграция с Telegram Bot API
-    # Пока возвращаем заглушку
+    """
+    Поставить уведомления студентам в очередь доставки (для n8n).
+    
+    Сообщения записываются в notification_outbox и отправляются воркером
+    доставки; ответ возвращается сразу, sent_count - число поставленных в
+    очередь. Студенты, не прошедшие правила антиповтора потока, пропускаются.
+    В dry run очередь и журнал уведомлений не пишутся.
+    
+    С заголовком Idempotency-Key (или полем idempotency_key) повтор запроса
+    в течение IDEMPOTENCY_TTL_HOURS ничего не отправляет и возвращает
+    исходный ответ с заголовком Idempotent-Replayed: true. Ключ и очередь
+    фиксируются одной транзакцией.
+    """
+    key = idempotency_key or request.idempotency_key
+    idempotency_service = IdempotencyService(db)
+    if key:
+        payload_hash = request_hash(request.model_dump_json(exclude={'idempotency_key'}))
+        stored = await idempotency_service.reserve(NOTIFICATIONS_SEND_SCOPE, key, payload_hash)
+        if stored is not None:
+            if stored.request_hash != payload_hash:
+                raise HTTPException(
+                    status_code=422,
+                    detail="Idempotency-Key уже использован с другим запросом"
+                )
+            if stored.response is None:
+                raise HTTPException(status_code=409, detail="Запрос с этим Idempotency-Key еще выполняется")
+            response.headers["Idempotent-Replayed"] = "true"
+            return N8nNotificationResponse.model_validate(stored.response)
     
     sent_count = 0
     failed_count = 0
     errors = []
     
-    # Проверяем, что поток существует
-    stream_query = select(Stream).where(Stream.stream_id == request.stream_id)
+    # Проверяем, что поток существует (вместе с конфигурацией уведомлений)
+    stream_query = select(Stream, StreamNotificationConfig).outerjoin(
+        StreamNotificationConfig,
+        StreamNotificationConfig.stream_id == Stream.stream_id
+    ).where(Stream.stream_id == request.stream_id)
     stream_result = await db.execute(stream_query)
-    stream = stream_result.scalar_one_or_none()
+    stream_row = stream_result.first()
     
-    if not stream:
+    if not stream_row:
         return N8nNotificationResponse(
             success=False,
             sent_count=0,
             failed_count=len(request.student_ids),
             errors=["Поток не найден"]
         )
+    notification_config = stream_row[1]
+    dry_run = bool(notification_config and notification_config.dry_run_enabled)
+    
+    # Правила антиповтора для всей группы одним запросом
+    anti_repeat_service = AntiRepeatService(db)
+    decisions = await anti_repeat_service.evaluate(
+        request.student_ids,
+        parse_rules(notification_config.anti_repeat_rules if notification_config else None),
+        text=request.message_template
+    )
+    allowed_ids = [student_id for student_id, decision in decisions.items() if decision.allowed]
+    skipped_student_ids = [student_id for student_id, decision in decisions.items() if not decision.allowed]
     
     # Получаем студентов
     students_query = select(Student).where(
         and_(
-            Student.student_id.in_(request.student_ids),
+            Student.student_id.in_(allowed_ids),
             Student.is_active == True
         )
     )
     students_result = await db.execute(students_query)
     students = students_result.scalars().all()
     
-    # В реальной реализации здесь будет отправка через Telegram
+    recipients = []
     for student in students:
         if student.telegram_user_id:
-            # Заглушка: считаем, что отправка успешна
-            sent_count += 1
+            recipients.append((student.student_id, student.telegram_user_id))
         else:
             failed_count += 1
             errors.append(f"Студент {student.name} не имеет Telegram ID")
+    sent_count = len(recipients)
+    
+    # Похожие тексты среди последних сообщений потока
+    fingerprint_service = FingerprintService(db)
+    near_duplicates = await fingerprint_service.find_near_duplicates(
+        request.stream_id, request.message_template
+    )
     
-    return N8nNotificationResponse(
+    outbox_ids = []
+    if not dry_run and recipients:
+        outbox_ids = await OutboxService(db).enqueue(
+            recipients,
+            request.message_template,
+            request.notification_type,
+            stream_id=request.stream_id,
+            send_at=None if request.send_immediately else request.scheduled_time
+        )
+        await anti_repeat_service.record(
+            [student_id for student_id, _ in recipients],
+            request.notification_type,
+            request.message_template,
+            stream_id=request.stream_id
+        )
+        await fingerprint_service.record(
+            request.stream_id, [(None, request.message_template)], source="sent"
+        )
+    
+    result = N8nNotificationResponse(
         success=failed_count == 0,
         sent_count=sent_count,
         failed_count=failed_count,
+        skipped_student_ids=skipped_student_ids,
+        outbox_ids=outbox_ids,
+        near_duplicate_distance=near_duplicates[0].distance if near_duplicates else None,
         errors=errors
     )
+    
+    # Очередь, журнал антиповтора, подписи и ответ для повторов фиксируются вместе
+    if key:
+        await idempotency_service.complete(NOTIFICATIONS_SEND_SCOPE, key, result.model_dump(mode="json"))
+    else:
+        await db.commit()
+    
+    return result
+
+
+@router.get("/notifications/outbox/stats")
+async def get_outbox_stats(
+    db: AsyncSession = Depends(get_db)
+):
+    """Количество уведомлений в очереди доставки по статусам"""
+    return await OutboxService(db).get_stats()
+
+
+@router.post("/streams/{stream_id}/fingerprints/check", response_model=FingerprintCheckResponse)
+async def check_near_duplicates(
+    stream_id: int,
+    request: FingerprintCheckRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Проверить текст на почти-дубликаты среди последних сообщений потока"""
+    started = time.perf_counter()
+    near_duplicates = await FingerprintService(db).find_near_duplicates(stream_id, request.text)
+    
+    return FingerprintCheckResponse(
+        stream_id=stream_id,
+        is_near_duplicate=bool(near_duplicates),
+        matches=[
+            NearDuplicateMatch(
+                fingerprint_id=match.fingerprint_id,
+                student_id=match.student_id,
+                distance=match.distance
+            )
+            for match in near_duplicates
+        ],
+        elapsed_ms=_elapsed_ms(started)
+    )
+
+
+@router.post("/streams/{stream_id}/dry-run", response_model=DryRunResponse)
+async def dry_run_stream(
+    stream_id: int,
+    request: DryRunRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Сухой прогон еженедельной рассылки потока.
+    
+    Выполняет этапы рассылки (факты, баллы, антиповтор, отбор, тексты), ничего
+    не отправляя, и возвращает трассу: время, запросы к БД и строки по этапам.
+    Пишется только запись в dry_run_audits.
+    """
+    stream_query = select(Stream, StreamNotificationConfig).outerjoin(
+        StreamNotificationConfig,
+        StreamNotificationConfig.stream_id == Stream.stream_id
+    ).where(Stream.stream_id == stream_id)
+    stream_result = await db.execute(stream_query)
+    stream_row = stream_result.first()
+    
+    if not stream_row:
+        raise HTTPException(status_code=404, detail="Поток не найден")
+    
+    # Если даты не указаны, используем прошлую неделю
+    week_start, week_end = request.week_start, request.week_end
+    if not week_start or not week_end:
+        today = date.today()
+        week_start = today - timedelta(days=today.weekday() + 7)
+        week_end = week_start + timedelta(days=6)
+    
+    return await DryRunService(db).run(
+        stream_id,
+        stream_row[1],
+        week_start,
+        week_end,
+        config=request.config,
+        limit=request.limit,
+        lowest=request.lowest
+    )
+
+
+@router.post("/streams/{stream_id}/anti-repeat/check", response_model=AntiRepeatCheckResponse)
+async def check_anti_repeat(
+    stream_id: int,
+    request: AntiRepeatCheckRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Проверить правила антиповтора для кандидатов на рассылку (для n8n)"""
+    stream_query = select(Stream, StreamNotificationConfig).outerjoin(
+        StreamNotificationConfig,
+        StreamNotificationConfig.stream_id == Stream.stream_id
+    ).where(Stream.stream_id == stream_id)
+    stream_result = await db.execute(stream_query)
+    stream_row = stream_result.first()
+    
+    if not stream_row:
+        raise HTTPException(status_code=404, detail="Поток не найден")
+    
+    notification_config = stream_row[1]
+    rules = request.rules or parse_rules(
+        notification_config.anti_repeat_rules if notification_config else None
+    )
+    
+    decisions = await AntiRepeatService(db).evaluate(
+        request.student_ids, rules, text=request.message_template
+    )
+    
+    return AntiRepeatCheckResponse(
+        stream_id=stream_id,
+        rules=rules,
+        decisions=list(decisions.values()),
+        allowed_student_ids=[
+            student_id for student_id, decision in decisions.items() if decision.allowed
+        ]
+    )
 
 
 @router.get("/streams/{stream_id}/config", response_model=StreamNotificationConfigResponse)
@@ -466,8 +964,8 @@ async def get_stream_notification_config(
             stream_id=stream_id,
             notification_enabled=True,
             frequency="weekly",
-            day_of_week=1,  # Понедельник
-            time="10:00",
+            day_of_week=DEFAULT_DAY_OF_WEEK,
+            time=DEFAULT_TIME.strftime("%H:%M"),
             student_limit=None,
             language="ru",
             tone="friendly",
@@ -477,23 +975,7 @@ async def get_stream_notification_config(
             updated_at=datetime.now()
         )
     
-    # Конвертируем time в строку для ответа
-    config_dict = {
-        "config_id": config.config_id,
-        "stream_id": config.stream_id,
-        "notification_enabled": config.notification_enabled,
-        "frequency": config.frequency,
-        "day_of_week": config.day_of_week,
-        "time": config.time.strftime("%H:%M") if config.time else None,
-        "student_limit": config.student_limit,
-        "language": config.language,
-        "tone": config.tone,
-        "anti_repeat_rules": config.anti_repeat_rules,
-        "dry_run_enabled": config.dry_run_enabled,
-        "created_at": config.created_at,
-        "updated_at": config.updated_at,
-    }
-    return StreamNotificationConfigResponse(**config_dict)
+    return _config_response(config)
 
 
 @router.put("/streams/{stream_id}/config", response_model=StreamNotificationConfigResponse)
@@ -542,24 +1024,9 @@ async def update_stream_notification_config(
     
     await db.commit()
     await db.refresh(config)
+    notification_scheduler.reschedule(stream_id, config)
     
-    # Конвертируем time в строку для ответа
-    config_dict = {
-        "config_id": config.config_id,
-        "stream_id": config.stream_id,
-        "notification_enabled": config.notification_enabled,
-        "frequency": config.frequency,
-        "day_of_week": config.day_of_week,
-        "time": config.time.strftime("%H:%M") if config.time else None,
-        "student_limit": config.student_limit,
-        "language": config.language,
-        "tone": config.tone,
-        "anti_repeat_rules": config.anti_repeat_rules,
-        "dry_run_enabled": config.dry_run_enabled,
-        "created_at": config.created_at,
-        "updated_at": config.updated_at,
-    }
-    return StreamNotificationConfigResponse(**config_dict)
+    return _config_response(config)
 
 
 @router.post("/streams/{stream_id}/config", response_model=StreamNotificationConfigResponse)
@@ -599,24 +1066,124 @@ async def create_stream_notification_config(
     db.add(config)
     await db.commit()
     await db.refresh(config)
+    notification_scheduler.reschedule(stream_id, config)
     
-    # Конвертируем time в строку для ответа
-    config_dict = {
-        "config_id": config.config_id,
-        "stream_id": config.stream_id,
-        "notification_enabled": config.notification_enabled,
-        "frequency": config.frequency,
-        "day_of_week": config.day_of_week,
-        "time": config.time.strftime("%H:%M") if config.time else None,
-        "student_limit": config.student_limit,
-        "language": config.language,
-        "tone": config.tone,
-        "anti_repeat_rules": config.anti_repeat_rules,
-        "dry_run_enabled": config.dry_run_enabled,
-        "created_at": config.created_at,
-        "updated_at": config.updated_at,
+    return _config_response(config)
+
+
+@router.post("/audit/records", response_model=AuditRecordsResponse, status_code=202)
+async def add_audit_records(request: AuditRecordsRequest):
+    """
+    Добавить записи журнала решений (факты, версия промпта, ответ LLM, решение).
+    
+    Записи попадают в буфер процесса и пишутся в БД пачками, поэтому
+    появляются в выборке с задержкой до AUDIT_FLUSH_INTERVAL_SECONDS.
+    """
+    await audit_buffer.add(request.records)
+    return AuditRecordsResponse(accepted=len(request.records), buffered=len(audit_buffer))
+
+
+@router.get("/audit/streams/{stream_id}", response_model=List[AuditRecordResponse])
+async def get_audit_records(
+    stream_id: int,
+    week_from: date = Query(..., description="Первая неделя (week_start)"),
+    week_to: date = Query(..., description="Последняя неделя (week_start)"),
+    student_id: Optional[int] = Query(None),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Журнал решений потока за диапазон недель"""
+    if week_from > week_to:
+        raise HTTPException(status_code=400, detail="week_from должна быть не позже week_to")
+    
+    return await AuditService(db).get_records(stream_id, week_from, week_to, student_id, limit)
+
+
+@router.get("/audit/export")
+async def export_audit_records(
+    date_from: date = Query(..., description="Первая неделя (week_start)"),
+    date_to: date = Query(..., description="Последняя неделя (week_start)"),
+    stream_id: Optional[int] = Query(None),
+    format: str = Query("csv", pattern="^(csv|parquet)$"),
+    export_id: Optional[str] = Query(
+        None, max_length=64,
+        description="ID для опроса прогресса (по умолчанию генерируется; для Parquet - единственный способ следить за прогрессом)"
+    ),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Выгрузка журнала решений за период в CSV или Parquet.
+    
+    Строки читаются серверным курсором: CSV отдается потоково, Parquet
+    пишется группами строк во временный файл и отдается после записи.
+    Прогресс - GET /rating/audit/exports/{export_id}. Для CSV ID приходит в
+    заголовке X-Export-Id сразу; ответ Parquet начинается только после записи
+    всего файла, поэтому следить за его прогрессом можно лишь по export_id,
+    переданному клиентом. export_id незавершенной выгрузки - 409.
+    """
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from должна быть не позже date_to")
+    
+    total_rows = await AuditExporter(db).count_rows(date_from, date_to, stream_id)
+    try:
+        progress = start_export(format, total_rows, export_id)
+    except ExportIdConflictError as error:
+        raise HTTPException(status_code=409, detail=str(error))
+    filename = f"audit_{date_from}_{date_to}" + (f"_stream{stream_id}" if stream_id else "")
+    headers = {
+        "X-Export-Id": progress.export_id,
+        "X-Total-Rows": str(total_rows),
+    }
+    
+    if format == "parquet":
+        path = await AuditExporter(db).write_parquet(progress, date_from, date_to, stream_id)
+        return FileResponse(
+            path,
+            media_type="application/vnd.apache.parquet",
+            filename=f"{filename}.parquet",
+            headers=headers,
+            background=BackgroundTask(os.unlink, path)
+        )
+    
+    async def generate() -> AsyncIterator[bytes]:
+        # Сессия запроса закрывается до отправки тела, поэтому курсор - в своей сессии
+        async with async_session() as session:
+            async for chunk in AuditExporter(session).csv_chunks(progress, date_from, date_to, stream_id):
+                yield chunk
+    
+    headers["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+    return StreamingResponse(generate(), media_type="text/csv; charset=utf-8", headers=headers)
+
+
+@router.get("/audit/exports/{export_id}")
+async def get_audit_export_progress(export_id: str):
+    """Прогресс выгрузки журнала решений (в этом процессе)"""
+    progress = get_export(export_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Выгрузка не найдена")
+    return progress.to_dict()
+
+
+@router.get("/audit/stats")
+async def get_audit_stats():
+    """Состояние буфера журнала решений процесса"""
+    return audit_buffer.stats()
+
+
+@router.get("/scheduler/upcoming")
+async def get_scheduler_upcoming():
+    """Ближайшие срабатывания встроенного планировщика рассылок (в этом процессе)"""
+    return {
+        "enabled": settings.SCHEDULER_ENABLED,
+        "worker_id": notification_scheduler.worker_id,
+        "upcoming": notification_scheduler.upcoming()
     }
-    return StreamNotificationConfigResponse(**config_dict)
+
+
+@router.get("/cache/stats")
+async def get_rating_cache_stats():
+    """Статистика кэша рейтингов (попадания, промахи, вытеснения)"""
+    return rating_cache.stats()
 
 
 @router.get("/health")
@@ -0,0 +1,66 @@
+"""
+Fan-out of independent work over a pool of database sessions
+
+Каждый из concurrency воркеров держит свою AsyncSession (свое соединение)
+и берет элементы из общей очереди, поэтому запросы разных элементов идут
+параллельно. Ошибка элемента не прерывает остальные: она возвращается в
+результате, а сессия воркера откатывается.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, Iterable, List, Optional, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class FanOutResult(Generic[T, R]):
+    """Результат обработки одного элемента"""
+    item: T
+    result: Optional[R] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+async def fan_out(
+    items: Iterable[T],
+    worker: Callable[[AsyncSession, T], Awaitable[R]],
+    concurrency: Optional[int] = None,
+    session_factory=async_session
+) -> List[FanOutResult[T, R]]:
+    """
+    Выполнить worker(session, item) для всех элементов, не более чем
+    concurrency одновременно. Результаты возвращаются в порядке items.
+    """
+    items = list(items)
+    results: List[Optional[FanOutResult[T, R]]] = [None] * len(items)
+    if not items:
+        return []
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for index, item in enumerate(items):
+        queue.put_nowait((index, item))
+
+    async def run_worker() -> None:
+        async with session_factory() as session:
+            while not queue.empty():
+                index, item = queue.get_nowait()
+                try:
+                    results[index] = FanOutResult(item, result=await worker(session, item))
+                except Exception as error:
+                    await session.rollback()
+                    results[index] = FanOutResult(item, error=error)
+
+    concurrency = max(1, min(concurrency or settings.FANOUT_CONCURRENCY, len(items)))
+    await asyncio.gather(*(run_worker() for _ in range(concurrency)))
+    return results
@@ -3,6 +3,15 @@ from fastapi.responses import RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.admin.views import setup_admin
 from app.api.v1 import students, materials, messages, rating
+from app.services.rating_cache import register_cache_invalidation
+from app.services.rollup_service import register_rollup_listeners
+from app.services.streams_config_cache import register_streams_config_invalidation
+from app.services.fingerprint_service import register_fingerprint_index_updates
+from app.services.notification_worker import NotificationWorker
+from app.services.notification_scheduler import notification_scheduler
+from app.services.audit_service import audit_buffer
+from app.core.config import settings
+import asyncio
 
 app = FastAPI(
     title="AI Tutor API",
@@ -19,6 +28,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Счетчики и кэши обновляются при каждой записи через ORM
+register_rollup_listeners()
+register_cache_invalidation()
+register_streams_config_invalidation()
+register_fingerprint_index_updates()
+
+# Фоновые задачи: воркер доставки уведомлений (можно запускать отдельно:
+# scripts/run_notification_worker.py), планировщик рассылок по конфигурациям
+# потоков и запись буфера журнала решений
+background_tasks_stop = asyncio.Event()
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    app.state.audit_flush_task = asyncio.create_task(
+        audit_buffer.run_forever(background_tasks_stop)
+    )
+    if settings.NOTIFICATION_WORKER_ENABLED:
+        app.state.notification_worker_task = asyncio.create_task(
+            NotificationWorker().run_forever(background_tasks_stop)
+        )
+    if settings.SCHEDULER_ENABLED:
+        app.state.notification_scheduler_task = asyncio.create_task(
+            notification_scheduler.run_forever(background_tasks_stop)
+        )
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    background_tasks_stop.set()
+    for name in ("notification_worker_task", "notification_scheduler_task", "audit_flush_task"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            await task
+
 # Подключение API роутеров
 app.include_router(students.router, prefix="/api/v1")
 app.include_router(materials.router, prefix="/api/v1")
@@ -7,9 +7,10 @@ Updated for PostgreSQL with full schema support
 from datetime import datetime, date, time as dt_time
 from typing import Optional, List, Dict
 from sqlalchemy import (
-    Column, BigInteger, String, Text, Boolean, DateTime, Date, Time,
-    ForeignKey, Table, Enum as SQLEnum, Integer, CheckConstraint, Index, JSON
+    DDL, event, Column, BigInteger, String, Text, Boolean, DateTime, Date, Time,
+    ForeignKey, Table, Enum as SQLEnum, Integer, CheckConstraint, Index, JSON, Float, Computed
 )
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -185,6 +186,9 @@ class CourseMaterial(Base):
     __table_args__ = (
         Index('idx_course_materials_lesson_id', 'lesson_id'),
         Index('idx_course_materials_material_type', 'material_type'),
+        # Триграммные индексы (pg_trgm): ILIKE '%...%' и поиск похожих строк
+        Index('idx_course_materials_title_trgm', 'title', postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}),
+        Index('idx_course_materials_content_trgm', 'content', postgresql_using='gin', postgresql_ops={'content': 'gin_trgm_ops'}),
     )
 
 
@@ -200,6 +204,12 @@ class Message(Base):
     text_content: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     attachment_url: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+    # Полнотекстовый поиск (генерируется из text_content, не загружается вместе с сообщением)
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR,
+        Computed("to_tsvector('russian'::regconfig, coalesce(text_content, ''))", persisted=True),
+        deferred=True
+    )
     
     # Relationships
     # student: Mapped[Optional["Student"]] = relationship("Student", primaryjoin="Message.sender_id == Student.student_id", back_populates="messages")
@@ -209,6 +219,13 @@ class Message(Base):
     __table_args__ = (
         Index('idx_messages_chat_id', 'chat_id'),
         Index('idx_messages_telegram_message_id', 'telegram_message_id'),
+        Index('idx_messages_chat_sender', 'chat_id', 'sender_id'),
+        # Keyset пагинация по (created_at, message_id)
+        Index('idx_messages_created_id', 'created_at', 'message_id'),
+        Index('idx_messages_chat_created_id', 'chat_id', 'created_at', 'message_id'),
+        Index('idx_messages_sender_created_id', 'sender_id', 'sender_type', 'created_at', 'message_id'),
+        Index('idx_messages_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('idx_messages_text_content_trgm', 'text_content', postgresql_using='gin', postgresql_ops={'text_content': 'gin_trgm_ops'}),
     )
 
 
@@ -224,6 +241,10 @@ class BotResponse(Base):
     
     # Relationships
     message: Mapped["Message"] = relationship("Message", back_populates="bot_responses")
+    
+    __table_args__ = (
+        Index('idx_bot_responses_message_created', 'message_id', 'created_at'),
+    )
 
 
 class Meeting(Base):
@@ -353,6 +374,222 @@ class StreamNotificationConfig(Base):
     )
 
 
+class StudentWeeklyFacts(Base):
+    """Материализованные факты студента за закрытую ISO неделю"""
+    __tablename__ = "student_weekly_facts"
+    
+    student_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('students.student_id', ondelete='CASCADE'), primary_key=True)
+    iso_year: Mapped[int] = mapped_column(Integer, primary_key=True)
+    iso_week: Mapped[int] = mapped_column(Integer, primary_key=True)
+    week_start: Mapped[date] = mapped_column(Date, nullable=False)  # Понедельник недели
+    week_end: Mapped[date] = mapped_column(Date, nullable=False)  # Воскресенье недели
+    
+    # Задания
+    assignments_total: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    assignments_completed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    assignments_on_time: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    assignments_late: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    average_grade: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
+    
+    # Активность
+    messages_sent: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    questions_asked: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_activity: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    
+    # Посещаемость
+    scheduled_classes: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    attended: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    
+    refreshed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_student_weekly_facts_week', 'iso_year', 'iso_week'),
+    )
+
+
+class StudentDailyCounter(Base):
+    """Счетчики активности и заданий студента за день (обновляются при записи)"""
+    __tablename__ = "student_daily_counters"
+    
+    # Без FK: sender_id сообщения не обязательно есть в students
+    student_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    
+    # Сообщения студента
+    messages_sent: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    questions_asked: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_activity: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    
+    # Задания, созданные в этот день
+    assignments_total: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    assignments_completed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    assignments_on_time: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    assignments_late: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    grade_sum: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    grade_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class ChatCounter(Base):
+    """Счетчики сообщений чата (обновляются при записи)"""
+    __tablename__ = "chat_counters"
+    
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    total_messages: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    user_messages: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    bot_messages: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    active_users: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_activity: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class StudentRatingHistory(Base):
+    """Недельный рейтинг студента (история для трендов)"""
+    __tablename__ = "student_rating_history"
+    
+    student_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('students.student_id', ondelete='CASCADE'), primary_key=True)
+    week_start: Mapped[date] = mapped_column(Date, primary_key=True)  # Понедельник недели
+    week_end: Mapped[date] = mapped_column(Date, nullable=False)
+    weekly_score: Mapped[float] = mapped_column(Float, nullable=False)
+    assignment_score: Mapped[float] = mapped_column(Float, nullable=False)
+    activity_score: Mapped[float] = mapped_column(Float, nullable=False)
+    attendance_score: Mapped[float] = mapped_column(Float, nullable=False)
+    engagement_score: Mapped[float] = mapped_column(Float, nullable=False)
+    category: Mapped[str] = mapped_column(String(20), nullable=False)
+    calculated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_student_rating_history_week', 'week_start'),
+    )
+
+
+class NotificationLog(Base):
+    """Журнал отправленных студентам уведомлений (для правил антиповтора)"""
+    __tablename__ = "notification_log"
+    
+    log_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, index=True)
+    student_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('students.student_id', ondelete='CASCADE'), nullable=False)
+    stream_id: Mapped[Optional[int]] = mapped_column(BigInteger, ForeignKey('streams.stream_id', ondelete='SET NULL'), nullable=True)
+    notification_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=False)  # sha256 нормализованного текста
+    sent_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+    
+    # Indexes
+    __table_args__ = (
+        # Проверка антиповтора по группе читает только индекс
+        Index('idx_notification_log_student_sent', 'student_id', 'sent_at', postgresql_include=['content_hash']),
+    )
+
+
+class MessageFingerprint(Base):
+    """SimHash подписи текстов уведомлений потока (поиск почти-дубликатов)"""
+    __tablename__ = "message_fingerprints"
+    
+    fingerprint_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, index=True)
+    stream_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('streams.stream_id', ondelete='CASCADE'), nullable=False)
+    student_id: Mapped[Optional[int]] = mapped_column(BigInteger, ForeignKey('students.student_id', ondelete='SET NULL'), nullable=True)
+    source: Mapped[str] = mapped_column(String(20), nullable=False)  # generated, sent
+    simhash: Mapped[int] = mapped_column(BigInteger, nullable=False)  # 64 бита (со знаком)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_message_fingerprints_stream', 'stream_id', 'fingerprint_id'),
+    )
+
+
+class NotificationOutbox(Base):
+    """Очередь уведомлений на доставку в Telegram (outbox)"""
+    __tablename__ = "notification_outbox"
+    
+    outbox_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, index=True)
+    student_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('students.student_id', ondelete='CASCADE'), nullable=False)
+    stream_id: Mapped[Optional[int]] = mapped_column(BigInteger, ForeignKey('streams.stream_id', ondelete='SET NULL'), nullable=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)  # telegram_user_id студента
+    notification_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[str] = mapped_column(String(20), default="pending", nullable=False)  # pending, sending, sent, failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+    locked_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_notification_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+
+class IdempotencyKey(Base):
+    """Ключи идемпотентности запросов (повтор возвращает сохраненный ответ)"""
+    __tablename__ = "idempotency_keys"
+    
+    scope: Mapped[str] = mapped_column(String(50), primary_key=True)  # Эндпоинт, например notifications.send
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)  # sha256 тела запроса
+    response: Mapped[Optional[Dict]] = mapped_column(JSON, nullable=True)  # None - запрос еще выполняется
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+
+
+class ScheduledRun(Base):
+    """Срабатывания встроенного планировщика рассылок (аренда на поток и время)"""
+    __tablename__ = "scheduled_runs"
+    
+    stream_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('streams.stream_id', ondelete='CASCADE'), primary_key=True)
+    fire_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    status: Mapped[str] = mapped_column(String(20), default="running", nullable=False)  # running, done, skipped, failed
+    worker_id: Mapped[str] = mapped_column(String(100), nullable=False)  # host:pid процесса, взявшего аренду
+    lease_expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    queued_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class DryRunAudit(Base):
+    """Сухие прогоны еженедельной рассылки потока (трасса этапов, без отправки)"""
+    __tablename__ = "dry_run_audits"
+    
+    audit_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, index=True)
+    stream_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('streams.stream_id', ondelete='CASCADE'), nullable=False)
+    week_start: Mapped[date] = mapped_column(Date, nullable=False)
+    week_end: Mapped[date] = mapped_column(Date, nullable=False)
+    stages: Mapped[List] = mapped_column(JSON, nullable=False)  # [{name, elapsed_ms, queries, rows_in, rows_out}]
+    total_ms: Mapped[float] = mapped_column(Float, nullable=False)
+    total_queries: Mapped[int] = mapped_column(Integer, nullable=False)
+    recipients_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+    
+    __table_args__ = (
+        Index('idx_dry_run_audits_stream_created', 'stream_id', 'created_at'),
+    )
+
+
+class RatingDecisionAudit(Base):
+    """Журнал решений по студентам за неделю (только добавление, пишется пачками)"""
+    __tablename__ = "rating_decision_audits"
+    
+    audit_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, index=True)
+    # Без внешних ключей: журнал хранится и после удаления потока или студента
+    stream_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    student_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    week_start: Mapped[date] = mapped_column(Date, nullable=False)
+    facts: Mapped[Dict] = mapped_column(JSONB, nullable=False)  # Входные факты недели
+    weekly_score: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    prompt_version: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    message_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Ответ LLM (n8n) или встроенный шаблон
+    decision: Mapped[str] = mapped_column(String(20), nullable=False)  # selected, skipped
+    reason: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # Причина пропуска
+    source: Mapped[str] = mapped_column(String(20), nullable=False)  # n8n, scheduler
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+    
+    __table_args__ = (
+        Index('idx_rating_decision_audits_stream_week', 'stream_id', 'week_start', 'student_id'),
+    )
+
+
 class FAQResponse(Base):
     """FAQ responses table (optional)"""
     __tablename__ = "faq_responses"
@@ -363,4 +600,13 @@ class FAQResponse(Base):
     question: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     answer_text: Mapped[str] = mapped_column(Text, nullable=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
\ No newline at end of file
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+
+
+# Триграммные индексы (gin_trgm_ops) требуют pg_trgm: create_all (scripts/create_tables.py,
+# scripts/auto_setup.py) создает расширение сам, как и миграция c2f8a5d7e1b3
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
@@ -61,6 +61,22 @@ class MessageListResponse(BaseModel):
     total: int = Field(..., description="Общее количество сообщений")
     page: int = Field(..., description="Текущая страница")
     size: int = Field(..., description="Размер страницы")
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы (None - страница последняя)")
+
+
+class MessageSearchResult(MessageWithResponse):
+    """Найденное сообщение"""
+    rank: Optional[float] = Field(None, description="Релевантность (ts_rank или word_similarity; None для substring)")
+    snippet: Optional[str] = Field(None, description="Фрагмент текста с выделенными совпадениями (<b>...</b>, только fulltext)")
+
+
+class MessageSearchResponse(BaseModel):
+    """Результаты поиска сообщений"""
+    messages: List[MessageSearchResult]
+    total: int = Field(..., description="Количество совпадений (не больше MESSAGE_SEARCH_COUNT_CAP)")
+    total_capped: bool = Field(..., description="Совпадений больше, чем total")
+    page: int = Field(..., description="Текущая страница")
+    size: int = Field(..., description="Размер страницы")
 
 
 class ChatStats(BaseModel):
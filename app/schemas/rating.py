@@ -49,6 +49,8 @@ class RatingCalculationResponse(BaseModel):
     """Ответ на расчет рейтинга"""
     ratings: List[WeeklyRating]
     total_students: int
+    missing_student_ids: List[int] = Field(default_factory=list, description="ID студентов, не найденных в БД")
+    timings_ms: Dict[str, float] = Field(default_factory=dict, description="Время этапов расчета (мс)")
     calculated_at: datetime = Field(default_factory=datetime.now)
 
 
@@ -115,13 +117,19 @@ class N8nNotificationRequest(BaseModel):
     notification_type: str = Field(..., description="Тип уведомления")
     send_immediately: bool = False
     scheduled_time: Optional[datetime] = None
+    idempotency_key: Optional[str] = Field(
+        None, max_length=255, description="Ключ повтора (альтернатива заголовку Idempotency-Key)"
+    )
 
 
 class N8nNotificationResponse(BaseModel):
     """Ответ на отправку уведомлений"""
     success: bool
-    sent_count: int
+    sent_count: int = Field(..., description="Поставлено в очередь доставки")
     failed_count: int
+    skipped_student_ids: List[int] = Field(default_factory=list, description="Пропущены правилами антиповтора")
+    outbox_ids: List[int] = Field(default_factory=list, description="Строки очереди доставки")
+    near_duplicate_distance: Optional[int] = Field(None, description="Расстояние до похожего недавнего текста потока")
     errors: List[str] = Field(default_factory=list)
     sent_at: datetime = Field(default_factory=datetime.now)
 
@@ -154,4 +162,199 @@ class StreamStudentsFactsResponse(BaseModel):
     week_end: date
     students_facts: List[StudentFacts] = Field(..., description="Факты для каждого студента")
     total_students: int
-    active_students: int
\ No newline at end of file
+    active_students: int
+
+class RatingHistoryPoint(BaseModel):
+    """Рейтинг студента за одну неделю истории"""
+    model_config = ConfigDict(from_attributes=True)
+    
+    week_start: date
+    week_end: date
+    weekly_score: float
+    assignment_score: float
+    activity_score: float
+    attendance_score: float
+    engagement_score: float
+    category: str
+    score_change: Optional[float] = Field(None, description="Изменение рейтинга к предыдущей неделе")
+
+
+class RatingHistoryResponse(BaseModel):
+    """История недельных рейтингов студента"""
+    student_id: int
+    points: List[RatingHistoryPoint] = Field(..., description="Недели по возрастанию")
+    total_weeks: int
+
+
+class WeeklyRunRequest(BaseModel):
+    """Запрос общего еженедельного прогона (n8n Cron)"""
+    week_start: Optional[date] = Field(None, description="Начало недели (по умолчанию - прошлая неделя)")
+    week_end: Optional[date] = Field(None, description="Конец недели")
+    stream_ids: Optional[List[int]] = Field(None, description="Потоки без проверки расписания")
+    window_minutes: int = Field(60, ge=1, le=1440, description="Окно срабатывания (минуты до текущего момента)")
+    config: Optional[RatingConfig] = None
+
+
+class WeeklyRunStudent(BaseModel):
+    """Факты и рейтинг студента в прогоне"""
+    facts: StudentFacts
+    rating: WeeklyRating
+
+
+class WeeklyRunStream(BaseModel):
+    """Поток в еженедельном прогоне"""
+    stream_id: int
+    name: str
+    notification_settings: Dict[str, Any] = Field(default_factory=dict)
+    total_students: int
+    active_students: int
+    students: List[WeeklyRunStudent]
+
+
+class WeeklyRunResponse(BaseModel):
+    """Результат общего еженедельного прогона"""
+    run_at: datetime
+    week_start: date
+    week_end: date
+    streams: List[WeeklyRunStream]
+    total_streams: int
+    total_students: int = Field(..., description="Уникальные активные студенты всех потоков")
+    timings_ms: Dict[str, float] = Field(default_factory=dict, description="Время этапов расчета (мс)")
+
+
+class StreamRecipientsResponse(BaseModel):
+    """Отобранные по рейтингу студенты потока"""
+    stream_id: int
+    week_start: date
+    week_end: date
+    order: str = Field(..., description="top - лучшие, bottom - худшие")
+    limit: Optional[int] = Field(None, description="Размер выборки (None - все студенты)")
+    total_candidates: int = Field(..., description="Активные студенты потока")
+    recipients: List[WeeklyRating]
+
+
+class AntiRepeatRules(BaseModel):
+    """Правила антиповтора (StreamNotificationConfig.anti_repeat_rules)"""
+    min_days_between: Optional[int] = Field(None, ge=0, description="Минимум дней между уведомлениями студенту")
+    max_repeats_per_week: Optional[int] = Field(None, ge=0, description="Максимум уведомлений студенту за 7 дней")
+    content_repeat_days: Optional[int] = Field(None, ge=0, description="Не повторять тот же текст N дней (None - никогда)")
+
+
+class AntiRepeatCheckRequest(BaseModel):
+    """Проверка антиповтора для группы кандидатов"""
+    student_ids: List[int]
+    message_template: Optional[str] = Field(None, description="Текст для проверки повтора")
+    rules: Optional[AntiRepeatRules] = Field(None, description="Правила (по умолчанию - из конфигурации потока)")
+
+
+class AntiRepeatDecision(BaseModel):
+    """Решение антиповтора по студенту"""
+    student_id: int
+    allowed: bool
+    reasons: List[str] = Field(default_factory=list)
+    last_sent_at: Optional[datetime] = None
+    sent_last_week: int = 0
+    content_already_sent: bool = False
+
+
+class AntiRepeatCheckResponse(BaseModel):
+    """Результат проверки антиповтора"""
+    stream_id: int
+    rules: AntiRepeatRules
+    decisions: List[AntiRepeatDecision]
+    allowed_student_ids: List[int]
+
+
+class FingerprintCheckRequest(BaseModel):
+    """Проверка текста на почти-дубликаты в потоке"""
+    text: str = Field(..., min_length=1)
+
+
+class NearDuplicateMatch(BaseModel):
+    """Похожий текст из последних сообщений потока"""
+    fingerprint_id: int
+    student_id: Optional[int] = None
+    distance: int = Field(..., description="Расстояние Хэмминга между SimHash подписями")
+
+
+class FingerprintCheckResponse(BaseModel):
+    """Результат проверки на почти-дубликаты"""
+    stream_id: int
+    is_near_duplicate: bool
+    matches: List[NearDuplicateMatch]
+    elapsed_ms: float
+
+
+class DryRunRequest(BaseModel):
+    """Запрос сухого прогона еженедельной рассылки потока"""
+    week_start: Optional[date] = Field(None, description="Начало недели (по умолчанию прошлая)")
+    week_end: Optional[date] = None
+    config: Optional[RatingConfig] = None
+    limit: Optional[int] = Field(None, ge=1, description="Размер выборки (по умолчанию student_limit потока)")
+    lowest: bool = Field(False, description="Выбирать худших вместо лучших")
+
+
+class DryRunStage(BaseModel):
+    """Этап сухого прогона"""
+    name: str
+    elapsed_ms: float
+    queries: int = Field(..., description="Запросов к БД на этапе")
+    rows_in: int
+    rows_out: int
+
+
+class DryRunMessage(BaseModel):
+    """Сообщение, которое было бы поставлено в очередь"""
+    student_id: int
+    weekly_score: float
+    category: str
+    chat_id: Optional[int] = None
+    message: str
+    near_duplicate_distance: Optional[int] = None
+
+
+class DryRunResponse(BaseModel):
+    """Трасса сухого прогона: этапы, время, запросы, строки"""
+    stream_id: int
+    week_start: date
+    week_end: date
+    audit_id: int
+    dry_run_enabled: bool = Field(..., description="Флаг сухого прогона в конфигурации потока")
+    stages: List[DryRunStage]
+    total_ms: float
+    total_queries: int
+    messages: List[DryRunMessage]
+
+
+class AuditRecord(BaseModel):
+    """Запись журнала решений по студенту за неделю"""
+    stream_id: int
+    student_id: int
+    week_start: date
+    facts: Dict[str, Any] = Field(..., description="Входные факты недели")
+    weekly_score: Optional[float] = None
+    prompt_version: Optional[str] = Field(None, max_length=50)
+    message_text: Optional[str] = Field(None, description="Ответ LLM или текст шаблона")
+    decision: str = Field(..., description="selected, skipped")
+    reason: Optional[str] = Field(None, max_length=100, description="Причина пропуска")
+    source: str = Field("n8n", max_length=20)
+
+
+class AuditRecordsRequest(BaseModel):
+    """Пачка записей журнала решений (от n8n)"""
+    records: List[AuditRecord] = Field(..., max_length=5000)
+
+
+class AuditRecordsResponse(BaseModel):
+    """Результат приема записей журнала"""
+    accepted: int
+    buffered: int = Field(..., description="Записей в буфере процесса, ожидающих записи в БД")
+
+
+class AuditRecordResponse(AuditRecord):
+    """Сохраненная запись журнала решений"""
+    model_config = ConfigDict(from_attributes=True)
+
+    audit_id: int
+    created_at: datetime
+
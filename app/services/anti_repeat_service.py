@@ -0,0 +1,159 @@
+"""
+Anti-repeat service: notification log and cohort-wide repeat checks
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.education import NotificationLog
+from app.schemas.rating import AntiRepeatDecision, AntiRepeatRules
+
+
+def content_hash(text: str) -> str:
+    """sha256 текста без учета регистра и лишних пробелов"""
+    normalized = " ".join(text.split()).lower()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def parse_rules(raw_rules: Optional[Dict]) -> AntiRepeatRules:
+    """Разобрать anti_repeat_rules из конфигурации (неизвестные ключи игнорируются)"""
+    return AntiRepeatRules.model_validate(raw_rules or {})
+
+
+class AntiRepeatService:
+    """Сервис журнала уведомлений и правил антиповтора"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def evaluate(
+        self,
+        student_ids: List[int],
+        rules: AntiRepeatRules,
+        text: Optional[str] = None,
+        now: Optional[datetime] = None
+    ) -> Dict[int, AntiRepeatDecision]:
+        """
+        Проверить правила антиповтора сразу для всей группы кандидатов.
+
+        Один GROUP BY запрос по индексу (student_id, sent_at) журнала,
+        без запросов по каждому студенту.
+        """
+        student_ids = list(dict.fromkeys(student_ids))
+        if not student_ids:
+            return {}
+
+        now = now or datetime.now(timezone.utc)
+        week_since = now - timedelta(days=7)
+        hash_value = content_hash(text) if text else None
+
+        # Нижняя граница журнала: самое длинное окно среди правил (None - вся история)
+        windows = [7]
+        if rules.min_days_between is not None:
+            windows.append(rules.min_days_between)
+        if hash_value is not None:
+            windows.append(rules.content_repeat_days)
+        since = None if None in windows else now - timedelta(days=max(windows))
+
+        content_since = (
+            now - timedelta(days=rules.content_repeat_days)
+            if rules.content_repeat_days is not None else None
+        )
+        content_filter = NotificationLog.content_hash == hash_value
+        if content_since is not None:
+            content_filter = and_(content_filter, NotificationLog.sent_at >= content_since)
+
+        query = select(
+            NotificationLog.student_id,
+            func.max(NotificationLog.sent_at).label('last_sent_at'),
+            func.count().filter(
+                NotificationLog.sent_at >= week_since
+            ).label('sent_last_week'),
+            (
+                func.bool_or(content_filter) if hash_value is not None
+                else literal(False)
+            ).label('content_already_sent')
+        ).where(
+            NotificationLog.student_id.in_(student_ids)
+        ).group_by(NotificationLog.student_id)
+
+        if since is not None:
+            query = query.where(NotificationLog.sent_at >= since)
+
+        result = await self.db.execute(query)
+        rows = {row.student_id: row for row in result}
+
+        decisions = {}
+        for student_id in student_ids:
+            row = rows.get(student_id)
+            last_sent_at = row.last_sent_at if row else None
+            sent_last_week = (row.sent_last_week or 0) if row else 0
+            content_already_sent = bool(row.content_already_sent) if row else False
+
+            reasons = []
+            if (
+                rules.min_days_between is not None and last_sent_at is not None
+                and last_sent_at > now - timedelta(days=rules.min_days_between)
+            ):
+                reasons.append(f"Уведомление уже было менее {rules.min_days_between} дн. назад")
+            if rules.max_repeats_per_week is not None and sent_last_week >= rules.max_repeats_per_week:
+                reasons.append(f"Достигнут лимит {rules.max_repeats_per_week} уведомл. за неделю")
+            if content_already_sent:
+                reasons.append("Этот текст уже отправлялся студенту")
+
+            decisions[student_id] = AntiRepeatDecision(
+                student_id=student_id,
+                allowed=not reasons,
+                reasons=reasons,
+                last_sent_at=last_sent_at,
+                sent_last_week=sent_last_week,
+                content_already_sent=content_already_sent
+            )
+
+        return decisions
+
+    async def record(
+        self,
+        student_ids: List[int],
+        notification_type: str,
+        text: str,
+        stream_id: Optional[int] = None
+    ) -> int:
+        """Добавить отправленные уведомления в журнал (одной вставкой, без commit)"""
+        return await self.record_messages(
+            [(student_id, text) for student_id in student_ids],
+            notification_type,
+            stream_id=stream_id
+        )
+
+    async def record_messages(
+        self,
+        messages: List[Tuple[int, str]],
+        notification_type: str,
+        stream_id: Optional[int] = None
+    ) -> int:
+        """
+        Добавить в журнал персональные уведомления [(student_id, текст)].
+
+        Не фиксирует транзакцию: журнал должен попасть в БД тем же commit,
+        что и поставленные в очередь сообщения.
+        """
+        if not messages:
+            return 0
+
+        await self.db.execute(
+            insert(NotificationLog),
+            [
+                {
+                    'student_id': student_id,
+                    'stream_id': stream_id,
+                    'notification_type': notification_type,
+                    'content_hash': content_hash(text),
+                }
+                for student_id, text in messages
+            ]
+        )
+        return len(messages)
@@ -0,0 +1,241 @@
+"""
+Streaming export of rating_decision_audits as CSV or Parquet
+
+Строки читаются серверным курсором (AsyncSession.stream + yield_per)
+пачками по EXPORT_BATCH_SIZE и сразу пишутся в ответ: CSV - кусками
+потокового ответа, Parquet - группами строк во временный файл, который
+затем отдается целиком. Весь результат в памяти не держится.
+
+Прогресс выгрузки (строк записано из общего числа) доступен по
+export_id, пока процесс жив.
+"""
+import asyncio
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import date
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.education import RatingDecisionAudit
+
+
+# Строк на одну пачку курсора (и на одну группу строк Parquet)
+EXPORT_BATCH_SIZE = 10000
+
+# Сколько секунд хранить прогресс завершенных выгрузок
+EXPORT_PROGRESS_TTL_SECONDS = 3600
+
+EXPORT_COLUMNS = (
+    'audit_id', 'stream_id', 'student_id', 'week_start', 'weekly_score',
+    'decision', 'reason', 'prompt_version', 'source', 'created_at',
+    'facts', 'message_text'
+)
+
+
+@dataclass
+class ExportProgress:
+    """Прогресс выгрузки"""
+    export_id: str
+    format: str
+    total_rows: int
+    rows_written: int = 0
+    finished: bool = False
+    error: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data['percent'] = round(100 * self.rows_written / self.total_rows, 1) if self.total_rows else 100.0
+        return data
+
+
+class ExportIdConflictError(ValueError):
+    """export_id занят незавершенной выгрузкой"""
+
+
+# Выгрузки процесса (export_id -> прогресс)
+_exports: Dict[str, ExportProgress] = {}
+
+
+def start_export(export_format: str, total_rows: int, export_id: Optional[str] = None) -> ExportProgress:
+    """
+    Зарегистрировать выгрузку (и забыть давно завершенные).
+
+    Переданный export_id можно использовать повторно только после завершения
+    выгрузки с этим ID, иначе - ExportIdConflictError.
+    """
+    existing = _exports.get(export_id) if export_id else None
+    if existing is not None and not existing.finished:
+        raise ExportIdConflictError(f"Выгрузка {export_id} еще не завершена")
+
+    now = time.time()
+    for stale_id, stale in list(_exports.items()):
+        if stale.finished_at is not None and now - stale.finished_at > EXPORT_PROGRESS_TTL_SECONDS:
+            del _exports[stale_id]
+
+    progress = ExportProgress(
+        export_id=export_id or uuid.uuid4().hex, format=export_format, total_rows=total_rows
+    )
+    _exports[progress.export_id] = progress
+    return progress
+
+
+def get_export(export_id: str) -> Optional[ExportProgress]:
+    return _exports.get(export_id)
+
+
+def _finish(progress: ExportProgress, error: Optional[str] = None) -> None:
+    progress.finished = True
+    progress.error = error
+    progress.finished_at = time.time()
+
+
+class AuditExporter:
+    """Выгрузка журнала решений за период"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    @staticmethod
+    def _filters(date_from: date, date_to: date, stream_id: Optional[int]):
+        conditions = [
+            RatingDecisionAudit.week_start >= date_from,
+            RatingDecisionAudit.week_start <= date_to
+        ]
+        if stream_id is not None:
+            conditions.append(RatingDecisionAudit.stream_id == stream_id)
+        return and_(*conditions)
+
+    async def count_rows(self, date_from: date, date_to: date, stream_id: Optional[int] = None) -> int:
+        query = select(func.count()).select_from(RatingDecisionAudit).where(
+            self._filters(date_from, date_to, stream_id)
+        )
+        return (await self.db.execute(query)).scalar_one()
+
+    async def iter_batches(
+        self,
+        date_from: date,
+        date_to: date,
+        stream_id: Optional[int] = None
+    ) -> AsyncIterator[Sequence]:
+        """Пачки строк (в порядке EXPORT_COLUMNS) с серверного курсора"""
+        query = select(
+            *(getattr(RatingDecisionAudit, column) for column in EXPORT_COLUMNS)
+        ).where(
+            self._filters(date_from, date_to, stream_id)
+        ).order_by(
+            RatingDecisionAudit.stream_id,
+            RatingDecisionAudit.week_start,
+            RatingDecisionAudit.student_id,
+            RatingDecisionAudit.audit_id
+        ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+        result = await self.db.stream(query)
+        async for batch in result.partitions():
+            yield batch
+
+    async def csv_chunks(
+        self,
+        progress: ExportProgress,
+        date_from: date,
+        date_to: date,
+        stream_id: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """CSV (UTF-8 с BOM для Excel) кусками по одной пачке курсора"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write("\ufeff")
+        writer.writerow(EXPORT_COLUMNS)
+        # Клиент может оборвать загрузку - тогда генератор закрывается посреди цикла
+        error = "Выгрузка прервана"
+        try:
+            async for batch in self.iter_batches(date_from, date_to, stream_id):
+                for row in batch:
+                    writer.writerow(_csv_values(row))
+                progress.rows_written += len(batch)
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode("utf-8")
+            error = None
+        except Exception as exc:
+            error = str(exc)
+            raise
+        finally:
+            _finish(progress, error)
+
+    async def write_parquet(
+        self,
+        progress: ExportProgress,
+        date_from: date,
+        date_to: date,
+        stream_id: Optional[int] = None
+    ) -> str:
+        """Записать Parquet во временный файл (группа строк на пачку курсора); вернуть путь"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([
+            ('audit_id', pa.int64()),
+            ('stream_id', pa.int64()),
+            ('student_id', pa.int64()),
+            ('week_start', pa.date32()),
+            ('weekly_score', pa.float64()),
+            ('decision', pa.string()),
+            ('reason', pa.string()),
+            ('prompt_version', pa.string()),
+            ('source', pa.string()),
+            ('created_at', pa.timestamp('us', tz='UTC')),
+            ('facts', pa.string()),
+            ('message_text', pa.string()),
+        ])
+
+        file_descriptor, path = tempfile.mkstemp(suffix=".parquet", prefix="audit_export_")
+        os.close(file_descriptor)
+        def write_batch(writer, batch: Sequence) -> None:
+            columns = list(zip(*batch))
+            columns[EXPORT_COLUMNS.index('facts')] = [
+                _facts_json(facts) for facts in columns[EXPORT_COLUMNS.index('facts')]
+            ]
+            table = pa.Table.from_arrays(
+                [pa.array(values, type=schema.field(index).type) for index, values in enumerate(columns)],
+                schema=schema
+            )
+            writer.write_table(table)
+
+        # Сборка, сжатие и запись групп строк идут в пуле потоков, не блокируя event loop
+        try:
+            writer = await asyncio.to_thread(pq.ParquetWriter, path, schema, compression="zstd")
+            try:
+                async for batch in self.iter_batches(date_from, date_to, stream_id):
+                    await asyncio.to_thread(write_batch, writer, batch)
+                    progress.rows_written += len(batch)
+            finally:
+                await asyncio.to_thread(writer.close)
+        except Exception as error:
+            os.unlink(path)
+            _finish(progress, str(error))
+            raise
+        _finish(progress)
+        return path
+
+
+def _facts_json(facts) -> str:
+    return json.dumps(facts, ensure_ascii=False, separators=(",", ":"))
+
+
+def _csv_values(row) -> List:
+    values = list(row)
+    facts_index = EXPORT_COLUMNS.index('facts')
+    values[facts_index] = _facts_json(values[facts_index])
+    return values
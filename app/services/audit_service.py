@@ -0,0 +1,187 @@
+"""
+Rating decision audit: buffered, batched writes to rating_decision_audits
+
+Запись журнала на каждый HTTP вызов не масштабируется, поэтому записи
+копятся в буфере процесса и пишутся пачками через COPY (asyncpg
+copy_records_to_table) - при заполнении пачки или раз в
+AUDIT_FLUSH_INTERVAL_SECONDS. Записи, не успевшие попасть в БД до
+падения процесса, теряются; при штатной остановке буфер сбрасывается.
+"""
+import asyncio
+import json
+import logging
+from datetime import date
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.models.education import RatingDecisionAudit
+from app.schemas.rating import AuditRecord
+from app.schemas.student import StudentFacts
+
+
+logger = logging.getLogger(__name__)
+
+_COPY_COLUMNS = (
+    'stream_id', 'student_id', 'week_start', 'facts', 'weekly_score',
+    'prompt_version', 'message_text', 'decision', 'reason', 'source'
+)
+
+
+def compact_facts(facts: StudentFacts) -> dict:
+    """Факты без полей, которые уже есть в колонках записи"""
+    return facts.model_dump(mode="json", exclude={'student_id', 'week_start', 'week_end'})
+
+
+def _to_row(record: AuditRecord) -> Tuple:
+    return (
+        record.stream_id,
+        record.student_id,
+        record.week_start,
+        json.dumps(record.facts, ensure_ascii=False, separators=(",", ":")),
+        record.weekly_score,
+        record.prompt_version,
+        record.message_text,
+        record.decision,
+        record.reason,
+        record.source,
+    )
+
+
+class AuditBuffer:
+    """Буфер записей журнала решений с пакетной записью"""
+
+    def __init__(
+        self,
+        session_factory=async_session,
+        batch_size: Optional[int] = None,
+        max_size: Optional[int] = None
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.AUDIT_BATCH_SIZE
+        self.max_size = max_size or settings.AUDIT_BUFFER_MAX
+        self._records: List[AuditRecord] = []
+        self._flush_lock = asyncio.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    async def add(self, records: List[AuditRecord]) -> None:
+        """
+        Добавить записи; при наборе полной пачки - записать.
+
+        Пока идет запись, новые записи копятся до max_size; дальше add ждет
+        окончания записи (обратное давление на вызывающего), а если БД
+        недоступна - старые записи сверх max_size отбрасываются.
+        """
+        self._records.extend(records)
+        if len(self._records) < self.batch_size:
+            return
+        if self._flush_lock.locked() and len(self._records) < self.max_size:
+            # Идущая запись заберет и эти записи
+            return
+        try:
+            await self.flush()
+        except Exception:
+            # Записи остались в буфере, их допишет run_forever
+            logger.exception("Ошибка записи журнала решений, в буфере %s записей", len(self))
+        self._trim()
+
+    def _trim(self) -> None:
+        """Отбросить самые старые записи сверх max_size"""
+        overflow = len(self._records) - self.max_size
+        if overflow > 0:
+            del self._records[:overflow]
+            self.dropped += overflow
+
+    async def _write(self, records: List[AuditRecord]) -> None:
+        async with self.session_factory() as session:
+            connection = await session.connection()
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                RatingDecisionAudit.__tablename__,
+                records=[_to_row(record) for record in records],
+                columns=_COPY_COLUMNS
+            )
+            await session.commit()
+
+    async def flush(self) -> int:
+        """Записать весь буфер пачками по batch_size; вернуть число записанных"""
+        written = 0
+        async with self._flush_lock:
+            while self._records:
+                batch = self._records[:self.batch_size]
+                del self._records[:len(batch)]
+                try:
+                    await self._write(batch)
+                except Exception:
+                    # Возвращаем пачку в начало буфера, лишнее сверх max_size отбрасываем
+                    self._records[:0] = batch
+                    self._trim()
+                    raise
+                written += len(batch)
+                self.written += len(batch)
+        return written
+
+    async def run_forever(self, stop_event: Optional[asyncio.Event] = None) -> None:
+        """Сбрасывать буфер раз в AUDIT_FLUSH_INTERVAL_SECONDS; при остановке - дописать"""
+        stop_event = stop_event or asyncio.Event()
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=settings.AUDIT_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Ошибка записи журнала решений, в буфере %s записей", len(self))
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+
+# Буфер журнала решений процесса
+audit_buffer = AuditBuffer()
+
+
+class AuditService:
+    """Чтение журнала решений"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_records(
+        self,
+        stream_id: int,
+        week_from: date,
+        week_to: date,
+        student_id: Optional[int] = None,
+        limit: int = 1000
+    ) -> List[RatingDecisionAudit]:
+        """Записи потока за недели [week_from, week_to] (индекс stream_id, week_start, student_id)"""
+        query = select(RatingDecisionAudit).where(
+            and_(
+                RatingDecisionAudit.stream_id == stream_id,
+                RatingDecisionAudit.week_start >= week_from,
+                RatingDecisionAudit.week_start <= week_to
+            )
+        )
+        if student_id is not None:
+            query = query.where(RatingDecisionAudit.student_id == student_id)
+        query = query.order_by(
+            RatingDecisionAudit.week_start,
+            RatingDecisionAudit.student_id,
+            RatingDecisionAudit.audit_id
+        ).limit(limit)
+
+        result = await self.db.execute(query)
+        return list(result.scalars().all())
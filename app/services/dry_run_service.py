@@ -0,0 +1,178 @@
+"""
+Dry run of the weekly notification pipeline with a per-stage trace
+
+Прогон повторяет шаги рассылки потока (факты, баллы, антиповтор, отбор
+топ-N, тексты сообщений), но ничего не отправляет и не пишет, кроме
+записи в dry_run_audits. Для каждого этапа возвращаются время, число
+запросов к БД и число строк на входе и выходе - так можно профилировать
+недельный прогон потока на боевых данных.
+"""
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import date
+from typing import Iterator, List, Optional
+
+from sqlalchemy import and_, event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.education import DryRunAudit, Student, StreamNotificationConfig
+from app.schemas.rating import DryRunMessage, DryRunResponse, DryRunStage
+from app.schemas.student import RatingConfig
+from app.services import rating_kernel
+from app.services.anti_repeat_service import AntiRepeatService, parse_rules
+from app.services.fingerprint_service import FingerprintService
+from app.services.student_service import REFRESH_CHUNK_SIZE, StudentService, select_recipients
+from app.services.weekly_run_service import WeeklyRunService
+
+
+@dataclass
+class StageTrace:
+    """Замер одного этапа"""
+    name: str
+    elapsed_ms: float = 0.0
+    queries: int = 0
+    rows_in: int = 0
+    rows_out: int = 0
+
+
+class PipelineTracer:
+    """Замеры этапов: время и число запросов сессии (события do_orm_execute)"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.stages: List[StageTrace] = []
+        self._queries = 0
+
+    def _count_query(self, orm_execute_state) -> None:
+        self._queries += 1
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int = 0) -> Iterator[StageTrace]:
+        trace = StageTrace(name=name, rows_in=rows_in)
+        queries_before = self._queries
+        started = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            trace.elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+            trace.queries = self._queries - queries_before
+            self.stages.append(trace)
+
+    def __enter__(self) -> "PipelineTracer":
+        event.listen(self.db.sync_session, "do_orm_execute", self._count_query)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        event.remove(self.db.sync_session, "do_orm_execute", self._count_query)
+
+
+class DryRunService:
+    """Сухой прогон еженедельной рассылки потока"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def run(
+        self,
+        stream_id: int,
+        notification_config: Optional[StreamNotificationConfig],
+        week_start: date,
+        week_end: date,
+        config: Optional[RatingConfig] = None,
+        limit: Optional[int] = None,
+        lowest: bool = False
+    ) -> DryRunResponse:
+        """Выполнить этапы рассылки без отправки и сохранить трассу в dry_run_audits"""
+        if limit is None and notification_config is not None:
+            limit = notification_config.student_limit
+        if config is None:
+            config = RatingConfig()
+
+        service = StudentService(self.db)
+        with PipelineTracer(self.db) as tracer:
+            with tracer.stage("members") as stage:
+                members = await WeeklyRunService(self.db).get_stream_members([stream_id])
+                active_ids = [student_id for student_id, is_active in members[stream_id] if is_active]
+                stage.rows_in = len(members[stream_id])
+                stage.rows_out = len(active_ids)
+
+            with tracer.stage("facts", rows_in=len(active_ids)) as stage:
+                cohort_facts = {}
+                for offset in range(0, len(active_ids), REFRESH_CHUNK_SIZE):
+                    chunk = active_ids[offset:offset + REFRESH_CHUNK_SIZE]
+                    cohort_facts.update(await service.get_cohort_facts(chunk, week_start, week_end))
+                stage.rows_out = len(cohort_facts)
+
+            with tracer.stage("scoring", rows_in=len(cohort_facts)) as stage:
+                facts_list = list(cohort_facts.values())
+                scores = rating_kernel.score_columns(rating_kernel.facts_to_columns(facts_list), config) \
+                    if facts_list else {}
+                stage.rows_out = len(facts_list)
+
+            with tracer.stage("anti_repeat", rows_in=len(facts_list)) as stage:
+                rules = parse_rules(notification_config.anti_repeat_rules if notification_config else None)
+                decisions = await AntiRepeatService(self.db).evaluate(
+                    [facts.student_id for facts in facts_list], rules
+                )
+                allowed = [
+                    index for index, facts in enumerate(facts_list)
+                    if decisions[facts.student_id].allowed
+                ]
+                stage.rows_out = len(allowed)
+
+            with tracer.stage("selection", rows_in=len(allowed)) as stage:
+                selected = select_recipients(facts_list, scores, allowed, limit, lowest)
+                chats_query = select(Student.student_id, Student.telegram_user_id).where(
+                    and_(
+                        Student.student_id.in_([facts.student_id for facts in selected]),
+                        Student.telegram_user_id.isnot(None)
+                    )
+                )
+                chat_ids = {row.student_id: row.telegram_user_id for row in await self.db.execute(chats_query)}
+                stage.rows_out = len(selected)
+
+            with tracer.stage("rendering", rows_in=len(selected)) as stage:
+                ratings = service.rate_cohort({facts.student_id: facts for facts in selected}, config)
+                fingerprint_service = FingerprintService(self.db)
+                messages = []
+                for facts in selected:
+                    rating = ratings[facts.student_id]
+                    near_duplicates = await fingerprint_service.find_near_duplicates(stream_id, rating.message)
+                    messages.append(DryRunMessage(
+                        student_id=facts.student_id,
+                        weekly_score=rating.weekly_score,
+                        category=rating.category,
+                        chat_id=chat_ids.get(facts.student_id),
+                        message=rating.message,
+                        near_duplicate_distance=near_duplicates[0].distance if near_duplicates else None
+                    ))
+                stage.rows_out = sum(1 for message in messages if message.chat_id is not None)
+
+        stages = [DryRunStage(**asdict(trace)) for trace in tracer.stages]
+        total_ms = round(sum(trace.elapsed_ms for trace in tracer.stages), 3)
+        total_queries = sum(trace.queries for trace in tracer.stages)
+
+        audit = DryRunAudit(
+            stream_id=stream_id,
+            week_start=week_start,
+            week_end=week_end,
+            stages=[stage.model_dump() for stage in stages],
+            total_ms=total_ms,
+            total_queries=total_queries,
+            recipients_count=stages[-1].rows_out
+        )
+        self.db.add(audit)
+        await self.db.commit()
+
+        return DryRunResponse(
+            stream_id=stream_id,
+            week_start=week_start,
+            week_end=week_end,
+            audit_id=audit.audit_id,
+            dry_run_enabled=bool(notification_config and notification_config.dry_run_enabled),
+            stages=stages,
+            total_ms=total_ms,
+            total_queries=total_queries,
+            messages=messages
+        )
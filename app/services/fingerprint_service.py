@@ -0,0 +1,230 @@
+"""
+Near-duplicate detection for notification texts: SimHash + banded LSH
+
+Каждый текст сводится к 64-битному SimHash по символьным 4-граммам (числа
+заменяются на 0: баллы в персональных сообщениях разные у всех). Подпись
+режется на FINGERPRINT_BANDS полос; если расстояние Хэмминга между текстами
+не больше FINGERPRINT_MAX_DISTANCE < FINGERPRINT_BANDS, хотя бы одна полоса
+совпадает целиком. Поэтому для проверки достаточно посмотреть корзины полос
+нового текста, без попарного сравнения с окном последних сообщений потока.
+"""
+import hashlib
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import event, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.education import MessageFingerprint
+
+
+SIGNATURE_BITS = 64
+
+# Через сколько секунд перечитывать окно потока из БД (записи других процессов)
+INDEX_RELOAD_SECONDS = 300
+
+SHINGLE_SIZE = 4
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+_NUMBER_PATTERN = re.compile(r"\d+")
+_BIT_WEIGHTS = np.uint64(1) << np.arange(SIGNATURE_BITS, dtype=np.uint64)
+
+
+def simhash(text: str) -> int:
+    """64-битный SimHash текста по символьным шинглам (без учета регистра, чисел и пунктуации)"""
+    normalized = " ".join(_TOKEN_PATTERN.findall(_NUMBER_PATTERN.sub("0", text.lower())))
+    if not normalized:
+        return 0
+
+    features = [
+        normalized[offset:offset + SHINGLE_SIZE]
+        for offset in range(max(len(normalized) - SHINGLE_SIZE + 1, 1))
+    ]
+
+    hashes = np.array(
+        [
+            int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            for feature in features
+        ],
+        dtype=np.uint64
+    )
+    # Для каждого бита: +1, если он установлен в хэше признака, иначе -1
+    bits = (hashes[:, None] & _BIT_WEIGHTS) != 0
+    votes = bits.sum(axis=0) * 2 - len(features)
+    return int(_BIT_WEIGHTS[votes > 0].sum())
+
+
+def hamming_distance(left: int, right: int) -> int:
+    return bin(left ^ right).count("1")
+
+
+def band_keys(signature: int, bands: int) -> List[Tuple[int, int]]:
+    """Полосы подписи: (номер полосы, значение)"""
+    width = SIGNATURE_BITS // bands
+    mask = (1 << width) - 1
+    return [(band, (signature >> (band * width)) & mask) for band in range(bands)]
+
+
+def to_signed(signature: int) -> int:
+    """uint64 -> int64 для колонки BIGINT"""
+    return signature - (1 << SIGNATURE_BITS) if signature >= 1 << (SIGNATURE_BITS - 1) else signature
+
+
+def to_unsigned(signature: int) -> int:
+    return signature + (1 << SIGNATURE_BITS) if signature < 0 else signature
+
+
+@dataclass
+class NearDuplicate:
+    """Похожий текст из окна потока"""
+    fingerprint_id: int
+    student_id: Optional[int]
+    distance: int
+
+
+class StreamFingerprintIndex:
+    """LSH индекс последних window подписей потока"""
+
+    def __init__(self, window: int, bands: int):
+        self.window = window
+        self.bands = bands
+        self.loaded_at = time.monotonic()
+        self._entries: Deque[Tuple[int, Optional[int], int]] = deque()
+        self._buckets: Dict[Tuple[int, int], Set[int]] = {}
+        self._signatures: Dict[int, Tuple[Optional[int], int]] = {}
+
+    def __contains__(self, fingerprint_id: int) -> bool:
+        return fingerprint_id in self._signatures
+
+    def add(self, fingerprint_id: int, student_id: Optional[int], signature: int) -> None:
+        self._entries.append((fingerprint_id, student_id, signature))
+        self._signatures[fingerprint_id] = (student_id, signature)
+        for key in band_keys(signature, self.bands):
+            self._buckets.setdefault(key, set()).add(fingerprint_id)
+
+        while len(self._entries) > self.window:
+            old_id, _, old_signature = self._entries.popleft()
+            self._signatures.pop(old_id, None)
+            for key in band_keys(old_signature, self.bands):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(old_id)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def find(self, signature: int, max_distance: int) -> List[NearDuplicate]:
+        """Тексты окна на расстоянии не больше max_distance (ближайшие первыми)"""
+        candidates: Set[int] = set()
+        for key in band_keys(signature, self.bands):
+            candidates |= self._buckets.get(key, set())
+
+        matches = []
+        for fingerprint_id in candidates:
+            student_id, candidate_signature = self._signatures[fingerprint_id]
+            distance = hamming_distance(signature, candidate_signature)
+            if distance <= max_distance:
+                matches.append(NearDuplicate(fingerprint_id, student_id, distance))
+        matches.sort(key=lambda match: (match.distance, -match.fingerprint_id))
+        return matches
+
+
+# Индексы потоков в памяти процесса (stream_id -> индекс)
+_stream_indexes: Dict[int, StreamFingerprintIndex] = {}
+
+# Ключ в session.info: подписи, записанные в текущей транзакции
+_PENDING_FINGERPRINTS = "fingerprint_pending_signatures"
+
+
+class FingerprintService:
+    """Сервис подписей текстов уведомлений и поиска почти-дубликатов"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _get_index(self, stream_id: int) -> StreamFingerprintIndex:
+        """Индекс потока; при первом обращении и раз в INDEX_RELOAD_SECONDS читается из БД"""
+        index = _stream_indexes.get(stream_id)
+        if index is not None and time.monotonic() - index.loaded_at < INDEX_RELOAD_SECONDS:
+            return index
+
+        index = StreamFingerprintIndex(settings.FINGERPRINT_WINDOW, settings.FINGERPRINT_BANDS)
+        query = select(
+            MessageFingerprint.fingerprint_id,
+            MessageFingerprint.student_id,
+            MessageFingerprint.simhash
+        ).where(
+            MessageFingerprint.stream_id == stream_id
+        ).order_by(MessageFingerprint.fingerprint_id.desc()).limit(settings.FINGERPRINT_WINDOW)
+
+        result = await self.db.execute(query)
+        for row in reversed(result.all()):
+            index.add(row.fingerprint_id, row.student_id, to_unsigned(row.simhash))
+
+        _stream_indexes[stream_id] = index
+        return index
+
+    async def find_near_duplicates(self, stream_id: int, text: str) -> List[NearDuplicate]:
+        """Похожие тексты среди последних FINGERPRINT_WINDOW сообщений потока"""
+        index = await self._get_index(stream_id)
+        return index.find(simhash(text), settings.FINGERPRINT_MAX_DISTANCE)
+
+    async def record(
+        self,
+        stream_id: int,
+        texts: List[Tuple[Optional[int], str]],
+        source: str
+    ) -> int:
+        """
+        Добавить подписи текстов [(student_id, текст)] потока.
+
+        source: generated - персональные сообщения рейтинга, sent - отправленные уведомления.
+        Записываются только тексты, которые ставятся в очередь, в той же транзакции
+        (commit делает вызывающий); индекс процесса пополняется после commit.
+        """
+        if not texts:
+            return 0
+
+        signatures = [(student_id, simhash(text)) for student_id, text in texts]
+        result = await self.db.execute(
+            insert(MessageFingerprint).returning(
+                MessageFingerprint.fingerprint_id, sort_by_parameter_order=True
+            ),
+            [
+                {
+                    'stream_id': stream_id,
+                    'student_id': student_id,
+                    'source': source,
+                    'simhash': to_signed(signature),
+                }
+                for student_id, signature in signatures
+            ]
+        )
+        pending = self.db.info.setdefault(_PENDING_FINGERPRINTS, [])
+        for fingerprint_id, (student_id, signature) in zip(result.scalars().all(), signatures):
+            pending.append((stream_id, fingerprint_id, student_id, signature))
+        return len(signatures)
+
+
+def _apply_fingerprints(session: Session) -> None:
+    for stream_id, fingerprint_id, student_id, signature in session.info.pop(_PENDING_FINGERPRINTS, []):
+        index = _stream_indexes.get(stream_id)
+        # Индекс, которого еще нет в памяти, прочитает записи из БД при первом обращении
+        if index is not None and fingerprint_id not in index:
+            index.add(fingerprint_id, student_id, signature)
+
+
+def _discard_fingerprints(session: Session) -> None:
+    session.info.pop(_PENDING_FINGERPRINTS, None)
+
+
+def register_fingerprint_index_updates() -> None:
+    """Пополнять индексы потоков подписями после commit транзакции, которая их записала"""
+    if not event.contains(Session, "after_commit", _apply_fingerprints):
+        event.listen(Session, "after_commit", _apply_fingerprints)
+        event.listen(Session, "after_rollback", _discard_fingerprints)
@@ -0,0 +1,69 @@
+"""
+Idempotency service: request keys for safely retried write endpoints
+
+Ключ резервируется одним INSERT ... ON CONFLICT в начале запроса и
+фиксируется вместе с результатом в одной транзакции. Параллельный повтор
+с тем же ключом ждет на уникальном индексе, пока первый запрос не
+завершится, и затем получает сохраненный ответ.
+"""
+import hashlib
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, func, null, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.education import IdempotencyKey
+
+
+def request_hash(payload: str) -> str:
+    """sha256 тела запроса (для проверки, что ключ повторяют с тем же запросом)"""
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IdempotencyService:
+    """Сервис ключей идемпотентности"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def reserve(self, scope: str, key: str, payload_hash: str) -> Optional[IdempotencyKey]:
+        """
+        Зарезервировать ключ. None - ключ новый (или истек), запрос нужно
+        выполнить; иначе - уже сохраненная запись ключа.
+        """
+        insert_query = pg_insert(IdempotencyKey).values(
+            scope=scope, key=key, request_hash=payload_hash
+        )
+        # Истекший ключ занимается заново
+        insert_query = insert_query.on_conflict_do_update(
+            index_elements=['scope', 'key'],
+            set_={
+                'request_hash': insert_query.excluded.request_hash,
+                'response': null(),
+                'created_at': func.now()
+            },
+            where=IdempotencyKey.created_at < func.now() - timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS)
+        ).returning(IdempotencyKey.key)
+
+        result = await self.db.execute(insert_query)
+        if result.scalar_one_or_none() is not None:
+            return None
+
+        existing = await self.db.execute(
+            select(IdempotencyKey).where(
+                and_(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+            )
+        )
+        return existing.scalar_one()
+
+    async def complete(self, scope: str, key: str, response: Dict[str, Any]) -> None:
+        """Сохранить ответ и зафиксировать транзакцию (вместе с результатом запроса)"""
+        await self.db.execute(
+            update(IdempotencyKey).where(
+                and_(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+            ).values(response=response)
+        )
+        await self.db.commit()
@@ -4,7 +4,7 @@ Material service for business logic
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_
+from sqlalchemy import select, func, and_, or_, desc, literal
 
 from app.models.education import CourseMaterial, Lesson, MaterialCategory
 from app.schemas.material import (
@@ -12,6 +12,11 @@ from app.schemas.material import (
 )
 
 
+# Режимы поиска материалов
+SEARCH_MODE_SUBSTRING = "substring"
+SEARCH_MODE_SIMILAR = "similar"
+
+
 class MaterialService:
     """Сервис для работы с материалами курса"""
     
@@ -117,23 +122,50 @@ class MaterialService:
         result = await self.db.execute(query)
         return result.scalars().all()
     
+    @staticmethod
+    def _search_condition(search_term: str, mode: str):
+        """Условие поиска; оба режима используют триграммные индексы title и content"""
+        if mode == SEARCH_MODE_SIMILAR:
+            term = literal(search_term)
+            return or_(term.op('<%')(CourseMaterial.title), term.op('<%')(CourseMaterial.content))
+        return and_(
+            CourseMaterial.title.ilike(f"%{search_term}%"),
+            CourseMaterial.content.ilike(f"%{search_term}%")
+        )
+    
     async def search_materials(
         self, 
         search_term: str,
         skip: int = 0,
-        limit: int = 100
+        limit: int = 100,
+        mode: str = SEARCH_MODE_SUBSTRING
     ) -> List[CourseMaterial]:
-        """Поиск материалов по названию и содержимому"""
-        query = select(CourseMaterial).where(
-            and_(
-                CourseMaterial.title.ilike(f"%{search_term}%"),
-                CourseMaterial.content.ilike(f"%{search_term}%")
+        """
+        Поиск материалов по названию и содержимому.
+        
+        substring - подстрока (ILIKE), similar - нечеткий поиск (части слов,
+        опечатки; pg_trgm <%) по убыванию word_similarity.
+        """
+        query = select(CourseMaterial).where(self._search_condition(search_term, mode))
+        if mode == SEARCH_MODE_SIMILAR:
+            query = query.order_by(
+                desc(func.greatest(
+                    func.word_similarity(search_term, CourseMaterial.title),
+                    func.coalesce(func.word_similarity(search_term, CourseMaterial.content), 0)
+                )),
+                CourseMaterial.material_id
             )
-        ).offset(skip).limit(limit)
+        query = query.offset(skip).limit(limit)
         
         result = await self.db.execute(query)
         return result.scalars().all()
     
+    async def count_search_results(self, search_term: str, mode: str = SEARCH_MODE_SUBSTRING) -> int:
+        """Количество материалов, найденных search_materials"""
+        query = select(func.count(CourseMaterial.material_id)).where(self._search_condition(search_term, mode))
+        result = await self.db.execute(query)
+        return result.scalar() or 0
+    
     async def get_public_materials(
         self,
         skip: int = 0,
@@ -1,16 +1,54 @@
 """
 Message service for business logic
 """
+import base64
+import json
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, desc
+from sqlalchemy import select, func, and_, desc, tuple_, literal, literal_column, null
 
-from app.models.education import Message, BotResponse, SenderType
+from app.core.config import settings
+from app.models.education import Message, BotResponse, ChatCounter, SenderType
 from app.schemas.message import (
     MessageCreate, MessageResponse, BotResponseCreate, BotResponseResponse,
-    MessageWithResponse, ChatStats
+    MessageWithResponse, MessageSearchResult, ChatStats
 )
+from app.services.rollup_service import RollupService
+
+
+# Режимы поиска сообщений
+SEARCH_MODE_FULLTEXT = "fulltext"
+SEARCH_MODE_SUBSTRING = "substring"
+SEARCH_MODE_SIMILAR = "similar"
+
+# Конфигурация полнотекстового поиска (как в генерируемой колонке messages.search_vector)
+_SEARCH_CONFIG = literal_column("'russian'::regconfig")
+
+# Фрагменты найденного текста для ts_headline
+_HEADLINE_OPTIONS = "StartSel=<b>, StopSel=</b>, MaxFragments=2, MaxWords=20, MinWords=5"
+
+# Позиция keyset пагинации: (created_at, message_id) последнего сообщения страницы
+MessageCursor = Tuple[datetime, int]
+
+
+class InvalidCursorError(ValueError):
+    """Курсор пагинации не удалось разобрать"""
+
+
+def encode_cursor(message: Message) -> str:
+    """Непрозрачный курсор на позицию после message"""
+    payload = json.dumps([message.created_at.isoformat(), message.message_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> MessageCursor:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, message_id = json.loads(payload)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (ValueError, TypeError) as error:
+        raise InvalidCursorError("Некорректный курсор") from error
 
 
 class MessageService:
@@ -19,15 +57,59 @@ class MessageService:
     def __init__(self, db: AsyncSession):
         self.db = db
     
+    async def _with_responses(self, messages: List[Message]) -> List[MessageWithResponse]:
+        """
+        Собрать MessageWithResponse для страницы сообщений.
+        
+        Ответы бота для всех сообщений страницы загружаются одним запросом
+        (message_id IN ...), а не отдельным запросом на каждое сообщение.
+        """
+        if not messages:
+            return []
+        
+        bot_responses_query = select(BotResponse).where(
+            BotResponse.message_id.in_([message.message_id for message in messages])
+        ).order_by(BotResponse.message_id, BotResponse.created_at)
+        bot_responses_result = await self.db.execute(bot_responses_query)
+        
+        responses_by_message: Dict[int, List[BotResponseResponse]] = {}
+        for response in bot_responses_result.scalars():
+            responses_by_message.setdefault(response.message_id, []).append(
+                BotResponseResponse.model_validate(response)
+            )
+        
+        return [
+            MessageWithResponse(
+                message_id=message.message_id,
+                telegram_message_id=message.telegram_message_id,
+                chat_id=message.chat_id,
+                sender_type=message.sender_type,
+                sender_id=message.sender_id,
+                text_content=message.text_content,
+                attachment_url=message.attachment_url,
+                created_at=message.created_at,
+                bot_responses=responses_by_message.get(message.message_id, [])
+            )
+            for message in messages
+        ]
+    
     async def get_messages(
         self, 
         skip: int = 0, 
         limit: int = 100,
         chat_id: Optional[int] = None,
         sender_type: Optional[SenderType] = None,
-        sender_id: Optional[int] = None
-    ) -> List[MessageWithResponse]:
-        """Получить список сообщений с ответами бота"""
+        sender_id: Optional[int] = None,
+        cursor: Optional[MessageCursor] = None
+    ) -> Tuple[List[MessageWithResponse], Optional[str]]:
+        """
+        Получить страницу сообщений с ответами бота и курсор следующей.
+        
+        Сообщения упорядочены по (created_at, message_id) по убыванию. С cursor
+        страница начинается сразу после него (skip не используется): запрос
+        идет по составному индексу, и глубокие страницы стоят как первая, а
+        новые сообщения не сдвигают страницы.
+        """
         query = select(Message)
         
         if chat_id is not None:
@@ -39,37 +121,17 @@ class MessageService:
         if sender_id is not None:
             query = query.where(Message.sender_id == sender_id)
         
-        query = query.order_by(desc(Message.created_at)).offset(skip).limit(limit)
+        if cursor is not None:
+            query = query.where(tuple_(Message.created_at, Message.message_id) < tuple_(*cursor))
+        else:
+            query = query.offset(skip)
+        
+        query = query.order_by(desc(Message.created_at), desc(Message.message_id)).limit(limit)
         result = await self.db.execute(query)
         messages = result.scalars().all()
         
-        # Получаем ответы бота для каждого сообщения
-        messages_with_responses = []
-        for message in messages:
-            bot_responses_query = select(BotResponse).where(
-                BotResponse.message_id == message.message_id
-            ).order_by(BotResponse.created_at)
-            
-            bot_responses_result = await self.db.execute(bot_responses_query)
-            bot_responses = bot_responses_result.scalars().all()
-            
-            message_data = MessageWithResponse(
-                message_id=message.message_id,
-                telegram_message_id=message.telegram_message_id,
-                chat_id=message.chat_id,
-                sender_type=message.sender_type,
-                sender_id=message.sender_id,
-                text_content=message.text_content,
-                attachment_url=message.attachment_url,
-                created_at=message.created_at,
-                bot_responses=[
-                    BotResponseResponse.model_validate(response) 
-                    for response in bot_responses
-                ]
-            )
-            messages_with_responses.append(message_data)
-        
-        return messages_with_responses
+        next_cursor = encode_cursor(messages[-1]) if len(messages) == limit else None
+        return await self._with_responses(messages), next_cursor
     
     async def get_message_by_id(self, message_id: int) -> Optional[MessageWithResponse]:
         """Получить сообщение по ID с ответами бота"""
@@ -80,28 +142,7 @@ class MessageService:
         if not message:
             return None
         
-        # Получаем ответы бота
-        bot_responses_query = select(BotResponse).where(
-            BotResponse.message_id == message.message_id
-        ).order_by(BotResponse.created_at)
-        
-        bot_responses_result = await self.db.execute(bot_responses_query)
-        bot_responses = bot_responses_result.scalars().all()
-        
-        return MessageWithResponse(
-            message_id=message.message_id,
-            telegram_message_id=message.telegram_message_id,
-            chat_id=message.chat_id,
-            sender_type=message.sender_type,
-            sender_id=message.sender_id,
-            text_content=message.text_content,
-            attachment_url=message.attachment_url,
-            created_at=message.created_at,
-            bot_responses=[
-                BotResponseResponse.model_validate(response) 
-                for response in bot_responses
-            ]
-        )
+        return (await self._with_responses([message]))[0]
     
     async def create_message(self, message_data: MessageCreate) -> Message:
         """Создать новое сообщение"""
@@ -123,152 +164,156 @@ class MessageService:
         self, 
         chat_id: int,
         skip: int = 0,
-        limit: int = 100
-    ) -> List[MessageWithResponse]:
+        limit: int = 100,
+        cursor: Optional[MessageCursor] = None
+    ) -> Tuple[List[MessageWithResponse], Optional[str]]:
         """Получить сообщения чата"""
-        return await self.get_messages(skip, limit, chat_id=chat_id)
+        return await self.get_messages(skip, limit, chat_id=chat_id, cursor=cursor)
     
     async def get_user_messages(
         self, 
         sender_id: int,
         skip: int = 0,
-        limit: int = 100
-    ) -> List[MessageWithResponse]:
+        limit: int = 100,
+        cursor: Optional[MessageCursor] = None
+    ) -> Tuple[List[MessageWithResponse], Optional[str]]:
         """Получить сообщения пользователя"""
         return await self.get_messages(
-            skip, limit, sender_id=sender_id, sender_type=SenderType.USER
+            skip, limit, sender_id=sender_id, sender_type=SenderType.USER, cursor=cursor
         )
     
     async def get_bot_messages(
         self, 
         skip: int = 0,
-        limit: int = 100
-    ) -> List[MessageWithResponse]:
+        limit: int = 100,
+        cursor: Optional[MessageCursor] = None
+    ) -> Tuple[List[MessageWithResponse], Optional[str]]:
         """Получить сообщения бота"""
         return await self.get_messages(
-            skip, limit, sender_type=SenderType.BOT
+            skip, limit, sender_type=SenderType.BOT, cursor=cursor
         )
     
     async def get_chat_stats(self, chat_id: int) -> ChatStats:
         """Получить статистику чата"""
-        # Общее количество сообщений
-        total_query = select(func.count(Message.message_id)).where(
-            Message.chat_id == chat_id
-        )
-        total_result = await self.db.execute(total_query)
-        total = total_result.scalar() or 0
-        
-        # Сообщения пользователей
-        user_query = select(func.count(Message.message_id)).where(
-            and_(Message.chat_id == chat_id, Message.sender_type == SenderType.USER)
-        )
-        user_result = await self.db.execute(user_query)
-        user_messages = user_result.scalar() or 0
-        
-        # Сообщения бота
-        bot_query = select(func.count(Message.message_id)).where(
-            and_(Message.chat_id == chat_id, Message.sender_type == SenderType.BOT)
-        )
-        bot_result = await self.db.execute(bot_query)
-        bot_messages = bot_result.scalar() or 0
-        
-        # Последняя активность
-        last_activity_query = select(func.max(Message.created_at)).where(
-            Message.chat_id == chat_id
-        )
-        last_activity_result = await self.db.execute(last_activity_query)
-        last_activity = last_activity_result.scalar()
-        
-        # Количество активных пользователей
-        active_users_query = select(func.count(func.distinct(Message.sender_id))).where(
-            and_(
-                Message.chat_id == chat_id,
-                Message.sender_type == SenderType.USER
+        if settings.ROLLUP_COUNTERS_ENABLED:
+            # Готовые счетчики чата (одна строка)
+            counter = await RollupService(self.db).get_chat_counter(chat_id)
+            return ChatStats(
+                chat_id=chat_id,
+                total_messages=counter.total_messages if counter else 0,
+                user_messages=counter.user_messages if counter else 0,
+                bot_messages=counter.bot_messages if counter else 0,
+                last_activity=counter.last_activity if counter else None,
+                active_users=counter.active_users if counter else 0
             )
-        )
-        active_users_result = await self.db.execute(active_users_query)
-        active_users = active_users_result.scalar() or 0
+        
+        # Все показатели одним проходом по сообщениям чата (индекс chat_id)
+        is_user = Message.sender_type == SenderType.USER
+        stats_query = select(
+            func.count(Message.message_id).label('total_messages'),
+            func.count(Message.message_id).filter(is_user).label('user_messages'),
+            func.count(Message.message_id).filter(Message.sender_type == SenderType.BOT).label('bot_messages'),
+            func.max(Message.created_at).label('last_activity'),
+            func.count(func.distinct(Message.sender_id)).filter(is_user).label('active_users')
+        ).where(Message.chat_id == chat_id)
+        stats = (await self.db.execute(stats_query)).one()
         
         return ChatStats(
             chat_id=chat_id,
-            total_messages=total,
-            user_messages=user_messages,
-            bot_messages=bot_messages,
-            last_activity=last_activity,
-            active_users=active_users
+            total_messages=stats.total_messages,
+            user_messages=stats.user_messages,
+            bot_messages=stats.bot_messages,
+            last_activity=stats.last_activity,
+            active_users=stats.active_users
         )
     
     async def get_message_stats(self) -> Dict[str, Any]:
-        """Получить общую статистику по сообщениям"""
-        # Общее количество сообщений
-        total_query = select(func.count(Message.message_id))
-        total_result = await self.db.execute(total_query)
-        total = total_result.scalar() or 0
-        
-        # Сообщения по типам отправителей
-        by_sender_query = select(
-            Message.sender_type,
-            func.count(Message.message_id).label('count')
-        ).group_by(Message.sender_type)
-        
-        by_sender_result = await self.db.execute(by_sender_query)
-        by_sender = {row.sender_type: row.count for row in by_sender_result}
-        
-        # Количество чатов
-        chats_query = select(func.count(func.distinct(Message.chat_id)))
-        chats_result = await self.db.execute(chats_query)
-        chats_count = chats_result.scalar() or 0
-        
-        # Количество ответов бота
-        responses_query = select(func.count(BotResponse.response_id))
-        responses_result = await self.db.execute(responses_query)
-        responses_count = responses_result.scalar() or 0
+        """Получить общую статистику по сообщениям (один запрос)"""
+        responses_count = select(func.count(BotResponse.response_id)).scalar_subquery()
+        if settings.ROLLUP_COUNTERS_ENABLED:
+            # Сумма счетчиков чатов вместо прохода по всем сообщениям
+            stats_query = select(
+                func.coalesce(func.sum(ChatCounter.total_messages), 0).label('total_messages'),
+                func.coalesce(func.sum(ChatCounter.user_messages), 0).label('user_messages'),
+                func.coalesce(func.sum(ChatCounter.bot_messages), 0).label('bot_messages'),
+                func.count(ChatCounter.chat_id).filter(ChatCounter.total_messages > 0).label('total_chats'),
+                responses_count.label('total_responses')
+            )
+        else:
+            stats_query = select(
+                func.count(Message.message_id).label('total_messages'),
+                func.count(Message.message_id).filter(Message.sender_type == SenderType.USER).label('user_messages'),
+                func.count(Message.message_id).filter(Message.sender_type == SenderType.BOT).label('bot_messages'),
+                func.count(func.distinct(Message.chat_id)).label('total_chats'),
+                responses_count.label('total_responses')
+            )
+        stats = (await self.db.execute(stats_query)).one()
         
+        # sum() по счетчикам возвращает numeric
+        sender_counts = ((SenderType.USER, int(stats.user_messages)), (SenderType.BOT, int(stats.bot_messages)))
         return {
-            'total_messages': total,
-            'by_sender_type': by_sender,
-            'total_chats': chats_count,
-            'total_responses': responses_count
+            'total_messages': int(stats.total_messages),
+            'by_sender_type': {sender_type: count for sender_type, count in sender_counts if count},
+            'total_chats': stats.total_chats,
+            'total_responses': stats.total_responses
         }
     
     async def search_messages(
         self, 
         search_term: str,
         skip: int = 0,
-        limit: int = 100
-    ) -> List[MessageWithResponse]:
-        """Поиск сообщений по тексту"""
-        query = select(Message).where(
-            Message.text_content.ilike(f"%{search_term}%")
-        ).order_by(desc(Message.created_at)).offset(skip).limit(limit)
+        limit: int = 100,
+        mode: str = SEARCH_MODE_FULLTEXT
+    ) -> Tuple[List[MessageSearchResult], int, bool]:
+        """
+        Поиск сообщений по тексту.
         
-        result = await self.db.execute(query)
-        messages = result.scalars().all()
+        Режимы:
+        - fulltext: полнотекстовый поиск (конфигурация russian). Запрос разбирается
+          websearch_to_tsquery (слова, "фразы", OR, -исключения) и ищется по GIN
+          индексу search_vector; порядок - ts_rank, snippet - ts_headline;
+        - substring: подстрока (ILIKE '%...%') по триграммному индексу text_content,
+          сначала новые;
+        - similar: нечеткий поиск (части слов, опечатки) - запрос похож на какой-либо
+          фрагмент текста (pg_trgm <%), порядок - word_similarity.
+        Число совпадений считается только до MESSAGE_SEARCH_COUNT_CAP.
         
-        # Получаем ответы бота для найденных сообщений
-        messages_with_responses = []
-        for message in messages:
-            bot_responses_query = select(BotResponse).where(
-                BotResponse.message_id == message.message_id
-            ).order_by(BotResponse.created_at)
-            
-            bot_responses_result = await self.db.execute(bot_responses_query)
-            bot_responses = bot_responses_result.scalars().all()
-            
-            message_data = MessageWithResponse(
-                message_id=message.message_id,
-                telegram_message_id=message.telegram_message_id,
-                chat_id=message.chat_id,
-                sender_type=message.sender_type,
-                sender_id=message.sender_id,
-                text_content=message.text_content,
-                attachment_url=message.attachment_url,
-                created_at=message.created_at,
-                bot_responses=[
-                    BotResponseResponse.model_validate(response) 
-                    for response in bot_responses
-                ]
+        Returns:
+            (страница результатов, число совпадений, число совпадений больше предела)
+        """
+        if mode == SEARCH_MODE_FULLTEXT:
+            ts_query = func.websearch_to_tsquery(_SEARCH_CONFIG, search_term)
+            matches = Message.search_vector.op('@@')(ts_query)
+            rank = func.ts_rank(Message.search_vector, ts_query)
+            snippet = func.ts_headline(
+                _SEARCH_CONFIG, func.coalesce(Message.text_content, ''), ts_query, _HEADLINE_OPTIONS
             )
-            messages_with_responses.append(message_data)
+        elif mode == SEARCH_MODE_SIMILAR:
+            matches = literal(search_term).op('<%')(Message.text_content)
+            rank = func.word_similarity(search_term, Message.text_content)
+            snippet = null()
+        else:
+            matches = Message.text_content.ilike(f"%{search_term}%")
+            rank = null()
+            snippet = null()
+        
+        order_by = [desc(Message.created_at), desc(Message.message_id)]
+        if mode != SEARCH_MODE_SUBSTRING:
+            order_by.insert(0, desc(rank))
+        query = select(Message, rank.label("rank"), snippet.label("snippet")).where(matches).order_by(
+            *order_by
+        ).offset(skip).limit(limit)
+        rows = (await self.db.execute(query)).all()
+        
+        # Считаем не дальше cap + 1 совпадения: точный count(*) по популярному слову читает весь индекс
+        cap = settings.MESSAGE_SEARCH_COUNT_CAP
+        capped_matches = select(Message.message_id).where(matches).limit(cap + 1).subquery()
+        total = (await self.db.execute(select(func.count()).select_from(capped_matches))).scalar_one()
+        total_capped = total > cap
         
-        return messages_with_responses
+        messages = await self._with_responses([row.Message for row in rows])
+        results = [
+            MessageSearchResult(**message.model_dump(), rank=row.rank, snippet=row.snippet)
+            for message, row in zip(messages, rows)
+        ]
+        return results, min(total, cap), total_capped
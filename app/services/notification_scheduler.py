@@ -0,0 +1,390 @@
+"""
+In-process notification scheduler driven by StreamNotificationConfig
+
+Планировщик держит кучу ближайших срабатываний (fire_at, stream_id) по
+расписаниям всех потоков и спит до ближайшего. PUT/POST конфигурации потока
+пересчитывают его срабатывание сразу (reschedule), изменения из других
+процессов подхватываются перечитыванием раз в SCHEDULER_RELOAD_SECONDS и
+проверкой актуального расписания перед срабатыванием.
+
+Если процессов несколько, каждый срабатывание (stream_id, fire_at) выполняет
+ровно один: он берет аренду строкой в scheduled_runs, а результат (очередь
+уведомлений и status=done) фиксирует одной транзакцией, только пока аренда
+его.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.models.education import ScheduledRun, Student, StreamNotificationConfig
+from app.schemas.rating import AuditRecord
+from app.services.anti_repeat_service import AntiRepeatService, parse_rules
+from app.services.audit_service import audit_buffer, compact_facts
+from app.services.fingerprint_service import FingerprintService
+from app.services.outbox_service import OutboxService
+from app.schemas.student import RatingConfig
+from app.services import rating_kernel
+from app.services.student_service import REFRESH_CHUNK_SIZE, StudentService, select_recipients
+from app.services.weekly_run_service import StreamSchedule, WeeklyRunService
+
+
+logger = logging.getLogger(__name__)
+
+# Тип уведомления для персональных сообщений рейтинга
+WEEKLY_NOTIFICATION_TYPE = "weekly_rating"
+
+# Через сколько секунд повторить неудачную загрузку конфигураций
+RELOAD_RETRY_SECONDS = 30
+
+
+def _now() -> datetime:
+    """Текущее время в локальном часовом поясе (время рассылки в конфигурации - локальное)"""
+    return datetime.now().astimezone()
+
+
+def _scheduled(config: Optional[StreamNotificationConfig]) -> Optional[StreamSchedule]:
+    """
+    Расписание рассылки потока для планировщика. Рассылаются только потоки
+    с явной конфигурацией: расписание по умолчанию (StreamSchedule.from_config(None))
+    планировщик не применяет, чтобы не писать потокам, которые рассылку не включали.
+    """
+    return StreamSchedule.from_config(config) if config is not None else None
+
+
+class NotificationScheduler:
+    """Планировщик рассылок потоков"""
+
+    def __init__(self, session_factory=async_session, worker_id: Optional[str] = None):
+        self.session_factory = session_factory
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._schedules: Dict[int, StreamSchedule] = {}
+        self._next_fire: Dict[int, datetime] = {}
+        self._heap: List[Tuple[datetime, int]] = []
+        self._wakeup = asyncio.Event()
+        self._loaded = False
+
+    # Куча срабатываний
+
+    def _push(self, stream_id: int, fire_at: datetime) -> None:
+        self._next_fire[stream_id] = fire_at
+        heapq.heappush(self._heap, (fire_at, stream_id))
+
+    def _set_schedule(
+        self,
+        stream_id: int,
+        schedule: Optional[StreamSchedule],
+        after: datetime
+    ) -> None:
+        """Заменить расписание потока; старые записи кучи отбрасываются лениво"""
+        if schedule is None:
+            self._schedules.pop(stream_id, None)
+            self._next_fire.pop(stream_id, None)
+            return
+        self._schedules[stream_id] = schedule
+        self._push(stream_id, schedule.next_fire_time(after))
+
+    def reschedule(self, stream_id: int, config: Optional[StreamNotificationConfig]) -> None:
+        """Пересчитать срабатывание потока после изменения его конфигурации"""
+        if not self._loaded:
+            return
+        schedule = _scheduled(config)
+        if schedule == self._schedules.get(stream_id):
+            return
+        self._set_schedule(stream_id, schedule, _now())
+        self._wakeup.set()
+
+    def pop_due(self, now: datetime) -> List[Tuple[int, datetime]]:
+        """Снять с кучи наступившие срабатывания (stream_id, fire_at)"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, stream_id = heapq.heappop(self._heap)
+            if self._next_fire.get(stream_id) == fire_at:
+                del self._next_fire[stream_id]
+                due.append((stream_id, fire_at))
+        return due
+
+    def next_fire_at(self) -> Optional[datetime]:
+        """Ближайшее актуальное срабатывание"""
+        while self._heap and self._next_fire.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def upcoming(self) -> List[Dict]:
+        """Ближайшие срабатывания по потокам"""
+        return [
+            {"stream_id": stream_id, "fire_at": fire_at}
+            for stream_id, fire_at in sorted(self._next_fire.items(), key=lambda item: item[1])
+        ]
+
+    async def reload(self) -> None:
+        """
+        Перечитать конфигурации всех потоков.
+
+        Потоки с неизменным расписанием остаются в куче как есть. При первой
+        загрузке срабатывания считаются с now - SCHEDULER_CATCHUP_MINUTES,
+        чтобы не потерять рассылки, пропущенные на время перезапуска.
+        """
+        async with self.session_factory() as session:
+            configs = await WeeklyRunService(session).get_scheduled_configs()
+
+        now = _now()
+        after = now - timedelta(minutes=settings.SCHEDULER_CATCHUP_MINUTES) if not self._loaded else now
+        schedules = {config.stream_id: _scheduled(config) for config in configs}
+
+        for stream_id in list(self._schedules):
+            if stream_id not in schedules:
+                self._set_schedule(stream_id, None, now)
+        for stream_id, schedule in schedules.items():
+            if schedule != self._schedules.get(stream_id) or stream_id not in self._next_fire:
+                self._set_schedule(stream_id, schedule, after)
+        self._loaded = True
+
+    # Срабатывание
+
+    async def _claim(self, session: AsyncSession, stream_id: int, fire_at: datetime) -> bool:
+        """Взять аренду срабатывания (новую или истекшую чужую)"""
+        now = datetime.now(timezone.utc)
+        lease_expires_at = now + timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        claim_query = pg_insert(ScheduledRun).values(
+            stream_id=stream_id,
+            fire_at=fire_at,
+            status="running",
+            worker_id=self.worker_id,
+            lease_expires_at=lease_expires_at
+        )
+        claim_query = claim_query.on_conflict_do_update(
+            index_elements=['stream_id', 'fire_at'],
+            set_={
+                'worker_id': claim_query.excluded.worker_id,
+                'lease_expires_at': claim_query.excluded.lease_expires_at,
+                'started_at': func.now()
+            },
+            where=and_(
+                ScheduledRun.status == "running",
+                ScheduledRun.lease_expires_at < now
+            )
+        ).returning(ScheduledRun.stream_id)
+
+        result = await session.execute(claim_query)
+        claimed = result.scalar_one_or_none() is not None
+        await session.commit()
+        return claimed
+
+    async def _finish(
+        self,
+        session: AsyncSession,
+        stream_id: int,
+        fire_at: datetime,
+        status: str,
+        queued_count: int = 0,
+        error: Optional[str] = None
+    ) -> bool:
+        """Отметить срабатывание, если аренда все еще наша; вернуть False, если ее забрали"""
+        result = await session.execute(
+            update(ScheduledRun).where(
+                and_(
+                    ScheduledRun.stream_id == stream_id,
+                    ScheduledRun.fire_at == fire_at,
+                    ScheduledRun.status == "running",
+                    ScheduledRun.worker_id == self.worker_id
+                )
+            ).values(
+                status=status,
+                queued_count=queued_count,
+                error=error,
+                finished_at=func.now()
+            )
+        )
+        return result.rowcount == 1
+
+    async def fire(self, stream_id: int, fire_at: datetime) -> Optional[int]:
+        """
+        Выполнить еженедельный прогон потока и поставить персональные сообщения
+        в очередь доставки. Возвращает число поставленных сообщений или None,
+        если срабатывание выполнил другой процесс или расписание изменилось.
+        """
+        async with self.session_factory() as session:
+            config_query = select(StreamNotificationConfig).where(
+                StreamNotificationConfig.stream_id == stream_id
+            )
+            config = (await session.execute(config_query)).scalar_one_or_none()
+            schedule = _scheduled(config)
+            # Конфигурацию могли изменить в другом процессе
+            if schedule is None or schedule.next_fire_time(fire_at - timedelta(microseconds=1)) != fire_at:
+                return None
+
+            if not await self._claim(session, stream_id, fire_at):
+                return None
+
+            try:
+                return await self._run_stream(session, stream_id, config, fire_at)
+            except Exception as error:
+                await session.rollback()
+                await self._finish(session, stream_id, fire_at, "failed", error=str(error)[:1000])
+                await session.commit()
+                raise
+
+    async def _run_stream(
+        self,
+        session: AsyncSession,
+        stream_id: int,
+        config: StreamNotificationConfig,
+        fire_at: datetime
+    ) -> Optional[int]:
+        """
+        Рейтинги студентов потока за прошлую неделю -> notification_outbox.
+
+        Получатели отбираются так же, как в сухом прогоне: разрешенные
+        антиповтором, первые student_limit по рейтингу.
+        """
+        dry_run = config.dry_run_enabled
+        fire_date = fire_at.date()
+        week_start = fire_date - timedelta(days=fire_date.weekday() + 7)
+        week_end = week_start + timedelta(days=6)
+
+        members = await WeeklyRunService(session).get_stream_members([stream_id])
+        active_ids = [student_id for student_id, is_active in members[stream_id] if is_active]
+
+        service = StudentService(session)
+        cohort_facts = {}
+        for offset in range(0, len(active_ids), REFRESH_CHUNK_SIZE):
+            chunk = active_ids[offset:offset + REFRESH_CHUNK_SIZE]
+            cohort_facts.update(await service.get_cohort_facts(chunk, week_start, week_end))
+        cohort_ratings = service.rate_cohort(cohort_facts)
+
+        messages = []
+        skip_reasons = {student_id: "dry_run" for student_id in active_ids} if dry_run else {}
+        if not dry_run and cohort_facts:
+            facts_list = list(cohort_facts.values())
+            scores = rating_kernel.score_columns(rating_kernel.facts_to_columns(facts_list), RatingConfig())
+            decisions = await AntiRepeatService(session).evaluate(
+                [facts.student_id for facts in facts_list],
+                parse_rules(config.anti_repeat_rules)
+            )
+            allowed = [
+                index for index, facts in enumerate(facts_list)
+                if decisions[facts.student_id].allowed
+            ]
+            selected_ids = {
+                facts.student_id
+                for facts in select_recipients(
+                    facts_list, scores, allowed, config.student_limit
+                )
+            }
+            chats_query = select(Student.student_id, Student.telegram_user_id).where(
+                and_(
+                    Student.student_id.in_(selected_ids),
+                    Student.telegram_user_id.isnot(None)
+                )
+            ).order_by(Student.student_id)
+            messages = [
+                (row.student_id, row.telegram_user_id, cohort_ratings[row.student_id].message)
+                for row in await session.execute(chats_query)
+            ]
+            await OutboxService(session).enqueue_messages(
+                messages, WEEKLY_NOTIFICATION_TYPE, stream_id=stream_id
+            )
+            await AntiRepeatService(session).record_messages(
+                [(student_id, text) for student_id, _, text in messages],
+                WEEKLY_NOTIFICATION_TYPE,
+                stream_id=stream_id
+            )
+            await FingerprintService(session).record(
+                stream_id,
+                [(student_id, text) for student_id, _, text in messages],
+                source="generated"
+            )
+
+            queued_ids = {student_id for student_id, _, _ in messages}
+            for student_id, decision in decisions.items():
+                if not decision.allowed:
+                    skip_reasons[student_id] = "; ".join(decision.reasons)[:100]
+                elif student_id not in selected_ids:
+                    skip_reasons[student_id] = "not_selected"
+                elif student_id not in queued_ids:
+                    skip_reasons[student_id] = "no_telegram_id"
+
+        status = "skipped" if dry_run else "done"
+        # Очередь, журнал антиповтора и подписи фиксируются только вместе с отметкой о срабатывании
+        if not await self._finish(session, stream_id, fire_at, status, queued_count=len(messages)):
+            await session.rollback()
+            return None
+        await session.commit()
+
+        await audit_buffer.add([
+            AuditRecord(
+                stream_id=stream_id,
+                student_id=student_id,
+                week_start=week_start,
+                facts=compact_facts(cohort_facts[student_id]),
+                weekly_score=cohort_ratings[student_id].weekly_score,
+                message_text=cohort_ratings[student_id].message,
+                decision="skipped" if student_id in skip_reasons else "selected",
+                reason=skip_reasons.get(student_id),
+                source="scheduler"
+            )
+            for student_id in active_ids
+        ])
+        return len(messages)
+
+    # Цикл
+
+    async def run_due(self, now: Optional[datetime] = None) -> int:
+        """Выполнить наступившие срабатывания; вернуть их количество"""
+        due = self.pop_due(now or _now())
+        for stream_id, fire_at in due:
+            try:
+                queued = await self.fire(stream_id, fire_at)
+                if queued is not None:
+                    logger.info("Поток %s: рассылка %s, в очереди %s", stream_id, fire_at, queued)
+            except Exception:
+                logger.exception("Ошибка рассылки потока %s (%s)", stream_id, fire_at)
+
+            schedule = self._schedules.get(stream_id)
+            if schedule is not None and stream_id not in self._next_fire:
+                self._push(stream_id, schedule.next_fire_time(max(fire_at, _now())))
+        return len(due)
+
+    async def run_forever(self, stop_event: Optional[asyncio.Event] = None) -> None:
+        """Спать до ближайшего срабатывания (или изменения расписания) до stop_event"""
+        stop_event = stop_event or asyncio.Event()
+        reload_at = _now()
+        while not stop_event.is_set():
+            try:
+                if _now() >= reload_at:
+                    reload_at = _now() + timedelta(seconds=RELOAD_RETRY_SECONDS)
+                    await self.reload()
+                    reload_at = _now() + timedelta(seconds=settings.SCHEDULER_RELOAD_SECONDS)
+                await self.run_due()
+            except Exception:
+                # БД недоступна и т.п. - пробуем при следующем пробуждении
+                logger.exception("Ошибка планировщика рассылок")
+
+            wake_at = min(filter(None, (self.next_fire_at(), reload_at)))
+            timeout = max((wake_at - _now()).total_seconds(), 0.0)
+            self._wakeup.clear()
+            stop_waiter = asyncio.ensure_future(stop_event.wait())
+            wakeup_waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait(
+                    [stop_waiter, wakeup_waiter],
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                stop_waiter.cancel()
+                wakeup_waiter.cancel()
+
+
+# Глобальный планировщик процесса (эндпоинты конфигурации вызывают reschedule)
+notification_scheduler = NotificationScheduler()
@@ -0,0 +1,224 @@
+"""
+Notification outbox delivery worker
+
+Эндпоинт /rating/notifications/send только пишет строки в notification_outbox.
+Воркер забирает готовые к отправке строки (FOR UPDATE SKIP LOCKED, поэтому
+воркеров может быть несколько), отправляет их с общим лимитом скорости
+(token bucket) и лимитом на чат, а при 429/5xx/сетевых ошибках повторяет
+с экспоненциальной задержкой и джиттером.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, or_, select, update
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.models.education import NotificationOutbox
+from app.services.telegram_client import BotClient, TelegramBotClient, TelegramDeliveryError
+
+
+logger = logging.getLogger(__name__)
+
+# Строка в статусе sending дольше этого времени считается брошенной упавшим воркером
+STALE_LOCK_SECONDS = 300
+
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 300.0
+
+
+def backoff_delay(attempt: int) -> float:
+    """Экспоненциальная задержка с полным джиттером (attempt начинается с 1)"""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+class TokenBucket:
+    """Общий лимит скорости: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatRateLimiter:
+    """Не чаще одного сообщения в чат за interval секунд"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_allowed: Dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        allowed_at = max(now, self._next_allowed.get(chat_id, now))
+        self._next_allowed[chat_id] = allowed_at + self.interval
+        if allowed_at > now:
+            await asyncio.sleep(allowed_at - now)
+
+    def forget_idle(self) -> None:
+        """Убрать чаты, которым уже можно писать (чтобы словарь не рос)"""
+        now = time.monotonic()
+        self._next_allowed = {
+            chat_id: allowed_at for chat_id, allowed_at in self._next_allowed.items()
+            if allowed_at > now
+        }
+
+
+class NotificationWorker:
+    """Воркер доставки уведомлений из outbox"""
+
+    def __init__(
+        self,
+        client: Optional[BotClient] = None,
+        session_factory=async_session,
+        rate_per_second: Optional[float] = None,
+        chat_interval: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        poll_interval: float = 1.0
+    ):
+        self.client = client or TelegramBotClient()
+        self.session_factory = session_factory
+        self.bucket = TokenBucket(rate_per_second or settings.NOTIFICATION_RATE_PER_SECOND)
+        self.chat_limiter = ChatRateLimiter(
+            chat_interval if chat_interval is not None else settings.NOTIFICATION_CHAT_INTERVAL_SECONDS
+        )
+        self.batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+        self.max_attempts = max_attempts or settings.NOTIFICATION_MAX_ATTEMPTS
+        self.poll_interval = poll_interval
+
+    async def claim_batch(self) -> List[NotificationOutbox]:
+        """Забрать пачку готовых к отправке строк и пометить их sending"""
+        now = datetime.now(timezone.utc)
+        due = select(NotificationOutbox.outbox_id).where(
+            or_(
+                and_(
+                    NotificationOutbox.status == "pending",
+                    NotificationOutbox.next_attempt_at <= now
+                ),
+                and_(
+                    NotificationOutbox.status == "sending",
+                    NotificationOutbox.locked_at < now - timedelta(seconds=STALE_LOCK_SECONDS)
+                )
+            )
+        ).order_by(
+            NotificationOutbox.next_attempt_at
+        ).limit(self.batch_size).with_for_update(skip_locked=True)
+
+        async with self.session_factory() as session:
+            result = await session.execute(
+                update(NotificationOutbox)
+                .where(NotificationOutbox.outbox_id.in_(due.scalar_subquery()))
+                .values(status="sending", locked_at=now)
+                .returning(NotificationOutbox)
+                .execution_options(synchronize_session=False)
+            )
+            rows = list(result.scalars().all())
+            await session.commit()
+        return rows
+
+    def _failure(
+        self,
+        row: NotificationOutbox,
+        attempts: int,
+        error: Exception,
+        retryable: bool,
+        retry_after: Optional[float] = None
+    ) -> Dict:
+        """Изменения для outbox после неудачной попытки: повтор с задержкой или failed"""
+        if retryable and attempts < self.max_attempts:
+            delay = retry_after if retry_after else backoff_delay(attempts)
+            return {
+                'outbox_id': row.outbox_id,
+                'status': "pending",
+                'attempts': attempts,
+                'next_attempt_at': datetime.now(timezone.utc) + timedelta(seconds=delay),
+                'locked_at': None,
+                'last_error': str(error),
+            }
+        return {
+            'outbox_id': row.outbox_id,
+            'status': "failed",
+            'attempts': attempts,
+            'locked_at': None,
+            'last_error': str(error),
+        }
+
+    async def _deliver(self, row: NotificationOutbox) -> Dict:
+        """Отправить одну строку; вернуть изменения для outbox (исключений не бросает)"""
+        attempts = row.attempts + 1
+        try:
+            await self.chat_limiter.wait(row.chat_id)
+            await self.bucket.acquire()
+            await self.client.send_message(row.chat_id, row.text)
+        except TelegramDeliveryError as error:
+            return self._failure(row, attempts, error, error.retryable, error.retry_after)
+        except Exception as error:
+            # Непредвиденная ошибка (разбор ответа, сторонний клиент и т.п.) не должна
+            # сорвать пачку: иначе статусы уже отправленных строк не будут записаны
+            logger.exception("Ошибка отправки outbox_id=%s", row.outbox_id)
+            return self._failure(row, attempts, error, retryable=True)
+
+        return {
+            'outbox_id': row.outbox_id,
+            'status': "sent",
+            'attempts': attempts,
+            'locked_at': None,
+            'last_error': None,
+            'sent_at': datetime.now(timezone.utc),
+        }
+
+    async def run_once(self) -> int:
+        """Обработать одну пачку; вернуть количество обработанных строк"""
+        rows = await self.claim_batch()
+        if not rows:
+            return 0
+
+        results = await asyncio.gather(*(self._deliver(row) for row in rows))
+
+        # Итоги пачки - bulk UPDATE по первичному ключу, по одному на набор колонок
+        async with self.session_factory() as session:
+            for status in ("sent", "pending", "failed"):
+                changes = [change for change in results if change['status'] == status]
+                if changes:
+                    await session.execute(update(NotificationOutbox), changes)
+            await session.commit()
+
+        self.chat_limiter.forget_idle()
+        return len(rows)
+
+    async def run_forever(self, stop_event: Optional[asyncio.Event] = None) -> None:
+        """Разбирать outbox до stop_event; при пустой очереди ждать poll_interval"""
+        stop_event = stop_event or asyncio.Event()
+        try:
+            while not stop_event.is_set():
+                try:
+                    processed = await self.run_once()
+                except Exception:
+                    # БД недоступна и т.п. - строки останутся в outbox, пробуем позже
+                    logger.exception("Ошибка обработки outbox")
+                    processed = 0
+                if processed == 0:
+                    try:
+                        await asyncio.wait_for(stop_event.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            await self.client.close()
@@ -0,0 +1,77 @@
+"""
+Notification outbox service: enqueue messages for the delivery worker
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.education import NotificationOutbox
+
+
+class OutboxService:
+    """Сервис очереди уведомлений на доставку"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def enqueue(
+        self,
+        recipients: List[Tuple[int, int]],
+        text: str,
+        notification_type: str,
+        stream_id: Optional[int] = None,
+        send_at: Optional[datetime] = None
+    ) -> List[int]:
+        """
+        Поставить сообщение в очередь для [(student_id, chat_id)] одной вставкой.
+
+        send_at - не отправлять раньше этого времени (по умолчанию - сразу).
+        Возвращает outbox_id в порядке recipients. Транзакцию фиксирует
+        вызывающий код (вместе с ключом идемпотентности запроса).
+        """
+        return await self.enqueue_messages(
+            [(student_id, chat_id, text) for student_id, chat_id in recipients],
+            notification_type,
+            stream_id=stream_id,
+            send_at=send_at
+        )
+
+    async def enqueue_messages(
+        self,
+        messages: List[Tuple[int, int, str]],
+        notification_type: str,
+        stream_id: Optional[int] = None,
+        send_at: Optional[datetime] = None
+    ) -> List[int]:
+        """Поставить в очередь персональные сообщения [(student_id, chat_id, текст)]"""
+        if not messages:
+            return []
+
+        values = {
+            'stream_id': stream_id,
+            'notification_type': notification_type,
+        }
+        if send_at is not None:
+            values['next_attempt_at'] = send_at
+
+        result = await self.db.execute(
+            insert(NotificationOutbox).returning(
+                NotificationOutbox.outbox_id, sort_by_parameter_order=True
+            ),
+            [
+                {**values, 'student_id': student_id, 'chat_id': chat_id, 'text': text}
+                for student_id, chat_id, text in messages
+            ]
+        )
+        return list(result.scalars().all())
+
+    async def get_stats(self) -> Dict[str, int]:
+        """Количество строк outbox по статусам"""
+        query = select(
+            NotificationOutbox.status,
+            func.count(NotificationOutbox.outbox_id)
+        ).group_by(NotificationOutbox.status)
+        result = await self.db.execute(query)
+        return {status: count for status, count in result}
@@ -0,0 +1,183 @@
+"""
+In-process rating cache with LRU/TTL eviction
+
+Ключ - (student_id, week_start, week_end, хэш RatingConfig). Записи
+сбрасываются после commit транзакций, меняющих сообщения и задания
+студента или расписание в пределах окна. Кэш локален для процесса:
+изменения, сделанные другими воркерами, видны не позже чем через TTL.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.education import Assignment, Message, Schedule
+from app.schemas.student import RatingConfig, StudentRating
+
+
+CacheKey = Tuple[int, date, date, str]
+
+# Ключ в session.info для изменений, ожидающих commit
+_PENDING_INVALIDATIONS = "rating_cache_pending_invalidations"
+
+
+def config_hash(config: Optional[RatingConfig] = None) -> str:
+    """Хэш весов RatingConfig (None - веса по умолчанию)"""
+    if config is None:
+        config = RatingConfig()
+    return hashlib.sha1(config.model_dump_json().encode()).hexdigest()[:16]
+
+
+class RatingCache:
+    """Ограниченный LRU кэш рейтингов с TTL"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[CacheKey, Tuple[float, StudentRating]]" = OrderedDict()
+        self._keys_by_student: Dict[int, Set[CacheKey]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(
+        student_id: int,
+        week_start: date,
+        week_end: date,
+        config: Optional[RatingConfig] = None
+    ) -> CacheKey:
+        return (student_id, week_start, week_end, config_hash(config))
+
+    def get(self, key: CacheKey) -> Optional[StudentRating]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        stored_at, rating = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return rating
+
+    def put(self, key: CacheKey, rating: StudentRating) -> None:
+        if self.max_size <= 0:
+            return
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self._entries[key] = (time.monotonic(), rating)
+        self._keys_by_student.setdefault(key[0], set()).add(key)
+
+        while len(self._entries) > self.max_size:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def invalidate(self, student_id: Optional[int] = None, day: Optional[date] = None) -> int:
+        """
+        Сбросить записи студента (или всех студентов) с окном, содержащим day.
+        Без day сбрасываются все окна.
+        """
+        if student_id is not None:
+            candidates = list(self._keys_by_student.get(student_id, ()))
+        else:
+            candidates = list(self._entries)
+
+        removed = 0
+        for key in candidates:
+            _, week_start, week_end, _ = key
+            if day is None or week_start <= day <= week_end:
+                self._remove(key)
+                removed += 1
+
+        self.invalidations += removed
+        return removed
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._keys_by_student.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+    def _remove(self, key: CacheKey) -> None:
+        self._entries.pop(key, None)
+        student_keys = self._keys_by_student.get(key[0])
+        if student_keys is not None:
+            student_keys.discard(key)
+            if not student_keys:
+                del self._keys_by_student[key[0]]
+
+
+rating_cache = RatingCache(
+    max_size=settings.RATING_CACHE_MAX_SIZE,
+    ttl_seconds=settings.RATING_CACHE_TTL_SECONDS
+)
+
+
+def _attribute_values(obj, attribute: str) -> Set:
+    """Текущее и прежнее (до изменения) значения атрибута"""
+    history = inspect(obj).attrs[attribute].history
+    values = list(history.added) + list(history.unchanged) + list(history.deleted)
+    if not values:
+        # Атрибут истек после commit и не менялся - дочитываем текущее значение
+        values = [getattr(obj, attribute)]
+    return {value for value in values if value is not None}
+
+
+def _collect_invalidations(session: Session, flush_context) -> None:
+    """Запомнить, какие записи кэша устареют после commit"""
+    pending = session.info.setdefault(_PENDING_INVALIDATIONS, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Message):
+            for student_id in _attribute_values(obj, 'sender_id'):
+                pending.add((student_id, None))
+        elif isinstance(obj, Assignment):
+            for student_id in _attribute_values(obj, 'student_id'):
+                pending.add((student_id, None))
+        elif isinstance(obj, Schedule):
+            # Расписание потока влияет на всех его студентов
+            for day in _attribute_values(obj, 'scheduled_date'):
+                pending.add((None, day))
+
+
+def _apply_invalidations(session: Session) -> None:
+    for student_id, day in session.info.pop(_PENDING_INVALIDATIONS, set()):
+        rating_cache.invalidate(student_id, day)
+
+
+def _discard_invalidations(session: Session) -> None:
+    session.info.pop(_PENDING_INVALIDATIONS, None)
+
+
+def register_cache_invalidation() -> None:
+    """Сбрасывать кэш рейтингов после commit изменений фактов"""
+    if not event.contains(Session, "after_flush", _collect_invalidations):
+        event.listen(Session, "after_flush", _collect_invalidations)
+        event.listen(Session, "after_commit", _apply_invalidations)
+        event.listen(Session, "after_rollback", _discard_invalidations)
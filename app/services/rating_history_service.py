@@ -0,0 +1,109 @@
+"""
+Rating history service: weekly rating time series per student
+"""
+from datetime import date, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.education import Student, StudentRatingHistory
+from app.services.student_service import REFRESH_CHUNK_SIZE, StudentService
+
+
+class RatingHistoryService:
+    """Сервис для истории недельных рейтингов"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def backfill(
+        self,
+        date_from: date,
+        date_to: date,
+        student_ids: Optional[List[int]] = None
+    ) -> int:
+        """
+        Посчитать и сохранить рейтинги по закрытым ISO неделям периода.
+
+        Факты всех недель берутся за один проход (get_weekly_series_facts),
+        рейтинги считаются с весами по умолчанию. По умолчанию обновляются
+        все активные студенты. Возвращает количество записанных строк.
+        """
+        first_week_start = date_from - timedelta(days=date_from.weekday())
+        last_closed_week_start = date.today() - timedelta(days=date.today().weekday() + 7)
+        last_week_start = min(date_to - timedelta(days=date_to.weekday()), last_closed_week_start)
+        if last_week_start < first_week_start:
+            return 0
+
+        if student_ids is None:
+            result = await self.db.execute(
+                select(Student.student_id).where(Student.is_active.is_(True))
+            )
+            student_ids = list(result.scalars().all())
+
+        student_service = StudentService(self.db)
+        written = 0
+        for offset in range(0, len(student_ids), REFRESH_CHUNK_SIZE):
+            chunk = student_ids[offset:offset + REFRESH_CHUNK_SIZE]
+            series = await student_service.get_weekly_series_facts(
+                chunk, first_week_start, last_week_start
+            )
+
+            for week_start, cohort_facts in series.items():
+                ratings = student_service.rate_cohort(cohort_facts)
+                rows = [
+                    {
+                        'student_id': rating.student_id,
+                        'week_start': week_start,
+                        'week_end': week_start + timedelta(days=6),
+                        'weekly_score': rating.weekly_score,
+                        'assignment_score': rating.assignment_score,
+                        'activity_score': rating.activity_score,
+                        'attendance_score': rating.attendance_score,
+                        'engagement_score': rating.engagement_score,
+                        'category': rating.category,
+                    }
+                    for rating in ratings.values()
+                ]
+                if not rows:
+                    continue
+
+                insert_query = pg_insert(StudentRatingHistory).values(rows)
+                insert_query = insert_query.on_conflict_do_update(
+                    index_elements=['student_id', 'week_start'],
+                    set_={
+                        **{
+                            column: insert_query.excluded[column]
+                            for column in rows[0]
+                            if column not in ('student_id', 'week_start')
+                        },
+                        'calculated_at': func.now()
+                    }
+                )
+                await self.db.execute(insert_query)
+                written += len(rows)
+
+            await self.db.commit()
+
+        return written
+
+    async def get_student_history(
+        self,
+        student_id: int,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None
+    ) -> List[StudentRatingHistory]:
+        """Получить историю рейтингов студента по неделям (по возрастанию)"""
+        conditions = [StudentRatingHistory.student_id == student_id]
+        if date_from is not None:
+            conditions.append(StudentRatingHistory.week_end >= date_from)
+        if date_to is not None:
+            conditions.append(StudentRatingHistory.week_start <= date_to)
+
+        query = select(StudentRatingHistory).where(and_(*conditions)).order_by(
+            StudentRatingHistory.week_start
+        )
+        result = await self.db.execute(query)
+        return list(result.scalars().all())
@@ -0,0 +1,134 @@
+"""
+Vectorized rating kernel: columnar scoring of a whole cohort with NumPy
+"""
+from typing import Dict, List
+
+import numpy as np
+
+from app.schemas.student import StudentFacts, RatingConfig
+
+
+# Ожидаемые недельные показатели
+EXPECTED_MESSAGES = 5  # Ожидаемое количество сообщений в неделю
+EXPECTED_HOURS = 10  # Ожидаемое количество часов в неделю
+EXPECTED_MATERIALS = 5  # Ожидаемое количество материалов
+
+# Пороги категорий рейтинга (от высшей к низшей)
+CATEGORY_THRESHOLDS = ((90, "high"), (70, "medium"), (50, "low"))
+DEFAULT_CATEGORY = "critical"
+
+
+def facts_to_columns(facts_list: List[StudentFacts]) -> Dict[str, np.ndarray]:
+    """Разложить факты группы студентов в колонки (по массиву на показатель)"""
+    def column(section: str, key: str) -> np.ndarray:
+        return np.fromiter(
+            (getattr(facts, section)[key] for facts in facts_list),
+            dtype=np.float64,
+            count=len(facts_list)
+        )
+
+    return {
+        'assignments_total': column('assignments', 'total'),
+        'assignments_completed': column('assignments', 'completed'),
+        'assignments_late': column('assignments', 'late'),
+        'average_grade': column('assignments', 'average_grade'),
+        'messages_sent': column('activity', 'messages_sent'),
+        'questions_asked': column('activity', 'questions_asked'),
+        'scheduled_classes': column('attendance', 'scheduled_classes'),
+        'attended': column('attendance', 'attended'),
+        'study_hours': column('engagement', 'study_hours'),
+        'materials_viewed': column('engagement', 'materials_viewed'),
+        'participation_score': column('engagement', 'participation_score'),
+    }
+
+
+def _safe_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """Поэлементное деление, 0 там где знаменатель равен 0"""
+    return np.divide(
+        numerator, denominator,
+        out=np.zeros_like(numerator, dtype=np.float64),
+        where=denominator != 0
+    )
+
+
+def assignment_scores(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Рейтинг по заданиям"""
+    total = columns['assignments_total']
+
+    # Базовый рейтинг по количеству выполненных заданий
+    completion_rate = _safe_divide(columns['assignments_completed'], total)
+    base_score = completion_rate * 80  # 80% за количество
+
+    # Бонус за качество (средняя оценка)
+    quality_bonus = (columns['average_grade'] / 100) * 20  # 20% за качество
+
+    # Штрафы за опоздания
+    late_penalty = columns['assignments_late'] * 5
+
+    score = np.clip(base_score + quality_bonus - late_penalty, 0, 100)
+    return np.where(total == 0, 0.0, score)
+
+
+def activity_scores(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Рейтинг по активности"""
+    # Базовый рейтинг по количеству сообщений
+    base_score = np.minimum((columns['messages_sent'] / EXPECTED_MESSAGES) * 100, 100)
+
+    # Бонус за качественные вопросы
+    quality_bonus = columns['questions_asked'] * 3
+
+    return np.clip(base_score + quality_bonus, 0, 100)
+
+
+def attendance_scores(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Рейтинг по посещаемости"""
+    scheduled = columns['scheduled_classes']
+    attendance_rate = _safe_divide(columns['attended'], scheduled)
+
+    # Если нет занятий, считаем идеальную посещаемость
+    return np.where(scheduled == 0, 100.0, attendance_rate * 100)
+
+
+def engagement_scores(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Рейтинг по вовлеченности"""
+    hours_score = np.minimum((columns['study_hours'] / EXPECTED_HOURS) * 50, 50)
+    materials_score = np.minimum((columns['materials_viewed'] / EXPECTED_MATERIALS) * 30, 30)
+    participation_score = np.minimum(columns['participation_score'] * 0.2, 20)
+
+    return hours_score + materials_score + participation_score
+
+
+def rating_categories(weekly_score: np.ndarray) -> np.ndarray:
+    """Категории рейтинга"""
+    return np.select(
+        [weekly_score >= threshold for threshold, _ in CATEGORY_THRESHOLDS],
+        [category for _, category in CATEGORY_THRESHOLDS],
+        default=DEFAULT_CATEGORY
+    )
+
+
+def score_columns(columns: Dict[str, np.ndarray], config: RatingConfig) -> Dict[str, np.ndarray]:
+    """
+    Рассчитать компоненты рейтинга, итоговый weekly_score и категорию
+    для всей группы сразу. Значения не округлены.
+    """
+    assignment_score = assignment_scores(columns)
+    activity_score = activity_scores(columns)
+    attendance_score = attendance_scores(columns)
+    engagement_score = engagement_scores(columns)
+
+    weekly_score = (
+        assignment_score * config.assignment_weight +
+        activity_score * config.activity_weight +
+        attendance_score * config.attendance_weight +
+        engagement_score * config.engagement_weight
+    )
+
+    return {
+        'assignment_score': assignment_score,
+        'activity_score': activity_score,
+        'attendance_score': attendance_score,
+        'engagement_score': engagement_score,
+        'weekly_score': weekly_score,
+        'category': rating_categories(weekly_score),
+    }
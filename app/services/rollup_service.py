@@ -0,0 +1,419 @@
+"""
+Rollup counters for messages and assignments
+
+Счетчики student_daily_counters и chat_counters обновляются в той же
+транзакции, что и запись сообщения или задания: обработчики сессии
+SQLAlchemy (before_flush/after_flush) ловят все ORM записи - API, админку
+и скрипты. Обработчики подключает register_rollup_listeners() (app/main.py
+и скрипты, которые пишут данные), только при ROLLUP_COUNTERS_ENABLED. Новые сообщения прибавляются к
+счетчикам, а изменение или удаление сообщения пересчитывает затронутые
+чаты и дни студентов по сырым данным.
+
+Записи в обход ORM (массовые UPDATE/DELETE, SQL, дампы) и записи при
+выключенных счетчиках не учитываются - после них счетчики пересобираются
+rebuild_counters() (python scripts/rebuild_counters.py).
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import BigInteger, Date, Numeric, and_, delete, event, func, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+
+from app.core.config import settings
+from app.models.education import (
+    Assignment, AssignmentStatus, ChatCounter, Message, SenderType,
+    StudentDailyCounter, StudentWeeklyFacts
+)
+
+
+# Ключ в session.info для корзин (student_id, day), затронутых изменением заданий
+_PENDING_ASSIGNMENT_BUCKETS = "rollup_pending_assignment_buckets"
+
+# Ключи в session.info для чатов и корзин (student_id, day), затронутых изменением сообщений
+_PENDING_MESSAGE_CHATS = "rollup_pending_message_chats"
+_PENDING_MESSAGE_BUCKETS = "rollup_pending_message_buckets"
+
+
+def _assignment_aggregates() -> List[Any]:
+    """Агрегаты заданий в порядке колонок StudentDailyCounter"""
+    is_completed = Assignment.status == AssignmentStatus.COMPLETED
+    return [
+        func.count(Assignment.assignment_id),
+        func.count(Assignment.assignment_id).filter(is_completed),
+        func.count(Assignment.assignment_id).filter(
+            and_(is_completed, Assignment.submitted_at <= Assignment.deadline)
+        ),
+        func.count(Assignment.assignment_id).filter(
+            and_(is_completed, Assignment.submitted_at > Assignment.deadline)
+        ),
+        func.coalesce(func.sum(Assignment.grade), 0),
+        func.count(Assignment.grade),
+    ]
+
+
+_ASSIGNMENT_COLUMNS = [
+    'assignments_total', 'assignments_completed', 'assignments_on_time',
+    'assignments_late', 'grade_sum', 'grade_count'
+]
+
+
+def _message_student_counters_query(message_filter) -> Any:
+    """INSERT ... SELECT дневных счетчиков сообщений студентов"""
+    source = select(
+        Message.sender_id,
+        func.date(Message.created_at),
+        func.count(Message.message_id),
+        func.count(Message.message_id).filter(Message.text_content.isnot(None)),
+        func.max(Message.created_at)
+    ).where(
+        and_(
+            message_filter,
+            Message.sender_type == SenderType.USER,
+            Message.sender_id.isnot(None)
+        )
+    ).group_by(Message.sender_id, func.date(Message.created_at))
+
+    return pg_insert(StudentDailyCounter).from_select(
+        ['student_id', 'day', 'messages_sent', 'questions_asked', 'last_activity'],
+        source
+    )
+
+
+def _chat_counters_query(message_filter, new_senders_filter) -> Any:
+    """INSERT ... SELECT счетчиков чатов"""
+    source = select(
+        Message.chat_id,
+        func.count(Message.message_id),
+        func.count(Message.message_id).filter(Message.sender_type == SenderType.USER),
+        func.count(Message.message_id).filter(Message.sender_type == SenderType.BOT),
+        func.count(func.distinct(Message.sender_id)).filter(
+            and_(
+                Message.sender_type == SenderType.USER,
+                Message.sender_id.isnot(None),
+                new_senders_filter
+            )
+        ),
+        func.max(Message.created_at)
+    ).where(message_filter).group_by(Message.chat_id)
+
+    return pg_insert(ChatCounter).from_select(
+        ['chat_id', 'total_messages', 'user_messages', 'bot_messages', 'active_users', 'last_activity'],
+        source
+    )
+
+
+def _apply_new_messages(connection, message_ids: List[int]) -> None:
+    """Прибавить к счетчикам только что вставленные сообщения"""
+    new_filter = Message.message_id.in_(message_ids)
+
+    student_query = _message_student_counters_query(new_filter)
+    student_query = student_query.on_conflict_do_update(
+        index_elements=['student_id', 'day'],
+        set_={
+            'messages_sent': StudentDailyCounter.messages_sent + student_query.excluded.messages_sent,
+            'questions_asked': StudentDailyCounter.questions_asked + student_query.excluded.questions_asked,
+            'last_activity': func.greatest(StudentDailyCounter.last_activity, student_query.excluded.last_activity)
+        }
+    )
+    connection.execute(student_query)
+
+    # Новый участник чата - у него нет более ранних сообщений в этом чате. Чужие
+    # незафиксированные сообщения NOT EXISTS не видит, поэтому запись в чат
+    # сериализуется блокировкой чата до конца транзакции: два первых сообщения
+    # одного пользователя из параллельных транзакций не посчитаются дважды
+    chat_ids = connection.execute(
+        select(Message.chat_id).where(new_filter).distinct().order_by(Message.chat_id)
+    ).scalars().all()
+    _lock_chats(connection, chat_ids)
+
+    earlier = aliased(Message)
+    is_new_sender = ~select(earlier.message_id).where(
+        and_(
+            earlier.chat_id == Message.chat_id,
+            earlier.sender_id == Message.sender_id,
+            earlier.sender_type == SenderType.USER,
+            earlier.message_id.notin_(message_ids)
+        )
+    ).exists()
+
+    chat_query = _chat_counters_query(new_filter, is_new_sender)
+    chat_query = chat_query.on_conflict_do_update(
+        index_elements=['chat_id'],
+        set_={
+            'total_messages': ChatCounter.total_messages + chat_query.excluded.total_messages,
+            'user_messages': ChatCounter.user_messages + chat_query.excluded.user_messages,
+            'bot_messages': ChatCounter.bot_messages + chat_query.excluded.bot_messages,
+            'active_users': ChatCounter.active_users + chat_query.excluded.active_users,
+            'last_activity': func.greatest(ChatCounter.last_activity, chat_query.excluded.last_activity)
+        }
+    )
+    connection.execute(chat_query)
+
+
+def _lock_chats(connection, chat_ids: List[int]) -> None:
+    """Блокировки чатов до конца транзакции (в порядке chat_id, чтобы не было взаимоблокировок)"""
+    for chat_id in sorted(chat_ids):
+        connection.execute(select(func.pg_advisory_xact_lock(literal(chat_id, BigInteger))))
+
+
+def _message_buckets(connection, message_ids: List[int]) -> Tuple[Set[int], Set[Tuple[int, date]]]:
+    """Чаты и корзины (student_id, day), в которые попадают сообщения"""
+    query = select(
+        Message.chat_id, Message.sender_type, Message.sender_id, func.date(Message.created_at)
+    ).where(Message.message_id.in_(message_ids))
+    chats = set()
+    buckets = set()
+    for chat_id, sender_type, sender_id, day in connection.execute(query):
+        chats.add(chat_id)
+        if sender_type == SenderType.USER and sender_id is not None:
+            buckets.add((sender_id, day))
+    return chats, buckets
+
+
+def _recompute_chat(connection, chat_id: int) -> None:
+    """Пересчитать счетчики чата по сырым данным (строки нет, если сообщений не осталось)"""
+    _lock_chats(connection, [chat_id])
+    connection.execute(delete(ChatCounter).where(ChatCounter.chat_id == chat_id))
+    connection.execute(_chat_counters_query(Message.chat_id == chat_id, literal(True)))
+
+
+def _recompute_message_bucket(connection, student_id: int, day: date) -> None:
+    """Пересчитать счетчики сообщений студента за день по сырым данным"""
+    source = select(
+        literal(student_id, BigInteger),
+        literal(day, Date),
+        func.count(Message.message_id),
+        func.count(Message.message_id).filter(Message.text_content.isnot(None)),
+        func.max(Message.created_at)
+    ).where(
+        and_(
+            Message.sender_id == student_id,
+            Message.sender_type == SenderType.USER,
+            func.date(Message.created_at) == day
+        )
+    )
+    query = pg_insert(StudentDailyCounter).from_select(
+        ['student_id', 'day', 'messages_sent', 'questions_asked', 'last_activity'], source
+    )
+    query = query.on_conflict_do_update(
+        index_elements=['student_id', 'day'],
+        set_={
+            column: query.excluded[column]
+            for column in ('messages_sent', 'questions_asked', 'last_activity')
+        }
+    )
+    connection.execute(query)
+    _invalidate_weekly_facts(connection, student_id, day)
+
+
+def _invalidate_weekly_facts(connection, student_id: int, day: date) -> None:
+    """Материализованные факты закрытой недели устарели - читаем их заново по сырым данным"""
+    week_start = day - timedelta(days=day.weekday())
+    if week_start + timedelta(days=6) < date.today():
+        iso_year, iso_week, _ = week_start.isocalendar()
+        connection.execute(
+            delete(StudentWeeklyFacts).where(
+                and_(
+                    StudentWeeklyFacts.student_id == student_id,
+                    StudentWeeklyFacts.iso_year == iso_year,
+                    StudentWeeklyFacts.iso_week == iso_week
+                )
+            )
+        )
+
+
+def _assignment_buckets(connection, assignment_ids: List[int]) -> Set[Tuple[int, date]]:
+    """Корзины (student_id, day), в которые попадают задания"""
+    query = select(
+        Assignment.student_id, func.date(Assignment.created_at)
+    ).where(Assignment.assignment_id.in_(assignment_ids)).distinct()
+    return {(row[0], row[1]) for row in connection.execute(query)}
+
+
+def _recompute_assignment_bucket(connection, student_id: int, day: date) -> None:
+    """Пересчитать счетчики заданий студента за день по сырым данным"""
+    source = select(
+        literal(student_id, BigInteger),
+        literal(day, Date),
+        *_assignment_aggregates()
+    ).where(
+        and_(
+            Assignment.student_id == student_id,
+            func.date(Assignment.created_at) == day
+        )
+    )
+    query = pg_insert(StudentDailyCounter).from_select(
+        ['student_id', 'day', *_ASSIGNMENT_COLUMNS], source
+    )
+    query = query.on_conflict_do_update(
+        index_elements=['student_id', 'day'],
+        set_={column: query.excluded[column] for column in _ASSIGNMENT_COLUMNS}
+    )
+    connection.execute(query)
+    _invalidate_weekly_facts(connection, student_id, day)
+
+
+def _changed_ids(session: Session, model, key: str) -> List[int]:
+    """Первичные ключи измененных и удаленных объектов модели (до flush)"""
+    return [
+        getattr(obj, key)
+        for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, model) and getattr(obj, key) is not None
+        and (obj in session.deleted or session.is_modified(obj))
+    ]
+
+
+def _before_flush(session: Session, flush_context, instances) -> None:
+    """Запомнить корзины заданий и сообщений до изменения (старые значения)"""
+    changed_ids = _changed_ids(session, Assignment, 'assignment_id')
+    if changed_ids:
+        buckets = session.info.setdefault(_PENDING_ASSIGNMENT_BUCKETS, set())
+        buckets.update(_assignment_buckets(session.connection(), changed_ids))
+
+    changed_message_ids = _changed_ids(session, Message, 'message_id')
+    if changed_message_ids:
+        chats, buckets = _message_buckets(session.connection(), changed_message_ids)
+        session.info.setdefault(_PENDING_MESSAGE_CHATS, set()).update(chats)
+        session.info.setdefault(_PENDING_MESSAGE_BUCKETS, set()).update(buckets)
+
+
+def _after_flush(session: Session, flush_context) -> None:
+    """Обновить счетчики по результатам flush в той же транзакции"""
+    connection = session.connection()
+
+    new_message_ids = [
+        obj.message_id for obj in session.new if isinstance(obj, Message)
+    ]
+    if new_message_ids:
+        _apply_new_messages(connection, new_message_ids)
+
+    # Измененные и удаленные сообщения: старые (из before_flush) и новые корзины
+    message_chats = session.info.pop(_PENDING_MESSAGE_CHATS, set())
+    message_buckets = session.info.pop(_PENDING_MESSAGE_BUCKETS, set())
+    updated_message_ids = [
+        obj.message_id
+        for obj in session.dirty
+        if isinstance(obj, Message) and obj not in session.deleted
+    ]
+    if message_chats and updated_message_ids:
+        chats, buckets = _message_buckets(connection, updated_message_ids)
+        message_chats |= chats
+        message_buckets |= buckets
+    for chat_id in sorted(message_chats):
+        _recompute_chat(connection, chat_id)
+    for student_id, day in sorted(message_buckets):
+        _recompute_message_bucket(connection, student_id, day)
+
+    buckets = session.info.pop(_PENDING_ASSIGNMENT_BUCKETS, set())
+    written_ids = [
+        obj.assignment_id
+        for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, Assignment) and obj not in session.deleted
+    ]
+    if written_ids:
+        buckets |= _assignment_buckets(connection, written_ids)
+
+    for student_id, day in sorted(buckets):
+        _recompute_assignment_bucket(connection, student_id, day)
+
+
+def _discard_pending(session: Session) -> None:
+    for key in (_PENDING_ASSIGNMENT_BUCKETS, _PENDING_MESSAGE_CHATS, _PENDING_MESSAGE_BUCKETS):
+        session.info.pop(key, None)
+
+
+def register_rollup_listeners() -> None:
+    """Подключить обновление счетчиков ко всем ORM сессиям (только при ROLLUP_COUNTERS_ENABLED)"""
+    if not settings.ROLLUP_COUNTERS_ENABLED:
+        return
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "before_flush", _before_flush)
+        event.listen(Session, "after_flush", _after_flush)
+        event.listen(Session, "after_rollback", _discard_pending)
+
+
+class RollupService:
+    """Сервис для чтения и пересборки счетчиков"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_student_counter_facts(
+        self,
+        student_ids: List[int],
+        week_start: date,
+        week_end: date
+    ) -> Dict[int, Any]:
+        """
+        Агрегаты заданий и активности группы по дневным счетчикам.
+
+        Строки подписаны так же, как агрегаты StudentService. Сырой запрос
+        сравнивает created_at <= week_end, т.е. до полуночи week_end, поэтому
+        последний день периода сюда не входит.
+        """
+        query = select(
+            StudentDailyCounter.student_id,
+            func.sum(StudentDailyCounter.assignments_total).label('total'),
+            func.sum(StudentDailyCounter.assignments_completed).label('completed'),
+            func.sum(StudentDailyCounter.assignments_on_time).label('on_time'),
+            func.sum(StudentDailyCounter.assignments_late).label('late'),
+            (
+                func.sum(StudentDailyCounter.grade_sum).cast(Numeric) /
+                func.nullif(func.sum(StudentDailyCounter.grade_count), 0)
+            ).label('average_grade'),
+            func.sum(StudentDailyCounter.messages_sent).label('messages_sent'),
+            func.sum(StudentDailyCounter.questions_asked).label('questions_asked'),
+            func.max(StudentDailyCounter.last_activity).label('last_activity')
+        ).where(
+            and_(
+                StudentDailyCounter.student_id.in_(student_ids),
+                StudentDailyCounter.day >= week_start,
+                StudentDailyCounter.day < week_end
+            )
+        ).group_by(StudentDailyCounter.student_id)
+
+        result = await self.db.execute(query)
+        return {row.student_id: row for row in result}
+
+    async def get_chat_counter(self, chat_id: int) -> Optional[ChatCounter]:
+        """Получить счетчики чата"""
+        query = select(ChatCounter).where(ChatCounter.chat_id == chat_id)
+        result = await self.db.execute(query)
+        return result.scalar_one_or_none()
+
+    async def rebuild_counters(self) -> Dict[str, int]:
+        """Пересобрать все счетчики по сырым данным (сверка)"""
+        await self.db.execute(delete(StudentDailyCounter))
+        await self.db.execute(delete(ChatCounter))
+
+        # Сообщения студентов по дням
+        await self.db.execute(_message_student_counters_query(Message.message_id.isnot(None)))
+
+        # Задания по дням (поверх строк сообщений)
+        source = select(
+            Assignment.student_id,
+            func.date(Assignment.created_at),
+            *_assignment_aggregates()
+        ).group_by(Assignment.student_id, func.date(Assignment.created_at))
+        assignments_query = pg_insert(StudentDailyCounter).from_select(
+            ['student_id', 'day', *_ASSIGNMENT_COLUMNS], source
+        )
+        assignments_query = assignments_query.on_conflict_do_update(
+            index_elements=['student_id', 'day'],
+            set_={column: assignments_query.excluded[column] for column in _ASSIGNMENT_COLUMNS}
+        )
+        await self.db.execute(assignments_query)
+
+        # Чаты: при полной пересборке каждый отправитель считается один раз
+        await self.db.execute(_chat_counters_query(Message.message_id.isnot(None), literal(True)))
+
+        await self.db.commit()
+
+        student_rows = await self.db.execute(select(func.count()).select_from(StudentDailyCounter))
+        chat_rows = await self.db.execute(select(func.count()).select_from(ChatCounter))
+        return {
+            'student_daily_counters': student_rows.scalar() or 0,
+            'chat_counters': chat_rows.scalar() or 0
+        }
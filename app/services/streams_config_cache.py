@@ -0,0 +1,93 @@
+"""
+In-process cache of the /rating/streams listing with ETag
+
+n8n опрашивает /rating/streams часто, а конфигурации меняются редко.
+Кэшируется готовое JSON тело ответа и его ETag; сбрасывается после commit
+транзакций, меняющих потоки или их конфигурации уведомлений (в том числе
+POST/PUT /rating/streams/{id}/config и админки). Изменения из других
+процессов видны не позже чем через STREAMS_CONFIG_CACHE_TTL_SECONDS.
+"""
+import hashlib
+import time
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.education import Stream, StreamNotificationConfig
+
+
+# Ключ в session.info: транзакция меняет потоки или их конфигурации
+_PENDING_INVALIDATION = "streams_config_cache_pending_invalidation"
+
+
+class StreamsConfigCache:
+    """Кэш тела ответа /rating/streams (одна запись на текущий день)"""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self._entry: Optional[Tuple[date, float, str, bytes]] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, today: date) -> Optional[Tuple[str, bytes]]:
+        """(ETag, тело) или None, если кэш пуст, устарел или построен в другой день"""
+        entry = self._entry
+        if entry is None or entry[0] != today or time.monotonic() - entry[1] > self.ttl_seconds:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[2], entry[3]
+
+    def put(self, today: date, body: bytes, generation: int) -> Tuple[str, bytes]:
+        """
+        Сохранить тело ответа. generation - значение self.generation до
+        запроса к БД: если кэш успели сбросить, тело не сохраняется.
+        """
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if generation == self.generation:
+            self._entry = (today, time.monotonic(), etag, body)
+        return etag, body
+
+    def invalidate(self) -> None:
+        self.generation += 1
+        self.invalidations += 1
+        self._entry = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+streams_config_cache = StreamsConfigCache(settings.STREAMS_CONFIG_CACHE_TTL_SECONDS)
+
+
+def _collect_invalidation(session: Session, flush_context) -> None:
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Stream, StreamNotificationConfig)):
+            session.info[_PENDING_INVALIDATION] = True
+            return
+
+
+def _apply_invalidation(session: Session) -> None:
+    if session.info.pop(_PENDING_INVALIDATION, False):
+        streams_config_cache.invalidate()
+
+
+def _discard_invalidation(session: Session) -> None:
+    session.info.pop(_PENDING_INVALIDATION, None)
+
+
+def register_streams_config_invalidation() -> None:
+    """Сбрасывать кэш /rating/streams после commit изменений потоков и конфигураций"""
+    if not event.contains(Session, "after_flush", _collect_invalidation):
+        event.listen(Session, "after_flush", _collect_invalidation)
+        event.listen(Session, "after_commit", _apply_invalidation)
+        event.listen(Session, "after_rollback", _discard_invalidation)
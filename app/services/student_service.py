@@ -1,16 +1,94 @@
 """
 Student service for business logic
 """
-from datetime import datetime, date
+import heapq
+import time
+from datetime import datetime, date, timedelta
 from typing import List, Optional, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_
+from sqlalchemy import Date, cast, select, func, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from app.models.education import Student, Assignment, Message, Schedule, Stream
+from app.models.education import (
+    Student, Assignment, AssignmentStatus, Message, Schedule, SenderType,
+    StudentWeeklyFacts, students_streams
+)
 from app.schemas.student import (
     StudentCreate, StudentUpdate, StudentFacts, 
     StudentRating, RatingConfig
 )
+from app.core.config import settings
+from app.services import rating_kernel
+from app.services.rating_cache import rating_cache
+from app.services.rollup_service import RollupService
+
+
+# Размер пачки студентов при обновлении student_weekly_facts
+REFRESH_CHUNK_SIZE = 1000
+
+
+def is_closed_iso_week(week_start: date, week_end: date) -> bool:
+    """Период - целая ISO неделя (пн-вс), которая уже закончилась"""
+    return (
+        week_start.weekday() == 0
+        and week_end == week_start + timedelta(days=6)
+        and week_end < date.today()
+    )
+
+
+def _elapsed_ms(started: float) -> float:
+    """Время в миллисекундах с момента started (perf_counter)"""
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+def rank_indices(
+    facts_list: List[StudentFacts],
+    scores: Dict[str, Any],
+    limit: Optional[int] = None,
+    lowest: bool = False
+) -> List[int]:
+    """
+    Индексы facts_list в порядке рейтинга (первые limit).
+    
+    scores - результат rating_kernel.score_columns для facts_list. При
+    равенстве weekly_score порядок определяют assignment_score, затем
+    student_id (по возрастанию).
+    """
+    # Округляем так же, как rate_cohort, чтобы порядок совпадал с отдаваемыми баллами
+    weekly_scores = [round(float(score), 2) for score in scores['weekly_score']]
+    assignment_scores = [round(float(score), 2) for score in scores['assignment_score']]
+    
+    # Для топа баллы сравниваются по убыванию, для последних - по возрастанию
+    sign = 1 if lowest else -1
+    def rank_key(index: int):
+        return (
+            sign * weekly_scores[index],
+            sign * assignment_scores[index],
+            facts_list[index].student_id
+        )
+    
+    if limit is None:
+        return sorted(range(len(facts_list)), key=rank_key)
+    return heapq.nsmallest(limit, range(len(facts_list)), key=rank_key)
+
+
+def select_recipients(
+    facts_list: List[StudentFacts],
+    scores: Dict[str, Any],
+    allowed: List[int],
+    limit: Optional[int] = None,
+    lowest: bool = False
+) -> List[StudentFacts]:
+    """
+    Отбор получателей рассылки: среди разрешенных антиповтором (allowed -
+    индексы facts_list) первые limit по рейтингу. Общий шаг планировщика
+    и сухого прогона.
+    """
+    if not allowed:
+        return []
+    allowed_facts = [facts_list[index] for index in allowed]
+    allowed_scores = {column: values[allowed] for column, values in scores.items()}
+    return [allowed_facts[index] for index in rank_indices(allowed_facts, allowed_scores, limit, lowest)]
 
 
 class StudentService:
@@ -92,107 +170,415 @@ class StudentService:
         week_end: date
     ) -> StudentFacts:
         """Получить факты о студенте за период"""
+        cohort_facts = await self.get_cohort_facts([student_id], week_start, week_end)
+        return cohort_facts[student_id]
+    
+    async def get_cohort_facts(
+        self,
+        student_ids: List[int],
+        week_start: date,
+        week_end: date
+    ) -> Dict[int, StudentFacts]:
+        """
+        Получить факты за период для группы студентов.
+        
+        Для закрытой ISO недели факты сначала берутся из student_weekly_facts,
+        пересчитываются только студенты, которых нет в таблице.
+        Остальные периоды (в т.ч. текущая неделя) считаются по сырым данным.
+        """
+        student_ids = list(dict.fromkeys(student_ids))
+        if not student_ids:
+            return {}
+        
+        if not is_closed_iso_week(week_start, week_end):
+            return await self._compute_cohort_facts(student_ids, week_start, week_end)
+        
+        cohort_facts = await self._load_weekly_facts(student_ids, week_start, week_end)
+        missing_ids = [student_id for student_id in student_ids if student_id not in cohort_facts]
+        if missing_ids:
+            cohort_facts.update(
+                await self._compute_cohort_facts(missing_ids, week_start, week_end)
+            )
         
-        # Данные по заданиям
+        return {student_id: cohort_facts[student_id] for student_id in student_ids}
+    
+    async def _compute_cohort_facts(
+        self,
+        student_ids: List[int],
+        week_start: date,
+        week_end: date
+    ) -> Dict[int, StudentFacts]:
+        """
+        Посчитать факты группы без материализованных недель.
+        
+        Все агрегаты считаются фиксированным числом GROUP BY запросов
+        (по одному на задания, активность и посещаемость) независимо
+        от размера группы. При ROLLUP_COUNTERS_ENABLED задания и активность
+        читаются из дневных счетчиков.
+        """
+        if settings.ROLLUP_COUNTERS_ENABLED:
+            # Задания и активность из дневных счетчиков (одна строка на студента)
+            counter_rows = await RollupService(self.db).get_student_counter_facts(
+                student_ids, week_start, week_end
+            )
+            assignments_rows = activity_rows = counter_rows
+        else:
+            assignments_rows = await self._query_assignment_rows(student_ids, week_start, week_end)
+            activity_rows = await self._query_activity_rows(student_ids, week_start, week_end)
+        
+        # Данные по посещаемости (занятия всех потоков студента)
+        attendance_query = select(
+            students_streams.c.student_id,
+            func.count(Schedule.schedule_id).label('scheduled_classes'),
+            func.count(Schedule.schedule_id).filter(Schedule.is_completed.is_(True)).label('attended')
+        ).join(
+            students_streams, students_streams.c.stream_id == Schedule.stream_id
+        ).where(
+            and_(
+                students_streams.c.student_id.in_(student_ids),
+                Schedule.scheduled_date >= week_start,
+                Schedule.scheduled_date <= week_end
+            )
+        ).group_by(students_streams.c.student_id)
+        
+        attendance_result = await self.db.execute(attendance_query)
+        attendance_rows = {row.student_id: row for row in attendance_result}
+        
+        return {
+            student_id: self._build_student_facts(
+                student_id,
+                week_start,
+                week_end,
+                assignments_rows.get(student_id),
+                activity_rows.get(student_id),
+                attendance_rows.get(student_id)
+            )
+            for student_id in student_ids
+        }
+    
+    async def get_weekly_series_facts(
+        self,
+        student_ids: List[int],
+        first_week_start: date,
+        last_week_start: date
+    ) -> Dict[date, Dict[int, StudentFacts]]:
+        """
+        Факты группы по всем ISO неделям периода за один проход.
+        
+        Агрегаты группируются по (студент, неделя) - три запроса на весь
+        период вместо трех на каждую неделю. Границы недели те же, что у
+        get_cohort_facts: created_at от начала понедельника до начала
+        воскресенья (week_end сравнивается как дата). Результат:
+        {понедельник недели: {student_id: факты}}, недели без данных - нулевые.
+        """
+        student_ids = list(dict.fromkeys(student_ids))
+        first_week_start = first_week_start - timedelta(days=first_week_start.weekday())
+        last_week_start = last_week_start - timedelta(days=last_week_start.weekday())
+        last_week_end = last_week_start + timedelta(days=6)
+        if not student_ids or last_week_start < first_week_start:
+            return {}
+        
+        # Задания по неделям
+        assignment_week = func.date_trunc('week', Assignment.created_at)
         assignments_query = select(
+            Assignment.student_id,
+            cast(assignment_week, Date).label('week_start'),
             func.count(Assignment.assignment_id).label('total'),
-            func.count(Assignment.assignment_id).filter(Assignment.status == 'completed').label('completed'),
+            func.count(Assignment.assignment_id).filter(Assignment.status == AssignmentStatus.COMPLETED).label('completed'),
             func.count(Assignment.assignment_id).filter(
-                and_(Assignment.status == 'completed', Assignment.submitted_at <= Assignment.deadline)
+                and_(Assignment.status == AssignmentStatus.COMPLETED, Assignment.submitted_at <= Assignment.deadline)
             ).label('on_time'),
             func.count(Assignment.assignment_id).filter(
-                and_(Assignment.status == 'completed', Assignment.submitted_at > Assignment.deadline)
+                and_(Assignment.status == AssignmentStatus.COMPLETED, Assignment.submitted_at > Assignment.deadline)
             ).label('late'),
             func.avg(Assignment.grade).label('average_grade')
         ).where(
             and_(
-                Assignment.student_id == student_id,
-                Assignment.created_at >= week_start,
-                Assignment.created_at <= week_end
+                Assignment.student_id.in_(student_ids),
+                Assignment.created_at >= first_week_start,
+                Assignment.created_at <= last_week_end,
+                Assignment.created_at <= assignment_week + timedelta(days=6)
             )
-        )
+        ).group_by(Assignment.student_id, assignment_week)
         
         assignments_result = await self.db.execute(assignments_query)
-        assignments_data = assignments_result.first()
+        assignments_rows = {(row.student_id, row.week_start): row for row in assignments_result}
         
-        # Данные по активности (сообщения)
+        # Сообщения по неделям
+        message_week = func.date_trunc('week', Message.created_at)
         activity_query = select(
+            Message.sender_id,
+            cast(message_week, Date).label('week_start'),
             func.count(Message.message_id).label('messages_sent'),
             func.count(Message.message_id).filter(Message.text_content.isnot(None)).label('questions_asked'),
             func.max(Message.created_at).label('last_activity')
         ).where(
             and_(
-                Message.sender_id == student_id,
-                Message.sender_type == 'user',
-                Message.created_at >= week_start,
-                Message.created_at <= week_end
+                Message.sender_id.in_(student_ids),
+                Message.sender_type == SenderType.USER,
+                Message.created_at >= first_week_start,
+                Message.created_at <= last_week_end,
+                Message.created_at <= message_week + timedelta(days=6)
             )
-        )
+        ).group_by(Message.sender_id, message_week)
         
         activity_result = await self.db.execute(activity_query)
-        activity_data = activity_result.first()
+        activity_rows = {(row.sender_id, row.week_start): row for row in activity_result}
         
-        # Данные по посещаемости
+        # Посещаемость по неделям
+        schedule_week = cast(func.date_trunc('week', Schedule.scheduled_date), Date)
         attendance_query = select(
+            students_streams.c.student_id,
+            schedule_week.label('week_start'),
             func.count(Schedule.schedule_id).label('scheduled_classes'),
             func.count(Schedule.schedule_id).filter(Schedule.is_completed.is_(True)).label('attended')
+        ).join(
+            students_streams, students_streams.c.stream_id == Schedule.stream_id
         ).where(
             and_(
-                Schedule.stream_id.in_(
-                    select(Stream.stream_id).join(Student.streams).where(Student.student_id == student_id)
-                ),
-                Schedule.scheduled_date >= week_start,
-                Schedule.scheduled_date <= week_end
+                students_streams.c.student_id.in_(student_ids),
+                Schedule.scheduled_date >= first_week_start,
+                Schedule.scheduled_date <= last_week_end
             )
-        )
+        ).group_by(students_streams.c.student_id, schedule_week)
         
         attendance_result = await self.db.execute(attendance_query)
-        attendance_data = attendance_result.first()
+        attendance_rows = {(row.student_id, row.week_start): row for row in attendance_result}
+        
+        series = {}
+        week_start = first_week_start
+        while week_start <= last_week_start:
+            week_end = week_start + timedelta(days=6)
+            series[week_start] = {
+                student_id: self._build_student_facts(
+                    student_id,
+                    week_start,
+                    week_end,
+                    assignments_rows.get((student_id, week_start)),
+                    activity_rows.get((student_id, week_start)),
+                    attendance_rows.get((student_id, week_start))
+                )
+                for student_id in student_ids
+            }
+            week_start += timedelta(days=7)
         
-        # Данные по вовлеченности (упрощенная версия)
-        engagement_query = select(
-            func.count(Assignment.assignment_id).label('study_hours'),
-            func.count(Assignment.assignment_id).label('materials_viewed'),
-            func.avg(Assignment.grade).label('participation_score')
+        return series
+    
+    async def _query_assignment_rows(
+        self,
+        student_ids: List[int],
+        week_start: date,
+        week_end: date
+    ) -> Dict[int, Any]:
+        """Агрегаты заданий группы по сырым данным"""
+        # Данные по заданиям (из них же считается вовлеченность)
+        assignments_query = select(
+            Assignment.student_id,
+            func.count(Assignment.assignment_id).label('total'),
+            func.count(Assignment.assignment_id).filter(Assignment.status == 'completed').label('completed'),
+            func.count(Assignment.assignment_id).filter(
+                and_(Assignment.status == 'completed', Assignment.submitted_at <= Assignment.deadline)
+            ).label('on_time'),
+            func.count(Assignment.assignment_id).filter(
+                and_(Assignment.status == 'completed', Assignment.submitted_at > Assignment.deadline)
+            ).label('late'),
+            func.avg(Assignment.grade).label('average_grade')
         ).where(
             and_(
-                Assignment.student_id == student_id,
+                Assignment.student_id.in_(student_ids),
                 Assignment.created_at >= week_start,
                 Assignment.created_at <= week_end
             )
+        ).group_by(Assignment.student_id)
+        
+        assignments_result = await self.db.execute(assignments_query)
+        return {row.student_id: row for row in assignments_result}
+    
+    async def _query_activity_rows(
+        self,
+        student_ids: List[int],
+        week_start: date,
+        week_end: date
+    ) -> Dict[int, Any]:
+        """Агрегаты сообщений группы по сырым данным"""
+        # Данные по активности (сообщения)
+        activity_query = select(
+            Message.sender_id,
+            func.count(Message.message_id).label('messages_sent'),
+            func.count(Message.message_id).filter(Message.text_content.isnot(None)).label('questions_asked'),
+            func.max(Message.created_at).label('last_activity')
+        ).where(
+            and_(
+                Message.sender_id.in_(student_ids),
+                Message.sender_type == 'user',
+                Message.created_at >= week_start,
+                Message.created_at <= week_end
+            )
+        ).group_by(Message.sender_id)
+        
+        activity_result = await self.db.execute(activity_query)
+        return {row.sender_id: row for row in activity_result}
+    
+    async def _load_weekly_facts(
+        self,
+        student_ids: List[int],
+        week_start: date,
+        week_end: date
+    ) -> Dict[int, StudentFacts]:
+        """Загрузить материализованные факты закрытой недели"""
+        iso_year, iso_week, _ = week_start.isocalendar()
+        
+        # Колонки подписаны так же, как агрегаты в _compute_cohort_facts
+        query = select(
+            StudentWeeklyFacts.student_id,
+            StudentWeeklyFacts.assignments_total.label('total'),
+            StudentWeeklyFacts.assignments_completed.label('completed'),
+            StudentWeeklyFacts.assignments_on_time.label('on_time'),
+            StudentWeeklyFacts.assignments_late.label('late'),
+            StudentWeeklyFacts.average_grade,
+            StudentWeeklyFacts.messages_sent,
+            StudentWeeklyFacts.questions_asked,
+            StudentWeeklyFacts.last_activity,
+            StudentWeeklyFacts.scheduled_classes,
+            StudentWeeklyFacts.attended
+        ).where(
+            and_(
+                StudentWeeklyFacts.student_id.in_(student_ids),
+                StudentWeeklyFacts.iso_year == iso_year,
+                StudentWeeklyFacts.iso_week == iso_week
+            )
         )
         
-        engagement_result = await self.db.execute(engagement_query)
-        engagement_data = engagement_result.first()
+        result = await self.db.execute(query)
+        return {
+            row.student_id: self._build_student_facts(
+                row.student_id, week_start, week_end, row, row, row
+            )
+            for row in result
+        }
+    
+    async def refresh_weekly_facts(
+        self,
+        week_start: date,
+        student_ids: Optional[List[int]] = None
+    ) -> int:
+        """
+        Пересчитать и сохранить факты ISO недели, начинающейся с week_start.
+        
+        По умолчанию обновляются все активные студенты. Возвращает
+        количество записанных строк.
+        """
+        week_start = week_start - timedelta(days=week_start.weekday())
+        week_end = week_start + timedelta(days=6)
+        iso_year, iso_week, _ = week_start.isocalendar()
+        
+        if student_ids is None:
+            result = await self.db.execute(
+                select(Student.student_id).where(Student.is_active.is_(True))
+            )
+            student_ids = list(result.scalars().all())
+        
+        refreshed = 0
+        for offset in range(0, len(student_ids), REFRESH_CHUNK_SIZE):
+            chunk = student_ids[offset:offset + REFRESH_CHUNK_SIZE]
+            cohort_facts = await self._compute_cohort_facts(chunk, week_start, week_end)
+            
+            rows = [
+                {
+                    'student_id': facts.student_id,
+                    'iso_year': iso_year,
+                    'iso_week': iso_week,
+                    'week_start': week_start,
+                    'week_end': week_end,
+                    'assignments_total': facts.assignments['total'],
+                    'assignments_completed': facts.assignments['completed'],
+                    'assignments_on_time': facts.assignments['on_time'],
+                    'assignments_late': facts.assignments['late'],
+                    'average_grade': facts.assignments['average_grade'],
+                    'messages_sent': facts.activity['messages_sent'],
+                    'questions_asked': facts.activity['questions_asked'],
+                    'last_activity': facts.activity['last_activity'],
+                    'scheduled_classes': facts.attendance['scheduled_classes'],
+                    'attended': facts.attendance['attended'],
+                }
+                for facts in cohort_facts.values()
+            ]
+            if not rows:
+                continue
+            
+            insert_query = pg_insert(StudentWeeklyFacts).values(rows)
+            insert_query = insert_query.on_conflict_do_update(
+                index_elements=['student_id', 'iso_year', 'iso_week'],
+                set_={
+                    **{
+                        column: insert_query.excluded[column]
+                        for column in rows[0]
+                        if column not in ('student_id', 'iso_year', 'iso_week')
+                    },
+                    'refreshed_at': func.now()
+                }
+            )
+            await self.db.execute(insert_query)
+            refreshed += len(rows)
+        
+        await self.db.commit()
+        return refreshed
+    
+    def _build_student_facts(
+        self,
+        student_id: int,
+        week_start: date,
+        week_end: date,
+        assignments_data: Optional[Any],
+        activity_data: Optional[Any],
+        attendance_data: Optional[Any]
+    ) -> StudentFacts:
+        """Собрать StudentFacts из строк агрегатов (None - нет данных за период)"""
+        total = assignments_data.total if assignments_data else 0
+        average_grade = assignments_data.average_grade if assignments_data else None
+        scheduled_classes = attendance_data.scheduled_classes if attendance_data else 0
+        attended = attendance_data.attended if attendance_data else 0
         
         return StudentFacts(
             student_id=student_id,
             week_start=week_start,
             week_end=week_end,
             assignments={
-                'total': assignments_data.total or 0,
-                'completed': assignments_data.completed or 0,
-                'on_time': assignments_data.on_time or 0,
-                'late': assignments_data.late or 0,
-                'average_grade': float(assignments_data.average_grade) if assignments_data.average_grade else 0.0
+                'total': total or 0,
+                'completed': (assignments_data.completed if assignments_data else 0) or 0,
+                'on_time': (assignments_data.on_time if assignments_data else 0) or 0,
+                'late': (assignments_data.late if assignments_data else 0) or 0,
+                'average_grade': float(average_grade) if average_grade else 0.0
             },
             activity={
-                'messages_sent': activity_data.messages_sent or 0,
-                'questions_asked': activity_data.questions_asked or 0,
-                'last_activity': activity_data.last_activity
+                'messages_sent': (activity_data.messages_sent if activity_data else 0) or 0,
+                'questions_asked': (activity_data.questions_asked if activity_data else 0) or 0,
+                'last_activity': activity_data.last_activity if activity_data else None
             },
             attendance={
-                'scheduled_classes': attendance_data.scheduled_classes or 0,
-                'attended': attendance_data.attended or 0,
-                'attendance_rate': (attendance_data.attended / attendance_data.scheduled_classes) if attendance_data.scheduled_classes else 0.0
+                'scheduled_classes': scheduled_classes or 0,
+                'attended': attended or 0,
+                'attendance_rate': (attended / scheduled_classes) if scheduled_classes else 0.0
             },
             engagement={
-                'study_hours': (engagement_data.study_hours or 0) * 2,  # Примерная оценка
-                'materials_viewed': engagement_data.materials_viewed or 0,
-                'participation_score': float(engagement_data.participation_score) if engagement_data.participation_score else 0.0
+                # Вовлеченность (упрощенная версия) считается по тем же заданиям
+                'study_hours': (total or 0) * 2,  # Примерная оценка
+                'materials_viewed': total or 0,
+                'participation_score': float(average_grade) if average_grade else 0.0
             }
         )
     
+    async def get_existing_student_ids(self, student_ids: List[int]) -> List[int]:
+        """Оставить из списка только существующих студентов (один IN запрос)"""
+        student_ids = list(dict.fromkeys(student_ids))
+        if not student_ids:
+            return []
+        
+        query = select(Student.student_id).where(Student.student_id.in_(student_ids))
+        result = await self.db.execute(query)
+        existing = set(result.scalars().all())
+        return [student_id for student_id in student_ids if student_id in existing]
+    
     async def calculate_student_rating(
         self, 
         student_id: int, 
@@ -200,126 +586,153 @@ class StudentService:
         week_end: date,
         config: Optional[RatingConfig] = None
     ) -> StudentRating:
-        """Рассчитать рейтинг студента"""
-        if config is None:
-            config = RatingConfig()
-        
-        facts = await self.get_student_facts(student_id, week_start, week_end)
-        
-        # Расчет компонентов рейтинга
-        assignment_score = self._calculate_assignment_score(facts.assignments)
-        activity_score = self._calculate_activity_score(facts.activity)
-        attendance_score = self._calculate_attendance_score(facts.attendance)
-        engagement_score = self._calculate_engagement_score(facts.engagement)
-        
-        # Итоговый рейтинг
-        weekly_score = (
-            assignment_score * config.assignment_weight +
-            activity_score * config.activity_weight +
-            attendance_score * config.attendance_weight +
-            engagement_score * config.engagement_weight
-        )
-        
-        # Определение категории
-        category = self._get_rating_category(weekly_score)
-        
-        # Генерация рекомендаций
-        recommendations = self._generate_recommendations(
-            weekly_score, assignment_score, activity_score, 
-            attendance_score, engagement_score, facts
-        )
-        
-        # Генерация персонального сообщения
-        personal_message = self._generate_personal_message(
-            student_id, weekly_score, category, recommendations, facts
-        )
-        
-        return StudentRating(
-            student_id=student_id,
-            weekly_score=round(weekly_score, 2),
-            assignment_score=round(assignment_score, 2),
-            activity_score=round(activity_score, 2),
-            attendance_score=round(attendance_score, 2),
-            engagement_score=round(engagement_score, 2),
-            category=category,
-            recommendations=recommendations,
-            message=personal_message
-        )
+        """Рассчитать рейтинг студента (с кэшем по неделе и весам)"""
+        cache_key = rating_cache.make_key(student_id, week_start, week_end, config)
+        rating = rating_cache.get(cache_key)
+        if rating is None:
+            facts = await self.get_student_facts(student_id, week_start, week_end)
+            rating = self.rate_facts(facts, config)
+            rating_cache.put(cache_key, rating)
+        return rating
     
-    def _calculate_assignment_score(self, assignments: Dict[str, Any]) -> float:
-        """Рассчитать рейтинг по заданиям"""
-        total = assignments['total']
-        completed = assignments['completed']
-        average_grade = assignments['average_grade']
-        
-        if total == 0:
-            return 0.0
-        
-        # Базовый рейтинг по количеству выполненных заданий
-        completion_rate = completed / total
-        base_score = completion_rate * 80  # 80% за количество
-        
-        # Бонус за качество (средняя оценка)
-        quality_bonus = (average_grade / 100) * 20  # 20% за качество
-        
-        # Штрафы за опоздания
-        late_penalty = assignments['late'] * 5
+    async def calculate_cohort_ratings(
+        self,
+        student_ids: List[int],
+        week_start: date,
+        week_end: date,
+        config: Optional[RatingConfig] = None,
+        timings_ms: Optional[Dict[str, float]] = None
+    ) -> Dict[int, StudentRating]:
+        """
+        Рассчитать рейтинги группы студентов по когортным фактам.
+        
+        Рейтинги из кэша не пересчитываются, факты загружаются только для
+        остальных студентов. В timings_ms (если передан) пишется время этапов.
+        """
+        if timings_ms is None:
+            timings_ms = {}
+        
+        started = time.perf_counter()
+        ratings = {}
+        missing_ids = []
+        for student_id in dict.fromkeys(student_ids):
+            rating = rating_cache.get(
+                rating_cache.make_key(student_id, week_start, week_end, config)
+            )
+            if rating is None:
+                missing_ids.append(student_id)
+            else:
+                ratings[student_id] = rating
+        timings_ms["cache"] = _elapsed_ms(started)
+        
+        started = time.perf_counter()
+        cohort_facts = await self.get_cohort_facts(missing_ids, week_start, week_end) if missing_ids else {}
+        timings_ms["facts"] = _elapsed_ms(started)
+        
+        started = time.perf_counter()
+        computed = self.rate_cohort(cohort_facts, config)
+        for student_id, rating in computed.items():
+            rating_cache.put(
+                rating_cache.make_key(student_id, week_start, week_end, config), rating
+            )
+        ratings.update(computed)
+        timings_ms["scoring"] = _elapsed_ms(started)
         
-        score = base_score + quality_bonus - late_penalty
-        return max(0, min(100, score))
+        return ratings
     
-    def _calculate_activity_score(self, activity: Dict[str, Any]) -> float:
-        """Рассчитать рейтинг по активности"""
-        messages_sent = activity['messages_sent']
-        questions_asked = activity['questions_asked']
+    def rate_cohort(
+        self,
+        cohort_facts: Dict[int, StudentFacts],
+        config: Optional[RatingConfig] = None
+    ) -> Dict[int, StudentRating]:
+        """
+        Рассчитать рейтинги по уже загруженным фактам группы.
         
-        # Базовый рейтинг по количеству сообщений
-        expected_messages = 5  # Ожидаемое количество сообщений в неделю
-        base_score = min((messages_sent / expected_messages) * 100, 100)
+        Числовые компоненты считаются векторно (rating_kernel) сразу для
+        всей группы, по студентам остаются только тексты рекомендаций.
+        """
+        if config is None:
+            config = RatingConfig()
         
-        # Бонус за качественные вопросы
-        quality_bonus = questions_asked * 3
+        if not cohort_facts:
+            return {}
+        
+        facts_list = list(cohort_facts.values())
+        scores = rating_kernel.score_columns(rating_kernel.facts_to_columns(facts_list), config)
+        
+        ratings = {}
+        for index, facts in enumerate(facts_list):
+            weekly_score = float(scores['weekly_score'][index])
+            assignment_score = float(scores['assignment_score'][index])
+            activity_score = float(scores['activity_score'][index])
+            attendance_score = float(scores['attendance_score'][index])
+            engagement_score = float(scores['engagement_score'][index])
+            category = str(scores['category'][index])
+            
+            # Генерация рекомендаций
+            recommendations = self._generate_recommendations(
+                weekly_score, assignment_score, activity_score, 
+                attendance_score, engagement_score, facts
+            )
+            
+            # Генерация персонального сообщения
+            personal_message = self._generate_personal_message(
+                facts.student_id, weekly_score, category, recommendations, facts
+            )
+            
+            ratings[facts.student_id] = StudentRating(
+                student_id=facts.student_id,
+                weekly_score=round(weekly_score, 2),
+                assignment_score=round(assignment_score, 2),
+                activity_score=round(activity_score, 2),
+                attendance_score=round(attendance_score, 2),
+                engagement_score=round(engagement_score, 2),
+                category=category,
+                recommendations=recommendations,
+                message=personal_message
+            )
         
-        score = base_score + quality_bonus
-        return max(0, min(100, score))
+        return ratings
     
-    def _calculate_attendance_score(self, attendance: Dict[str, Any]) -> float:
-        """Рассчитать рейтинг по посещаемости"""
-        scheduled = attendance['scheduled_classes']
-        attended = attendance['attended']
-        
-        if scheduled == 0:
-            return 100.0  # Если нет занятий, считаем идеальную посещаемость
-        
-        attendance_rate = attended / scheduled
-        return attendance_rate * 100
+    def rate_facts(
+        self,
+        facts: StudentFacts,
+        config: Optional[RatingConfig] = None
+    ) -> StudentRating:
+        """Рассчитать рейтинг по фактам студента"""
+        return self.rate_cohort({facts.student_id: facts}, config)[facts.student_id]
     
-    def _calculate_engagement_score(self, engagement: Dict[str, Any]) -> float:
-        """Рассчитать рейтинг по вовлеченности"""
-        study_hours = engagement['study_hours']
-        materials_viewed = engagement['materials_viewed']
-        participation_score = engagement['participation_score']
+    async def select_ranked_ratings(
+        self,
+        student_ids: List[int],
+        week_start: date,
+        week_end: date,
+        limit: Optional[int] = None,
+        lowest: bool = False,
+        config: Optional[RatingConfig] = None
+    ) -> List[StudentRating]:
+        """
+        Топ-N (lowest=True - последние N) студентов по weekly_score.
+        
+        Баллы считаются векторно для всей группы, N лучших выбираются
+        ограниченной кучей, а полные рейтинги (с рекомендациями и текстом)
+        строятся только для них. При равенстве баллов порядок определяют
+        assignment_score, затем student_id (по возрастанию).
+        """
+        if config is None:
+            config = RatingConfig()
         
-        # Ожидаемые показатели
-        expected_hours = 10  # Ожидаемое количество часов в неделю
-        expected_materials = 5  # Ожидаемое количество материалов
+        cohort_facts = await self.get_cohort_facts(student_ids, week_start, week_end)
+        if not cohort_facts:
+            return []
         
-        hours_score = min((study_hours / expected_hours) * 50, 50)
-        materials_score = min((materials_viewed / expected_materials) * 30, 30)
-        participation_score = min(participation_score * 0.2, 20)
+        facts_list = list(cohort_facts.values())
+        scores = rating_kernel.score_columns(rating_kernel.facts_to_columns(facts_list), config)
+        selected = rank_indices(facts_list, scores, limit, lowest)
         
-        return hours_score + materials_score + participation_score
-    
-    def _get_rating_category(self, score: float) -> str:
-        """Определить категорию рейтинга"""
-        if score >= 90:
-            return "high"
-        elif score >= 70:
-            return "medium"
-        elif score >= 50:
-            return "low"
-        else:
-            return "critical"
+        selected_facts = {facts_list[index].student_id: facts_list[index] for index in selected}
+        ratings = self.rate_cohort(selected_facts, config)
+        return [ratings[student_id] for student_id in selected_facts]
     
     def _generate_recommendations(
         self, 
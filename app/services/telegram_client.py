@@ -0,0 +1,88 @@
+"""
+Telegram Bot API client used by the notification worker
+
+Клиент подменяемый: воркер принимает любой объект с методом
+send_message(chat_id, text), а TELEGRAM_API_BASE_URL можно направить
+на локальный stub сервер для тестов и бенчмарков.
+"""
+from typing import Optional, Protocol
+
+import httpx
+
+from app.core.config import settings
+
+
+class TelegramDeliveryError(Exception):
+    """Ошибка доставки сообщения"""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        retryable: bool = False
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+
+class BotClient(Protocol):
+    """Интерфейс клиента отправки сообщений"""
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+
+class TelegramBotClient:
+    """Клиент Telegram Bot API (sendMessage)"""
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        base_url: Optional[str] = None,
+        timeout: float = 10.0
+    ):
+        self.token = token if token is not None else settings.TELEGRAM_BOT_TOKEN
+        self._client = httpx.AsyncClient(
+            base_url=base_url or settings.TELEGRAM_API_BASE_URL,
+            timeout=timeout
+        )
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        """Отправить сообщение; при ошибке - TelegramDeliveryError"""
+        try:
+            response = await self._client.post(
+                f"/bot{self.token}/sendMessage",
+                json={"chat_id": chat_id, "text": text}
+            )
+        except httpx.TransportError as error:
+            raise TelegramDeliveryError(f"Сетевая ошибка: {error}", retryable=True) from error
+
+        if response.status_code == 200:
+            return
+
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        description = payload.get("description") or response.text[:200]
+
+        if response.status_code == 429:
+            retry_after = (payload.get("parameters") or {}).get("retry_after")
+            raise TelegramDeliveryError(
+                description, status_code=429, retry_after=retry_after, retryable=True
+            )
+
+        raise TelegramDeliveryError(
+            description,
+            status_code=response.status_code,
+            retryable=response.status_code >= 500
+        )
+
+    async def close(self) -> None:
+        await self._client.aclose()
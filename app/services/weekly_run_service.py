@@ -0,0 +1,140 @@
+"""
+Weekly run service: streams due for the weekly rating run
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.education import Stream, StreamNotificationConfig, Student, students_streams
+
+
+# Расписание потока без конфигурации: еженедельно, понедельник 10:00
+DEFAULT_DAY_OF_WEEK = 0
+DEFAULT_TIME = time(10, 0)
+
+
+@dataclass(frozen=True)
+class StreamSchedule:
+    """Расписание рассылки потока (из StreamNotificationConfig)"""
+    frequency: str
+    day_of_week: Optional[int]  # 0-6 (понедельник-воскресенье), как date.weekday()
+    send_time: time
+
+    @classmethod
+    def from_config(cls, config: Optional[StreamNotificationConfig]) -> Optional["StreamSchedule"]:
+        """Расписание потока; None - рассылка выключена. Без конфигурации - по умолчанию."""
+        if config is None:
+            return cls("weekly", DEFAULT_DAY_OF_WEEK, DEFAULT_TIME)
+        if not config.notification_enabled:
+            return None
+        return cls(
+            config.frequency,
+            config.day_of_week,
+            config.time if config.time is not None else DEFAULT_TIME
+        )
+
+    def fires_on(self, day: date) -> bool:
+        """Для frequency="daily" день недели не проверяется"""
+        return self.frequency == "daily" or self.day_of_week is None or day.weekday() == self.day_of_week
+
+    def next_fire_time(self, after: datetime) -> datetime:
+        """Первое время рассылки строго после after (в часовом поясе after)"""
+        for days_ahead in range(8):
+            send_date = after.date() + timedelta(days=days_ahead)
+            if not self.fires_on(send_date):
+                continue
+            send_at = datetime.combine(send_date, self.send_time, tzinfo=after.tzinfo)
+            if send_at > after:
+                return send_at
+        raise ValueError(f"Некорректное расписание: {self}")
+
+
+def is_stream_due(
+    config: Optional[StreamNotificationConfig],
+    now: datetime,
+    window_minutes: int
+) -> bool:
+    """Наступило ли время рассылки потока в окне (now - window_minutes, now]"""
+    schedule = StreamSchedule.from_config(config)
+    if schedule is None:
+        return False
+    return schedule.next_fire_time(now - timedelta(minutes=window_minutes)) <= now
+
+
+class WeeklyRunService:
+    """Сервис для общего еженедельного прогона по потокам"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_due_streams(
+        self,
+        now: datetime,
+        window_minutes: int,
+        stream_ids: Optional[List[int]] = None
+    ) -> List[Tuple[Stream, Optional[StreamNotificationConfig]]]:
+        """
+        Активные потоки, у которых наступило время рассылки (один запрос).
+
+        Если передан stream_ids, расписание не проверяется - берутся эти потоки.
+        """
+        query = select(Stream, StreamNotificationConfig).outerjoin(
+            StreamNotificationConfig,
+            StreamNotificationConfig.stream_id == Stream.stream_id
+        ).where(Stream.end_date >= date.today()).order_by(Stream.stream_id)
+
+        if stream_ids is not None:
+            query = query.where(Stream.stream_id.in_(stream_ids))
+
+        result = await self.db.execute(query)
+        streams = [(row[0], row[1]) for row in result]
+
+        if stream_ids is not None:
+            return streams
+        return [
+            (stream, config) for stream, config in streams
+            if is_stream_due(config, now, window_minutes)
+        ]
+
+    async def get_scheduled_configs(self) -> List[StreamNotificationConfig]:
+        """
+        Конфигурации активных потоков с включенной рассылкой.
+
+        Планировщик отправляет сообщения, поэтому поток без явной конфигурации
+        не рассылается (в отличие от расписания по умолчанию в get_due_streams,
+        которое только считает рейтинги).
+        """
+        query = select(StreamNotificationConfig).join(
+            Stream, Stream.stream_id == StreamNotificationConfig.stream_id
+        ).where(
+            and_(
+                Stream.end_date >= date.today(),
+                StreamNotificationConfig.notification_enabled == True
+            )
+        )
+        result = await self.db.execute(query)
+        return list(result.scalars().all())
+
+    async def get_stream_members(self, stream_ids: List[int]) -> Dict[int, List[Tuple[int, bool]]]:
+        """Студенты потоков (student_id, is_active) одним запросом"""
+        if not stream_ids:
+            return {}
+
+        query = select(
+            students_streams.c.stream_id,
+            Student.student_id,
+            Student.is_active
+        ).join(
+            Student, Student.student_id == students_streams.c.student_id
+        ).where(
+            students_streams.c.stream_id.in_(stream_ids)
+        ).order_by(students_streams.c.stream_id, Student.student_id)
+
+        result = await self.db.execute(query)
+        members: Dict[int, List[Tuple[int, bool]]] = {stream_id: [] for stream_id in stream_ids}
+        for row in result:
+            members[row.stream_id].append((row.student_id, row.is_active))
+        return members
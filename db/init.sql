@@ -3,6 +3,7 @@
 
 -- Создание расширений
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE EXTENSION IF NOT EXISTS pg_trgm;  -- триграммные индексы поиска
 
 -- Создание схемы (если нужно)
 -- CREATE SCHEMA IF NOT EXISTS aitutor;
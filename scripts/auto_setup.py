@@ -22,6 +22,10 @@ from app.models.education import (
     CourseMaterial, Schedule, Assignment, Message, BotResponse,
     Meeting, Prompt, FAQResponse
 )
+from app.services.rollup_service import register_rollup_listeners
+
+# Счетчики сообщений и заданий ведутся так же, как при записи через API
+register_rollup_listeners()
 
 def run_command(command, shell=True, timeout=300):
     """Выполнить команду и вернуть статус, stdout, stderr"""
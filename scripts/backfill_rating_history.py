@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Бэкфилл истории недельных рейтингов (student_rating_history)
+
+Без аргументов пересчитывает последнюю закрытую ISO неделю (для
+еженедельного запуска). Для истории за период:
+
+    python scripts/backfill_rating_history.py --from 2025-09-01 --to 2025-12-31
+"""
+import argparse
+import asyncio
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.database import async_session
+from app.models import education
+from app.services.rating_history_service import RatingHistoryService
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Заполнить student_rating_history")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="Первая дата периода (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="Последняя дата периода (YYYY-MM-DD)")
+    return parser.parse_args()
+
+
+async def backfill_rating_history(date_from: date, date_to: date):
+    async with async_session() as session:
+        written = await RatingHistoryService(session).backfill(date_from, date_to)
+        print(f"✅ Период {date_from.isoformat()} - {date_to.isoformat()}: записано {written} недельных рейтингов")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    last_week_start = date.today() - timedelta(days=date.today().weekday() + 7)
+    date_from = args.date_from or last_week_start
+    date_to = args.date_to or date_from + timedelta(days=6)
+    asyncio.run(backfill_rating_history(date_from, date_to))
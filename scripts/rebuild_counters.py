@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Пересборка счетчиков student_daily_counters и chat_counters по сырым данным
+
+Запускать после загрузки данных в обход ORM (SQL, дампы) или если
+счетчики разошлись с таблицами messages/assignments.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.database import async_session
+from app.models import education
+from app.services.rollup_service import RollupService, register_rollup_listeners
+
+
+async def rebuild_counters():
+    # Обработчики счетчиков подключаются, как в API (сама пересборка пишет в обход ORM)
+    register_rollup_listeners()
+    async with async_session() as session:
+        counts = await RollupService(session).rebuild_counters()
+    for table, rows in counts.items():
+        print(f"✅ {table}: {rows} строк")
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_counters())
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Обновление материализованных фактов недели (student_weekly_facts)
+
+Без аргументов пересчитывает последнюю закрытую ISO неделю.
+Для бэкфилла можно передать диапазон:
+
+    python scripts/refresh_weekly_facts.py --from 2025-09-01 --to 2025-12-31
+"""
+import argparse
+import asyncio
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.database import async_session
+from app.models import education
+from app.services.student_service import StudentService
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Обновить student_weekly_facts")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="Первая дата периода (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="Последняя дата периода (YYYY-MM-DD)")
+    return parser.parse_args()
+
+
+def closed_weeks(date_from: date, date_to: date):
+    """Понедельники закрытых ISO недель, пересекающихся с периодом"""
+    last_closed = date.today() - timedelta(days=date.today().weekday() + 7)
+    week_start = date_from - timedelta(days=date_from.weekday())
+    while week_start <= min(date_to, last_closed):
+        yield week_start
+        week_start += timedelta(days=7)
+
+
+async def refresh_weekly_facts(date_from: date, date_to: date):
+    async with async_session() as session:
+        service = StudentService(session)
+        for week_start in closed_weeks(date_from, date_to):
+            refreshed = await service.refresh_weekly_facts(week_start)
+            print(f"✅ Неделя {week_start.isoformat()}: обновлено {refreshed} студентов")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    last_week_start = date.today() - timedelta(days=date.today().weekday() + 7)
+    date_from = args.date_from or last_week_start
+    date_to = args.date_to or date_from + timedelta(days=6)
+    asyncio.run(refresh_weekly_facts(date_from, date_to))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Воркер доставки уведомлений из notification_outbox в Telegram
+
+Запускается отдельным процессом (можно несколько - строки разбираются
+через SKIP LOCKED). Для тестов Bot API можно подменить локальным stub
+сервером через TELEGRAM_API_BASE_URL.
+
+    python scripts/run_notification_worker.py
+    python scripts/run_notification_worker.py --once
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+from app.models import education
+from app.services.notification_worker import NotificationWorker
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Доставка уведомлений из outbox")
+    parser.add_argument("--once", action="store_true", help="Обработать одну пачку и выйти")
+    return parser.parse_args()
+
+
+async def run_worker(once: bool):
+    worker = NotificationWorker()
+    print(f"🚀 Воркер доставки: {settings.NOTIFICATION_RATE_PER_SECOND} сообщ./сек, Bot API {settings.TELEGRAM_API_BASE_URL}")
+    if once:
+        try:
+            processed = await worker.run_once()
+        finally:
+            await worker.client.close()
+        print(f"✅ Обработано {processed} уведомлений")
+        return
+    await worker.run_forever()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        asyncio.run(run_worker(args.once))
+    except KeyboardInterrupt:
+        print("👋 Воркер остановлен")
@@ -19,9 +19,13 @@ async def seed_data():
             CourseMaterial, Schedule, Assignment, Message, BotResponse,
             Meeting, Prompt, FAQResponse
         )
+        from app.services.rollup_service import register_rollup_listeners
         from sqlalchemy.ext.asyncio import AsyncSession
         import random
         
+        # Счетчики сообщений и заданий ведутся так же, как при записи через API
+        register_rollup_listeners()
+        
         print("🌱 Загружаем тестовые данные...")
         
         async with async_session() as session: